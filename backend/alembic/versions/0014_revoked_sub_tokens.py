@@ -0,0 +1,99 @@
+"""move revoked master subscription tokens into an indexed table
+
+Revision ID: 0014_revoked_sub_tokens
+Revises: 0013_bigint_raw_usage
+Create Date: 2026-10-16
+
+Revoked master tokens used to live in one JSON AppSetting row (capped at 5000
+entries) that was parsed on every /sub/{token} request. They now get one row
+each with a unique index on the token; the existing blob is copied over and
+removed. Downgrade writes the newest 5000 tokens back into the blob.
+"""
+
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0014_revoked_sub_tokens"
+down_revision = "0013_bigint_raw_usage"
+branch_labels = None
+depends_on = None
+
+_SETTING_KEY = "revoked_master_sub_tokens"
+_LEGACY_CAP = 5000
+
+
+def _has_table(table_name: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    return table_name in inspector.get_table_names()
+
+
+def _blob_tokens(value) -> list[str]:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    raw = value.get("tokens") if isinstance(value, dict) else None
+    if not isinstance(raw, list):
+        return []
+    out: list[str] = []
+    seen: set[str] = set()
+    for token in raw:
+        s = str(token or "").strip()
+        if s and s not in seen and len(s) <= 128:
+            out.append(s)
+            seen.add(s)
+    return out
+
+
+def upgrade():
+    if not _has_table("revoked_sub_tokens"):
+        op.create_table(
+            "revoked_sub_tokens",
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column("token", sa.String(length=128), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("revoked_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("now()")),
+        )
+        op.create_index("ix_revoked_sub_tokens_token", "revoked_sub_tokens", ["token"], unique=True)
+        op.create_index("ix_revoked_sub_tokens_user_id", "revoked_sub_tokens", ["user_id"])
+
+    if not _has_table("app_settings"):
+        return
+    bind = op.get_bind()
+    row = bind.execute(sa.text("SELECT value FROM app_settings WHERE key = :key"), {"key": _SETTING_KEY}).first()
+    if row is None:
+        return
+    tokens = _blob_tokens(row[0])
+    # Keep the blob order so ids follow the original revocation order.
+    for start in range(0, len(tokens), 1000):
+        bind.execute(
+            sa.text("INSERT INTO revoked_sub_tokens (token) VALUES (:token) ON CONFLICT (token) DO NOTHING"),
+            [{"token": token} for token in tokens[start : start + 1000]],
+        )
+    bind.execute(sa.text("DELETE FROM app_settings WHERE key = :key"), {"key": _SETTING_KEY})
+
+
+def downgrade():
+    if not _has_table("revoked_sub_tokens"):
+        return
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.text("SELECT token FROM revoked_sub_tokens ORDER BY id DESC LIMIT :cap"),
+        {"cap": _LEGACY_CAP},
+    ).fetchall()
+    tokens = [str(r[0]) for r in reversed(rows)]
+    if tokens:
+        bind.execute(
+            sa.text(
+                "INSERT INTO app_settings (key, value) VALUES (:key, CAST(:value AS json)) "
+                "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = now()"
+            ),
+            {"key": _SETTING_KEY, "value": json.dumps({"tokens": tokens})},
+        )
+    op.drop_index("ix_revoked_sub_tokens_user_id", table_name="revoked_sub_tokens")
+    op.drop_index("ix_revoked_sub_tokens_token", table_name="revoked_sub_tokens")
+    op.drop_table("revoked_sub_tokens")
@@ -0,0 +1,115 @@
+"""add dashboard daily activity rollups
+
+Revision ID: 0015_dashboard_daily_activity
+Revises: 0014_revoked_sub_tokens
+Create Date: 2026-10-16
+
+Per-reseller daily order/ledger counters read by the stats endpoints instead
+of scanning orders and ledger_transactions. The table is filled from existing
+rows here; afterwards the application keeps it current on every write.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0015_dashboard_daily_activity"
+down_revision = "0014_revoked_sub_tokens"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table_name: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    return table_name in inspector.get_table_names()
+
+
+def _has_index(table_name: str, index_name: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    return index_name in {i["name"] for i in inspector.get_indexes(table_name)}
+
+
+def upgrade():
+    if not _has_table("dashboard_daily_activity"):
+        op.create_table(
+            "dashboard_daily_activity",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("reseller_id", sa.Integer(), nullable=False),
+            sa.Column("orders_total", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("orders_completed", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("traffic_gb", sa.BigInteger(), nullable=False, server_default="0"),
+            sa.Column("ledger_entries", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("ledger_net", sa.BigInteger(), nullable=False, server_default="0"),
+            sa.Column("spent", sa.BigInteger(), nullable=False, server_default="0"),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.ForeignKeyConstraint(["reseller_id"], ["resellers.id"]),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("day", "reseller_id", name="uq_dashboard_daily_activity_day_reseller"),
+        )
+
+    if not _has_index("dashboard_daily_activity", "ix_dashboard_daily_activity_day"):
+        op.create_index("ix_dashboard_daily_activity_day", "dashboard_daily_activity", ["day"])
+    if not _has_index("dashboard_daily_activity", "ix_dashboard_daily_activity_reseller_id"):
+        op.create_index("ix_dashboard_daily_activity_reseller_id", "dashboard_daily_activity", ["reseller_id"])
+
+    op.execute("DELETE FROM dashboard_daily_activity")
+    op.execute(
+        """
+        INSERT INTO dashboard_daily_activity (
+          day,
+          reseller_id,
+          orders_total,
+          orders_completed,
+          traffic_gb,
+          ledger_entries,
+          ledger_net,
+          spent,
+          created_at,
+          updated_at
+        )
+        SELECT
+          day,
+          reseller_id,
+          SUM(orders_total)::integer,
+          SUM(orders_completed)::integer,
+          SUM(traffic_gb)::bigint,
+          SUM(ledger_entries)::integer,
+          SUM(ledger_net)::bigint,
+          SUM(spent)::bigint,
+          NOW(),
+          NOW()
+        FROM (
+          SELECT
+            (created_at AT TIME ZONE 'UTC')::date AS day,
+            reseller_id,
+            COUNT(*) AS orders_total,
+            COUNT(*) FILTER (WHERE status = 'completed') AS orders_completed,
+            COALESCE(SUM(GREATEST(purchased_gb, 0)) FILTER (WHERE status = 'completed'), 0) AS traffic_gb,
+            0 AS ledger_entries,
+            0 AS ledger_net,
+            0 AS spent
+          FROM orders
+          GROUP BY 1, 2
+          UNION ALL
+          SELECT
+            (occurred_at AT TIME ZONE 'UTC')::date AS day,
+            reseller_id,
+            0,
+            0,
+            0,
+            COUNT(*),
+            COALESCE(SUM(amount), 0),
+            COALESCE(SUM(-amount) FILTER (WHERE amount < 0), 0)
+          FROM ledger_transactions
+          GROUP BY 1, 2
+        ) AS src
+        GROUP BY day, reseller_id
+        """
+    )
+
+
+def downgrade():
+    if _has_table("dashboard_daily_activity"):
+        op.drop_table("dashboard_daily_activity")
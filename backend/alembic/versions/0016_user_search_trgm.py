@@ -0,0 +1,59 @@
+"""add trigram and prefix search indexes for user lookups
+
+Revision ID: 0016_user_search_trgm
+Revises: 0015_dashboard_daily_activity
+Create Date: 2026-10-16
+
+Substring search (ILIKE '%term%') on users.label and
+subaccounts.remote_identifier is served by pg_trgm GIN indexes; short terms use
+the lower(...) text_pattern_ops btree indexes as a prefix search. Indexes are
+built CONCURRENTLY so large user tables stay writable. If the database role may
+not create the pg_trgm extension the trigram indexes are skipped and the API
+falls back to prefix/unindexed substring search.
+"""
+
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0016_user_search_trgm"
+down_revision = "0015_dashboard_daily_activity"
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+_PREFIX_INDEXES = {
+    "ix_users_owner_label_prefix": "users (owner_reseller_id, lower(label) text_pattern_ops)",
+    "ix_subaccounts_remote_identifier_prefix": "subaccounts (lower(remote_identifier) text_pattern_ops)",
+}
+_TRGM_INDEXES = {
+    "ix_users_label_trgm": "users USING gin (label gin_trgm_ops)",
+    "ix_subaccounts_remote_identifier_trgm": "subaccounts USING gin (remote_identifier gin_trgm_ops)",
+}
+
+
+def _has_trgm() -> bool:
+    return bool(op.get_bind().execute(sa.text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        try:
+            op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as exc:
+            logger.warning("pg_trgm unavailable, skipping trigram indexes: %s", str(exc)[:220])
+
+        for name, target in _PREFIX_INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}")
+        if _has_trgm():
+            for name, target in _TRGM_INDEXES.items():
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in list(_TRGM_INDEXES) + list(_PREFIX_INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,44 @@
+"""add partial/composite indexes for the expiry and usage scans
+
+Revision ID: 0017_user_scan_indexes
+Revises: 0016_user_search_trgm
+Create Date: 2026-10-16
+
+  * ix_users_active_expire_id (expire_at, id) WHERE status = 'active'
+    expiry task: active users with expire_at <= now, keyset-paged by id.
+  * ix_users_live_id (id) WHERE status <> 'deleted'
+    usage sync: non-deleted users keyset-paged by id, without walking
+    deleted rows through the primary key.
+  * ix_users_owner_status_expire (owner_reseller_id, status, expire_at)
+    per-reseller status/expiry filters (user list filters, dashboard counts).
+
+The scan queries inline the status literal (app/services/user_scans.py) so
+the planner can prove the partial index predicates. Indexes are built
+CONCURRENTLY; `python -m app.cli check-indexes` verifies the plans.
+"""
+
+from alembic import op
+
+
+revision = "0017_user_scan_indexes"
+down_revision = "0016_user_search_trgm"
+branch_labels = None
+depends_on = None
+
+_INDEXES = {
+    "ix_users_active_expire_id": "users (expire_at, id) WHERE status = 'active'",
+    "ix_users_live_id": "users (id) WHERE status <> 'deleted'",
+    "ix_users_owner_status_expire": "users (owner_reseller_id, status, expire_at)",
+}
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, target in _INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in _INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
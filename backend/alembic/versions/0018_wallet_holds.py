@@ -0,0 +1,73 @@
+"""add wallet holds so panel calls run without the reseller row lock
+
+Revision ID: 0018_wallet_holds
+Revises: 0017_user_scan_indexes
+Create Date: 2026-10-16
+
+  * resellers.held_balance (BIGINT NOT NULL DEFAULT 0): sum of open holds;
+    the spendable balance is balance - held_balance.
+  * wallet_holds: one row per billed operation (unique order_id) with the
+    reserved amount and its state (held -> captured | released). Expired
+    holds are released lazily by the next reservation of the same reseller.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0018_wallet_holds"
+down_revision = "0017_user_scan_indexes"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table_name: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    return table_name in inspector.get_table_names()
+
+
+def _has_column(table_name: str, column_name: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    return column_name in {c["name"] for c in inspector.get_columns(table_name)}
+
+
+def upgrade():
+    if not _has_column("resellers", "held_balance"):
+        op.add_column(
+            "resellers",
+            sa.Column("held_balance", sa.BigInteger(), nullable=False, server_default="0"),
+        )
+
+    if not _has_table("wallet_holds"):
+        op.create_table(
+            "wallet_holds",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("reseller_id", sa.Integer(), sa.ForeignKey("resellers.id"), nullable=False),
+            sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id"), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("amount", sa.BigInteger(), nullable=False),
+            sa.Column(
+                "status",
+                sa.Enum("held", "captured", "released", name="walletholdstatus"),
+                nullable=False,
+                server_default="held",
+            ),
+            sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("settled_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        )
+        op.create_index("ix_wallet_holds_reseller_id", "wallet_holds", ["reseller_id"])
+        op.create_index("ix_wallet_holds_order_id", "wallet_holds", ["order_id"], unique=True)
+        op.create_index("ix_wallet_holds_user_id", "wallet_holds", ["user_id"])
+
+
+def downgrade():
+    if _has_table("wallet_holds"):
+        op.drop_index("ix_wallet_holds_user_id", table_name="wallet_holds")
+        op.drop_index("ix_wallet_holds_order_id", table_name="wallet_holds")
+        op.drop_index("ix_wallet_holds_reseller_id", table_name="wallet_holds")
+        op.drop_table("wallet_holds")
+        sa.Enum(name="walletholdstatus").drop(op.get_bind(), checkfirst=True)
+    if _has_column("resellers", "held_balance"):
+        op.drop_column("resellers", "held_balance")
@@ -0,0 +1,52 @@
+"""add sync run history
+
+Revision ID: 0019_sync_runs
+Revises: 0018_wallet_holds
+Create Date: 2026-10-16
+
+  * sync_runs: one row per sync_usage / expire_due_users run with its
+    counters, per-phase timings, per access group fetch timings and per
+    panel host request stats. Rows older than SYNC_RUN_HISTORY_DAYS are
+    pruned by the tasks themselves.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0019_sync_runs"
+down_revision = "0018_wallet_holds"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table_name: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not _has_table("sync_runs"):
+        op.create_table(
+            "sync_runs",
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column("task", sa.String(length=64), nullable=False),
+            sa.Column("status", sa.String(length=16), nullable=False),
+            sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("duration_ms", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("scanned_users", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("counters", sa.JSON(), nullable=False),
+            sa.Column("phases", sa.JSON(), nullable=False),
+            sa.Column("group_fetches", sa.JSON(), nullable=False),
+            sa.Column("node_calls", sa.JSON(), nullable=False),
+            sa.Column("error", sa.String(length=500), nullable=True),
+        )
+        op.create_index("ix_sync_runs_started_at", "sync_runs", ["started_at"])
+        op.create_index("ix_sync_runs_task_started_at", "sync_runs", ["task", "started_at"])
+
+
+def downgrade():
+    if _has_table("sync_runs"):
+        op.drop_index("ix_sync_runs_task_started_at", table_name="sync_runs")
+        op.drop_index("ix_sync_runs_started_at", table_name="sync_runs")
+        op.drop_table("sync_runs")
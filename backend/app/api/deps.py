@@ -9,7 +9,19 @@ from app.core.db import get_db
 from app.core.security import ALGORITHM
 from app.core.rbac import Role
 from app.models.reseller import Reseller, ResellerStatus
-from app.services.api_tokens import TOKEN_PREFIX, find_active_api_token, touch_api_token
+from app.services.api_tokens import (
+    TOKEN_PREFIX,
+    api_token_expired,
+    find_active_api_token,
+    hash_api_token,
+    touch_api_token,
+)
+from app.services.principal_cache import (
+    cached_api_token,
+    cached_reseller,
+    remember_api_token,
+    remember_reseller,
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
@@ -46,10 +58,13 @@ async def get_current_principal(
         if not sub or not token_role:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="توکن نامعتبر است.")
 
-        q = await db.execute(select(Reseller).where(Reseller.username == sub))
-        reseller = q.scalar_one_or_none()
-        if not reseller:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="کاربر یافت نشد.")
+        reseller = await cached_reseller(db, username=sub)
+        if reseller is None:
+            q = await db.execute(select(Reseller).where(Reseller.username == sub))
+            reseller = q.scalar_one_or_none()
+            if not reseller:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="کاربر یافت نشد.")
+            remember_reseller(reseller)
 
         _ensure_active_reseller(reseller)
 
@@ -67,18 +82,25 @@ async def get_current_principal(
         request.state.auth_type = "jwt"
         return reseller, db_role
 
-    api_token = await find_active_api_token(db, token)
-    if not api_token:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="توکن نامعتبر است.")
+    token_hash = hash_api_token(token)
+    api_token = cached_api_token(token_hash)
+    if api_token is None or api_token_expired(api_token.expires_at):
+        record = await find_active_api_token(db, token)
+        if not record:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="توکن نامعتبر است.")
+        api_token = remember_api_token(token_hash, record)
 
-    q = await db.execute(select(Reseller).where(Reseller.id == api_token.reseller_id))
-    reseller = q.scalar_one_or_none()
-    if not reseller:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="کاربر یافت نشد.")
+    reseller = await cached_reseller(db, reseller_id=api_token.reseller_id)
+    if reseller is None:
+        q = await db.execute(select(Reseller).where(Reseller.id == api_token.reseller_id))
+        reseller = q.scalar_one_or_none()
+        if not reseller:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="کاربر یافت نشد.")
+        remember_reseller(reseller)
 
     _ensure_active_reseller(reseller)
     db_role = _role_for(reseller)
-    await touch_api_token(db, api_token)
+    touch_api_token(api_token)
 
     request.state.auth_type = "api_token"
     return reseller, db_role
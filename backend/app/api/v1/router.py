@@ -17,6 +17,7 @@ from app.api.v1.routes import (
     admin_nodes,
     admin_allocations,
     admin_stats,
+    admin_sync_runs,
 )
 
 api_router = APIRouter()
@@ -38,3 +39,4 @@ api_router.include_router(admin_allocations.router, prefix="/admin/allocations",
 api_router.include_router(admin_stats.router, prefix="/admin/stats", tags=["admin-stats"])
 api_router.include_router(admin_settings.router, prefix="/admin/settings", tags=["admin-settings"])
 api_router.include_router(admin_reports.router, prefix="/admin/reports", tags=["admin-reports"])
+api_router.include_router(admin_sync_runs.router, prefix="/admin/sync-runs", tags=["admin-sync-runs"])
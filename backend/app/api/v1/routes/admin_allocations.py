@@ -27,6 +27,7 @@ from app.services.panel_access import get_adapter_for_allocation
 from app.services.urls import normalize_url
 from app.services.dashboard_metrics import refresh_daily_metrics_for_resellers
 from app.services.local_detach import detach_subaccounts_locally
+from app.services.subscription_cache import invalidate_all_subscription_caches
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -142,6 +143,7 @@ async def create_allocation(payload: CreateAllocationRequest, db: AsyncSession =
         # Likely uniqueness constraint
         raise HTTPException(status_code=409, detail="Allocation already exists")
     await db.refresh(a)
+    await invalidate_all_subscription_caches()
 
     return allocation_out(a)
 
@@ -169,6 +171,7 @@ async def update_allocation(allocation_id: int, payload: UpdateAllocationRequest
 
     await db.commit()
     await db.refresh(a)
+    await invalidate_all_subscription_caches()
 
     return allocation_out(a)
 
@@ -255,10 +258,11 @@ async def import_remote_users(
                 break
             if new_items_on_page == 0:
                 break
-            next_offset += page_size
+            # Panels may clamp `limit`; advance by what was returned.
+            next_offset += len(page_items)
             if total_remote is not None and next_offset >= total_remote:
                 break
-            if len(page_items) < page_size:
+            if total_remote is None and len(page_items) < page_size:
                 break
     except HTTPException:
         raise
@@ -558,6 +562,7 @@ async def import_remote_users(
         await db.rollback()
     else:
         await db.commit()
+        await invalidate_all_subscription_caches()
         try:
             await refresh_daily_metrics_for_resellers(db, [reseller_id_value], metric_day=now.date(), now=now)
             await db.commit()
@@ -611,6 +616,7 @@ async def delete_allocation(allocation_id: int, db: AsyncSession = Depends(get_d
     )
     await db.delete(a)
     await db.commit()
+    await invalidate_all_subscription_caches()
     try:
         await refresh_daily_metrics_for_resellers(db, [reseller_id])
         await db.commit()
@@ -10,6 +10,7 @@ from app.models.subaccount import SubAccount
 from app.schemas.admin import CreateNodeRequest, UpdateNodeRequest, NodeOut, NodeList
 from app.services.dashboard_metrics import refresh_daily_metrics_for_resellers
 from app.services.local_detach import detach_subaccounts_locally
+from app.services.subscription_cache import invalidate_all_subscription_caches
 
 router = APIRouter()
 
@@ -102,6 +103,7 @@ async def update_node(node_id: int, payload: UpdateNodeRequest, db: AsyncSession
 
     await db.commit()
     await db.refresh(n)
+    await invalidate_all_subscription_caches()
 
     return node_out(n)
 
@@ -126,6 +128,7 @@ async def soft_delete_node(node_id: int, db: AsyncSession = Depends(get_db), adm
     n.is_visible_in_sub = False
     n.is_deleted = True
     await db.commit()
+    await invalidate_all_subscription_caches()
     if detach_result.affected_reseller_ids:
         try:
             await refresh_daily_metrics_for_resellers(db, detach_result.affected_reseller_ids)
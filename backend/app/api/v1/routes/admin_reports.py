@@ -9,6 +9,7 @@ from app.core.db import get_db
 from app.models.ledger import LedgerTransaction
 from app.models.order import Order, OrderStatus
 from app.models.reseller import Reseller
+from app.services.pagination import COUNT_MODE_PATTERN, cached_summary, count_rows, default_count_mode, fetch_page
 
 router = APIRouter()
 
@@ -61,12 +62,14 @@ async def list_resellers(
     admin=Depends(require_admin),
     offset: int = Query(0, ge=0),
     limit: int = Query(200, ge=1, le=1000),
+    cursor: str | None = Query(default=None, max_length=200),
+    count: str | None = Query(default=None, pattern=COUNT_MODE_PATTERN),
 ):
-    total_q = await db.execute(select(func.count()).select_from(Reseller))
-    total = int(total_q.scalar_one())
-    q = await db.execute(select(Reseller).order_by(desc(Reseller.id)).limit(limit).offset(offset))
+    stmt = select(Reseller).order_by(desc(Reseller.id))
+    total = await count_rows(db, stmt, mode=default_count_mode(count, cursor), scope="admin:resellers")
+    rows, next_cursor = await fetch_page(db, stmt, id_column=Reseller.id, limit=limit, offset=offset, cursor=cursor)
     out = []
-    for r in q.scalars().all():
+    for r in rows:
         out.append(
             {
                 "id": r.id,
@@ -79,7 +82,7 @@ async def list_resellers(
                 "price_per_day": r.price_per_day,
             }
         )
-    return {"items": out, "total": total}
+    return {"items": out, "total": total, "next_cursor": next_cursor}
 
 
 @router.get("/ledger")
@@ -89,19 +92,22 @@ async def ledger(
     admin=Depends(require_admin),
     offset: int = Query(0, ge=0),
     limit: int = Query(200, ge=1, le=1000),
+    cursor: str | None = Query(default=None, max_length=200),
+    count: str | None = Query(default=None, pattern=COUNT_MODE_PATTERN),
 ):
-    stmt = select(LedgerTransaction)
-    total_stmt = select(func.count()).select_from(LedgerTransaction)
+    stmt = select(LedgerTransaction).order_by(desc(LedgerTransaction.id))
     if reseller_id is not None:
         stmt = stmt.where(LedgerTransaction.reseller_id == reseller_id)
-        total_stmt = total_stmt.where(LedgerTransaction.reseller_id == reseller_id)
 
-    total_q = await db.execute(total_stmt)
-    total = int(total_q.scalar_one())
-    q = await db.execute(stmt.order_by(desc(LedgerTransaction.id)).limit(limit).offset(offset))
+    mode = default_count_mode(count, cursor)
+    # The summary counts every matching row, so it doubles as the total. It is
+    # returned in every mode; only count=exact recomputes it per request.
+    summary = await cached_summary(mode, scope=f"admin:ledger:{reseller_id}", compute=lambda: _ledger_summary(db, reseller_id))
+    total = summary["count"] if mode != "none" else None
+    rows, next_cursor = await fetch_page(db, stmt, id_column=LedgerTransaction.id, limit=limit, offset=offset, cursor=cursor)
 
     items = []
-    for t in q.scalars().all():
+    for t in rows:
         items.append(
             {
                 "id": t.id,
@@ -113,7 +119,7 @@ async def ledger(
                 "occurred_at": t.occurred_at.isoformat() if t.occurred_at else None,
             }
         )
-    return {"items": items, "total": total, "summary": await _ledger_summary(db, reseller_id)}
+    return {"items": items, "total": total, "next_cursor": next_cursor, "summary": summary}
 
 
 @router.get("/orders")
@@ -123,19 +129,22 @@ async def orders(
     admin=Depends(require_admin),
     offset: int = Query(0, ge=0),
     limit: int = Query(200, ge=1, le=1000),
+    cursor: str | None = Query(default=None, max_length=200),
+    count: str | None = Query(default=None, pattern=COUNT_MODE_PATTERN),
 ):
-    stmt = select(Order)
-    total_stmt = select(func.count()).select_from(Order)
+    stmt = select(Order).order_by(desc(Order.id))
     if reseller_id is not None:
         stmt = stmt.where(Order.reseller_id == reseller_id)
-        total_stmt = total_stmt.where(Order.reseller_id == reseller_id)
 
-    total_q = await db.execute(total_stmt)
-    total = int(total_q.scalar_one())
-    q = await db.execute(stmt.order_by(desc(Order.id)).limit(limit).offset(offset))
+    mode = default_count_mode(count, cursor)
+    # The summary counts every matching row, so it doubles as the total. It is
+    # returned in every mode; only count=exact recomputes it per request.
+    summary = await cached_summary(mode, scope=f"admin:orders:{reseller_id}", compute=lambda: _orders_summary(db, reseller_id))
+    total = summary["total"] if mode != "none" else None
+    rows, next_cursor = await fetch_page(db, stmt, id_column=Order.id, limit=limit, offset=offset, cursor=cursor)
 
     items = []
-    for o in q.scalars().all():
+    for o in rows:
         items.append(
             {
                 "id": o.id,
@@ -149,4 +158,4 @@ async def orders(
                 "created_at": o.created_at.isoformat() if o.created_at else None,
             }
         )
-    return {"items": items, "total": total, "summary": await _orders_summary(db, reseller_id)}
+    return {"items": items, "total": total, "next_cursor": next_cursor, "summary": summary}
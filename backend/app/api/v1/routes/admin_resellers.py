@@ -36,6 +36,8 @@ from app.schemas.settings import ResellerUserPolicy
 from app.services.api_tokens import api_token_to_out, create_api_token
 from app.services.billing import lock_reseller_for_billing
 from app.services.idempotency import request_id_from
+from app.services.subscription_cache import invalidate_all_subscription_caches
+from app.services.wallet import available_balance
 from app.services.reseller_user_policy import (
     delete_user_policy_setting,
     get_user_policy_setting_optional,
@@ -506,6 +508,7 @@ async def delete_reseller(
     r.status = ResellerStatus.deleted
     await db.commit()
     await db.refresh(r)
+    await invalidate_all_subscription_caches()
     return _to_out(r)
 
 @router.post("/{reseller_id}/credit", response_model=CreditResponse)
@@ -558,7 +561,8 @@ async def credit_reseller(
     replay = await replay_if_present()
     if replay:
         return replay
-    if r.balance + amount < 0:
+    # Funds held for in-flight operations cannot be debited.
+    if available_balance(r) + amount < 0:
         raise HTTPException(status_code=400, detail="Balance cannot become negative")
 
     r.balance += amount
@@ -13,18 +13,16 @@ from app.api.deps import require_admin
 from app.models.reseller import Reseller, ResellerStatus
 from app.models.user import GuardinoUser
 from app.models.node import Node
-from app.models.order import Order, OrderStatus
-from app.models.ledger import LedgerTransaction
 from app.models.dashboard_metric import DashboardDailyMetric
 from app.schemas.stats import AdminStats
 from app.services.dashboard_metrics import (
     BYTES_PER_GB,
     accounted_user_condition,
-    build_daily_series,
     build_daily_snapshot_series,
     set_today_series_value,
     summarize_users_query,
 )
+from app.services.dashboard_rollups import activity_series, activity_totals
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -51,44 +49,23 @@ async def get_admin_stats(
 
     accounted_user = accounted_user_condition()
     zero_bigint = literal(0, type_=BigInteger())
-    used_stmt = select(func.coalesce(func.sum(cast(GuardinoUser.used_bytes, BigInteger)), zero_bigint)).where(accounted_user)
-    sold_stmt = select(func.coalesce(func.sum(cast(GuardinoUser.total_gb, BigInteger)), zero_bigint)).where(accounted_user)
+    usage_stmt = select(
+        func.coalesce(func.sum(cast(GuardinoUser.used_bytes, BigInteger)), zero_bigint).label("used_bytes_total"),
+        func.coalesce(func.sum(cast(GuardinoUser.total_gb, BigInteger)), zero_bigint).label("sold_gb_total"),
+    ).where(accounted_user)
     if reseller_id is not None:
-        used_stmt = used_stmt.where(GuardinoUser.owner_reseller_id == reseller_id)
-        sold_stmt = sold_stmt.where(GuardinoUser.owner_reseller_id == reseller_id)
+        usage_stmt = usage_stmt.where(GuardinoUser.owner_reseller_id == reseller_id)
 
     user_summary = await summarize_users_query(db, reseller_id=reseller_id, now=now)
-    used_bytes_total = int((await db.execute(used_stmt)).scalar_one() or 0)
-    sold_gb_total = int((await db.execute(sold_stmt)).scalar_one() or 0)
+    usage_row = (await db.execute(usage_stmt)).one()
+    used_bytes_total = int(usage_row.used_bytes_total or 0)
+    sold_gb_total = int(usage_row.sold_gb_total or 0)
 
     nq = await db.execute(select(func.count()).select_from(Node))
     nodes_total = int(nq.scalar_one() or 0)
 
-    orders_total_stmt = select(func.count()).select_from(Order)
-    ledger_total_stmt = select(func.count()).select_from(LedgerTransaction)
-    ledger_net_stmt = select(func.coalesce(func.sum(LedgerTransaction.amount), 0)).where(
-        LedgerTransaction.occurred_at >= since
-    )
-    order_series_stmt = select(Order.created_at, Order.purchased_gb).where(
-        Order.created_at >= series_since,
-        Order.status == OrderStatus.completed,
-    )
-    ledger_series_stmt = select(LedgerTransaction.occurred_at, LedgerTransaction.amount).where(
-        LedgerTransaction.occurred_at >= series_since,
-        LedgerTransaction.amount < 0,
-    )
-    if reseller_id is not None:
-        orders_total_stmt = orders_total_stmt.where(Order.reseller_id == reseller_id)
-        ledger_total_stmt = ledger_total_stmt.where(LedgerTransaction.reseller_id == reseller_id)
-        ledger_net_stmt = ledger_net_stmt.where(LedgerTransaction.reseller_id == reseller_id)
-        order_series_stmt = order_series_stmt.where(Order.reseller_id == reseller_id)
-        ledger_series_stmt = ledger_series_stmt.where(LedgerTransaction.reseller_id == reseller_id)
-
-    orders_total = int((await db.execute(orders_total_stmt)).scalar_one() or 0)
-    ledger_entries_total = int((await db.execute(ledger_total_stmt)).scalar_one() or 0)
-    ledger_net_30d = int((await db.execute(ledger_net_stmt)).scalar_one() or 0)
-    order_series_rows = (await db.execute(order_series_stmt)).all()
-    ledger_series_rows = (await db.execute(ledger_series_stmt)).all()
+    activity = await activity_totals(db, reseller_id=reseller_id, since_day=since.date())
+    activity_rows = await activity_series(db, reseller_id=reseller_id, since_day=series_since.date())
     metric_series_stmt = (
         select(
             DashboardDailyMetric.day,
@@ -144,13 +121,15 @@ async def get_admin_stats(
         users_on_hold=user_summary["on_hold"],
         users_deleted=user_summary["deleted"],
         nodes_total=nodes_total,
-        orders_total=orders_total,
-        ledger_entries_total=ledger_entries_total,
-        ledger_net_30d=ledger_net_30d,
+        orders_total=activity["orders_total"],
+        ledger_entries_total=activity["ledger_entries_total"],
+        ledger_net_30d=activity["ledger_net_recent"],
         price_per_gb_avg=price_per_gb_avg_int,
         used_bytes_total=used_bytes_total,
         sold_gb_total=sold_gb_total,
-        daily_sales=build_daily_series(ledger_series_rows, lambda row: row.occurred_at, lambda row: abs(row.amount), days),
-        daily_traffic_gb=build_daily_series(order_series_rows, lambda row: row.created_at, lambda row: row.purchased_gb or 0, days),
+        daily_sales=build_daily_snapshot_series(activity_rows, lambda row: row.day, lambda row: row.spent, days, now.date()),
+        daily_traffic_gb=build_daily_snapshot_series(
+            activity_rows, lambda row: row.day, lambda row: row.traffic_gb, days, now.date()
+        ),
         daily_used_gb=daily_used_gb,
     )
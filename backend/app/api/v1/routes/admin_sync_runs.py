@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import require_admin
+from app.core.db import get_db
+from app.models.node import Node
+from app.models.sync_run import SyncRun
+from app.services.remote_fanout import host_of
+from app.services.sync_history import RECORDED_TASKS, summarize_runs
+
+router = APIRouter()
+
+TASK_PATTERN = "^(" + "|".join(RECORDED_TASKS) + ")$"
+
+
+@router.get("")
+async def list_sync_runs(
+    db: AsyncSession = Depends(get_db),
+    admin=Depends(require_admin),
+    task: str | None = Query(default=None, pattern=TASK_PATTERN),
+    limit: int = Query(50, ge=1, le=500),
+):
+    stmt = select(SyncRun).order_by(desc(SyncRun.started_at)).limit(limit)
+    if task is not None:
+        stmt = stmt.where(SyncRun.task == task)
+    rows = (await db.execute(stmt)).scalars().all()
+    items = []
+    for r in rows:
+        items.append(
+            {
+                "id": r.id,
+                "task": r.task,
+                "status": r.status,
+                "started_at": r.started_at.isoformat() if r.started_at else None,
+                "duration_ms": r.duration_ms,
+                "scanned_users": r.scanned_users,
+                "counters": r.counters,
+                "phases": r.phases,
+                "group_fetches": r.group_fetches,
+                "node_calls": r.node_calls,
+                "error": r.error,
+            }
+        )
+    return {"items": items}
+
+
+@router.get("/summary")
+async def sync_runs_summary(
+    db: AsyncSession = Depends(get_db),
+    admin=Depends(require_admin),
+    task: str = Query("sync_usage", pattern=TASK_PATTERN),
+    hours: int = Query(24, ge=1, le=24 * 7),
+    bucket_minutes: int = Query(60, ge=5, le=24 * 60),
+    top: int = Query(10, ge=1, le=100),
+):
+    """Trend lines, slowest nodes/access groups and lock TTL headroom for one task."""
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(hours=hours)
+    rq = await db.execute(
+        select(SyncRun).where(SyncRun.task == task, SyncRun.started_at >= since).order_by(SyncRun.started_at)
+    )
+    rows = list(rq.scalars().all())
+    nq = await db.execute(select(Node.id, Node.name, Node.base_url))
+    nodes_by_host: dict[str, tuple[int, str]] = {}
+    for node_id, name, base_url in nq.all():
+        nodes_by_host.setdefault(host_of(base_url), (node_id, name))
+    summary = summarize_runs(
+        task,
+        rows,
+        since=since,
+        bucket_minutes=bucket_minutes,
+        top=top,
+        nodes_by_host=nodes_by_host,
+    )
+    summary["window_hours"] = hours
+    summary["last_started_at"] = summary["last_started_at"].isoformat() if summary["last_started_at"] else None
+    for point in summary["trend"]:
+        point["bucket_start"] = point["bucket_start"].isoformat()
+    return summary
@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import html
 import re
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
 
 import httpx
@@ -11,16 +13,26 @@ from fastapi.responses import HTMLResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.db import get_db
+from app.core.metrics import upstream_call
 from app.models.node import Node, PanelType
 from app.models.node_allocation import NodeAllocation
 from app.models.subaccount import SubAccount
 from app.models.user import GuardinoUser, NodeSelectionMode, UserStatus
-from app.services.http_client import build_async_client
+from app.services.http_client import shared_request
 from app.services.panel_access import (
     get_adapter_for_allocation,
     get_adapter_for_subaccount,
     get_enabled_allocation_map,
+    load_adapter_resolver,
+)
+from app.services.remote_fanout import RemoteJob, run_bounded
+from app.services.subscription_cache import (
+    CachedSubscription,
+    get_cached_subscription,
+    get_stale_bodies,
+    store_subscription,
 )
 from app.services.subscription_tokens import is_master_sub_token_revoked
 from app.services.subscription_merge import merge_subscriptions
@@ -1458,21 +1470,81 @@ async def _get_user_by_token(db: AsyncSession, token: str) -> GuardinoUser:
     return user
 
 
+_NO_STORE_HEADERS = {
+    "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+
+@dataclass
+class _NodeFetch:
+    url: str | None
+    body: str | None = None
+    # True when `url` came from the panel and should replace the cached link.
+    refreshed: bool = False
+
+
+async def _fetch_node_subscription(direct: str | None, adapter, remote_identifier: str, base_url: str) -> _NodeFetch:
+    refreshed = False
+    if not direct:
+        direct = normalize_url(await adapter.get_direct_subscription_url(remote_identifier), base_url)
+        if not direct:
+            return _NodeFetch(url=None)
+        refreshed = True
+
+    # Direct links are plain GETs outside the adapter; label them with its panel.
+    panel = getattr(adapter, "metrics_panel", "unknown")
+    try:
+        with upstream_call(panel, "fetch_subscription"):
+            resp = await shared_request("GET", direct)
+        if resp.status_code < 400:
+            return _NodeFetch(url=direct, body=resp.text, refreshed=refreshed)
+    except httpx.RequestError:
+        pass
+
+    refreshed_direct = normalize_url(await adapter.get_direct_subscription_url(remote_identifier), base_url)
+    if refreshed_direct and refreshed_direct != direct:
+        with upstream_call(panel, "fetch_subscription"):
+            resp2 = await shared_request("GET", refreshed_direct)
+        body = resp2.text if resp2.status_code < 400 else None
+        return _NodeFetch(url=refreshed_direct, body=body, refreshed=True)
+    return _NodeFetch(url=direct, refreshed=refreshed)
+
+
+def _subscription_response(
+    request: Request,
+    user: GuardinoUser,
+    token: str,
+    base: str,
+    merged_b64: str,
+    node_links: list[dict[str, str]],
+) -> Response:
+    if _wants_html(request):
+        return HTMLResponse(
+            _render_sub_page(
+                user=user,
+                master_raw_link=f"{base}/api/v1/sub/{token}?raw=1",
+                node_links=node_links,
+            ),
+            headers=_NO_STORE_HEADERS,
+        )
+    return Response(content=merged_b64, media_type="text/plain", headers=_NO_STORE_HEADERS)
+
+
 @router.get("/sub/{token}")
 async def subscription(token: str, request: Request, db: AsyncSession = Depends(get_db)):
     user = await _get_user_by_token(db, token)
-    no_store_headers = {
-        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-        "Pragma": "no-cache",
-        "Expires": "0",
-    }
+    base = str(request.base_url).rstrip("/")
+    cached, cache_generation = await get_cached_subscription(token)
+    if cached is not None:
+        return _subscription_response(request, user, token, base, cached.payload, cached.node_links)
 
     # Resolve nodes for this user:
     # - If manual: nodes from subaccounts
     # - If group: ensure subaccounts exist for all enabled, visible nodes tagged with user.node_group AND allocated to reseller
     now = datetime.now(timezone.utc)
     changed_cache = False
-    base = str(request.base_url).rstrip("/")
 
     if user.node_selection_mode == NodeSelectionMode.group and user.node_group:
         qn = await db.execute(
@@ -1519,100 +1591,100 @@ async def subscription(token: str, request: Request, db: AsyncSession = Depends(
     qs2 = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
     subs = qs2.scalars().all()
     if not subs:
-        return Response(content=merge_subscriptions([]), media_type="text/plain", headers=no_store_headers)
+        return Response(content=merge_subscriptions([]), media_type="text/plain", headers=_NO_STORE_HEADERS)
 
     node_ids = [sa.node_id for sa in subs]
     qn2 = await db.execute(select(Node).where(Node.id.in_(node_ids)))
     node_map = {n.id: n for n in qn2.scalars().all()}
+    resolver = await load_adapter_resolver(db, subs, users=[user], node_map=node_map)
 
     bodies: list[str] = []
     wg_download_urls: list[str] = []
     node_links_for_view: list[dict[str, str]] = []
-
-    async with build_async_client() as client:
-        for sa in subs:
-            node = node_map.get(sa.node_id)
-            if not node:
-                continue
-
-            if node.panel_type == PanelType.wg_dashboard:
-                dl = f"{base}/api/v1/sub/wg/{token}/{sa.node_id}.conf"
-                wg_download_urls.append(dl)
-                node_links_for_view.append(
-                    {
-                        "node_id": str(sa.node_id),
-                        "node_name": node.name,
-                        "panel_type": "wg_dashboard",
-                        "status": "ok",
-                        "url": dl,
-                    }
-                )
-                continue
-
-            direct = normalize_url(sa.panel_sub_url_cached, node.base_url)
-            if direct and direct != sa.panel_sub_url_cached:
-                sa.panel_sub_url_cached = direct
-                changed_cache = True
-
-            if not direct:
-                try:
-                    adapter = await get_adapter_for_subaccount(db, sa, node, user)
-                    fresh = await adapter.get_direct_subscription_url(sa.remote_identifier)
-                    direct = normalize_url(fresh, node.base_url)
-                    if direct:
-                        sa.panel_sub_url_cached = direct
-                        sa.panel_sub_url_cached_at = now
-                        changed_cache = True
-                except Exception:
-                    direct = None
-
-            if not direct:
-                node_links_for_view.append(
-                    {
-                        "node_id": str(sa.node_id),
-                        "node_name": node.name,
-                        "panel_type": node.panel_type.value,
-                        "status": "missing",
-                        "url": "",
-                    }
-                )
-                continue
-
-            ok = False
-            try:
-                resp = await client.get(direct)
-                if resp.status_code < 400:
-                    bodies.append(resp.text)
-                    ok = True
-            except httpx.RequestError:
-                ok = False
-
-            if not ok:
-                try:
-                    adapter = await get_adapter_for_subaccount(db, sa, node, user)
-                    fresh = await adapter.get_direct_subscription_url(sa.remote_identifier)
-                    refreshed_direct = normalize_url(fresh, node.base_url)
-                    if refreshed_direct and refreshed_direct != direct:
-                        sa.panel_sub_url_cached = refreshed_direct
-                        sa.panel_sub_url_cached_at = now
-                        changed_cache = True
-                        resp2 = await client.get(refreshed_direct)
-                        if resp2.status_code < 400:
-                            direct = refreshed_direct
-                            bodies.append(resp2.text)
-                            ok = True
-                except Exception:
-                    ok = False
-
+    fetch_jobs: dict[int, RemoteJob] = {}
+    # Adapter construction failures (bad credentials/config) count as a failed fetch of that node only.
+    adapter_errors: dict[int, BaseException] = {}
+    direct_by_sub: dict[int, str | None] = {}
+
+    for sa in subs:
+        node = node_map.get(sa.node_id)
+        if not node or node.panel_type == PanelType.wg_dashboard:
+            continue
+        direct = normalize_url(sa.panel_sub_url_cached, node.base_url)
+        if direct and direct != sa.panel_sub_url_cached:
+            sa.panel_sub_url_cached = direct
+            changed_cache = True
+        direct_by_sub[sa.id] = direct
+        try:
+            adapter = resolver.adapter_for(sa, node)
+        except Exception as exc:
+            adapter_errors[sa.id] = exc
+            continue
+        fetch_jobs[sa.id] = (node.base_url, partial(_fetch_node_subscription, direct, adapter, sa.remote_identifier, node.base_url))
+
+    # All upstream panels are fetched concurrently; a node that fails or times
+    # out falls back to its last good body so it cannot blank the response.
+    fetch_timeout = max(1.0, float(getattr(settings, "SUB_FETCH_TIMEOUT_SECONDS", 15) or 15))
+    results = await run_bounded(fetch_jobs, timeout=fetch_timeout) if fetch_jobs else {}
+    results.update(adapter_errors)
+    failed_node_ids = [sa.node_id for sa in subs if isinstance(results.get(sa.id), BaseException) or (sa.id in results and not results[sa.id].body)]
+    stale_bodies = await get_stale_bodies(token, failed_node_ids) if failed_node_ids else {}
+    fresh_bodies: dict[int, str] = {}
+    used_stale = False
+
+    for sa in subs:
+        node = node_map.get(sa.node_id)
+        if not node:
+            continue
+
+        if node.panel_type == PanelType.wg_dashboard:
+            dl = f"{base}/api/v1/sub/wg/{token}/{sa.node_id}.conf"
+            wg_download_urls.append(dl)
             node_links_for_view.append(
                 {
                     "node_id": str(sa.node_id),
                     "node_name": node.name,
-                    "panel_type": node.panel_type.value,
-                    "status": "ok" if ok else "error",
-                    "url": direct if ok else "",
+                    "panel_type": "wg_dashboard",
+                    "status": "ok",
+                    "url": dl,
                 }
             )
+            continue
+
+        result = results.get(sa.id)
+        direct = direct_by_sub.get(sa.id)
+        status_value = "ok"
+        if isinstance(result, _NodeFetch):
+            if result.refreshed and result.url:
+                sa.panel_sub_url_cached = result.url
+                sa.panel_sub_url_cached_at = now
+                changed_cache = True
+            direct = result.url
+            if result.body is not None:
+                bodies.append(result.body)
+                fresh_bodies[sa.node_id] = result.body
+            elif not direct:
+                status_value = "missing"
+            else:
+                status_value = "error"
+        else:
+            status_value = "error" if direct else "missing"
+
+        stale = stale_bodies.get(sa.node_id)
+        if status_value == "error" and stale is not None:
+            bodies.append(stale)
+            status_value = "ok"
+            used_stale = True
+
+        node_links_for_view.append(
+            {
+                "node_id": str(sa.node_id),
+                "node_name": node.name,
+                "panel_type": node.panel_type.value,
+                "status": status_value,
+                "url": direct if status_value == "ok" and direct else "",
+            }
+        )
 
     if changed_cache:
         await db.commit()
@@ -1623,18 +1695,15 @@ async def subscription(token: str, request: Request, db: AsyncSession = Depends(
         bodies.append("\n".join(sorted(set(wg_download_urls))))
 
     merged_b64 = merge_subscriptions(bodies)
-
-    if _wants_html(request):
-        return HTMLResponse(
-            _render_sub_page(
-                user=user,
-                master_raw_link=f"{base}/api/v1/sub/{token}?raw=1",
-                node_links=node_links_for_view,
-            ),
-            headers=no_store_headers,
-        )
-
-    return Response(content=merged_b64, media_type="text/plain", headers=no_store_headers)
+    # A payload built from a stale fallback is not cached as fresh, so the
+    # next request retries the failed node instead of serving it for the TTL.
+    await store_subscription(
+        token,
+        CachedSubscription(payload=merged_b64, node_links=node_links_for_view, generation=cache_generation),
+        fresh_bodies,
+        cache_merged=not used_stale,
+    )
+    return _subscription_response(request, user, token, base, merged_b64, node_links_for_view)
 
 
 @router.get("/sub/wg/{token}/{node_id}.conf")
@@ -11,7 +11,7 @@ from app.models.user import GuardinoUser, UserStatus
 from app.models.subaccount import SubAccount
 from app.models.node import Node, PanelType
 from app.services.adapters.base import RemoteUserNotFound
-from app.services.panel_access import get_adapter_for_subaccount
+from app.services.panel_access import load_adapter_resolver
 from app.services.remote_missing import clear_remote_missing, mark_remote_missing
 from app.services.urls import normalize_url
 from app.schemas.links import UserLinksResponse, NodeLink
@@ -69,6 +69,8 @@ async def get_links(user_id: int, request: Request, refresh: bool = False, db: A
     qn = await db.execute(select(Node).where(Node.id.in_(node_ids)))
     node_map = {n.id: n for n in qn.scalars().all()}
 
+    resolver = await load_adapter_resolver(db, subs, users=[user], node_map=node_map) if refresh else None
+
     node_links: list[NodeLink] = []
     now = datetime.now(timezone.utc)
     missing_confirmations = max(1, min(20, int(getattr(settings, "USAGE_SYNC_REMOTE_MISSING_CONFIRMATIONS", 3) or 3)))
@@ -90,7 +92,7 @@ async def get_links(user_id: int, request: Request, refresh: bool = False, db: A
 
         if refresh and sa.node_id in node_map and (node_panel_type != "wg_dashboard"):
             try:
-                adapter = await get_adapter_for_subaccount(db, sa, node_map[sa.node_id], user)
+                adapter = resolver.adapter_for(sa, node_map[sa.node_id])
                 if hasattr(adapter, "get_user_snapshot"):
                     snapshot = await adapter.get_user_snapshot(sa.remote_identifier)  # type: ignore[attr-defined]
                     if snapshot.used_bytes is not None:
@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from contextlib import nullcontext
 from datetime import datetime, timedelta, timezone
 import math
 import secrets
@@ -14,15 +15,12 @@ from app.models.user import GuardinoUser, UserStatus, NodeSelectionMode
 from app.models.subaccount import SubAccount
 from app.models.node import Node
 from app.models.order import Order, OrderType, OrderStatus
-from app.models.ledger import LedgerTransaction
+from app.models.wallet_hold import WalletHold
 from app.services.billing import lock_reseller_for_billing
 from app.services.pricing import calculate_price, resolve_allowed_nodes
 from app.services.order_replay import existing_op_result
-from app.services.panel_access import (
-    get_adapter_for_allocation,
-    get_adapter_for_subaccount,
-    get_enabled_allocation_map,
-)
+from app.services.panel_access import get_enabled_allocation_map
+from app.services.provisioning import provision_on_nodes, undo_provisioning
 from app.services.refund import BYTES_PER_GB, refundable_gb_for_user
 from app.services.reseller_operation_policy import (
     enforce_delete_policy,
@@ -37,14 +35,18 @@ from app.services.reseller_user_policy import get_effective_user_policy
 from app.services.remote_sync import (
     raise_remote_sync_failed,
     raise_remote_sync_failed_with_rollback,
+    resolve_remote_targets,
     rollback_limit_changes,
-    short_error,
+    run_remote_calls,
 )
 from app.services.status_policy import enable_if_needed
 from app.services.subscription_tokens import remember_revoked_master_sub_token
 from app.services.urls import normalize_url
 from urllib.parse import urlparse, parse_qs
-from app.services.http_client import build_async_client
+from app.services.http_client import shared_request
+from app.services.expiry_schedule import schedule_user_expiry
+from app.services.subscription_cache import invalidate_subscription_cache
+from app.services.wallet import capture_hold, ensure_user_idle, release_on_error, reserve_funds
 from app.schemas.ops import ExtendRequest, DecreaseTimeRequest, AddTrafficRequest, RenewRequest, ChangeNodesRequest, RefundRequest, SetStatusRequest, OpResult
 
 router = APIRouter()
@@ -63,6 +65,81 @@ async def _flush_order_or_conflict(db: AsyncSession, request_id: str | None) ->
         raise
 
 
+async def _reserve_and_commit(
+    db: AsyncSession,
+    reseller: Reseller,
+    order: Order,
+    request_id: str | None,
+    *,
+    amount: int,
+    user_id: int | None,
+) -> WalletHold:
+    """Record the pending order and its wallet hold, then end the locked transaction."""
+    db.add(order)
+    await _flush_order_or_conflict(db, request_id)
+    hold = await reserve_funds(db, reseller, order, amount=amount, user_id=user_id)
+    await db.commit()
+    return hold
+
+
+async def _update_wg_share_expiry(s: SubAccount, n: Node, expire_at: datetime) -> None:
+    """WGDashboard share links (legacy support) - best-effort ExpireDate update."""
+    try:
+        if (
+            s.panel_sub_url_cached
+            and "sharePeer/get" in s.panel_sub_url_cached
+            and "ShareID=" in s.panel_sub_url_cached
+            and getattr(n, "panel_type", None)
+            and getattr(n.panel_type, "value", "") == "wg_dashboard"
+        ):
+            qs = parse_qs(urlparse(s.panel_sub_url_cached).query)
+            sid = (qs.get("ShareID") or [None])[0]
+            if sid:
+                await shared_request(
+                    "POST",
+                    f"{n.base_url.rstrip('/')}/api/sharePeer/update",
+                    headers={"wg-dashboard-apikey": (n.credentials or {}).get("apikey", "")},
+                    json={"ShareID": sid, "ExpireDate": expire_at.strftime("%Y-%m-%d %H:%M:%S")},
+                )
+    except Exception:
+        pass
+
+
+async def _push_user_limits(
+    db: AsyncSession,
+    user: GuardinoUser,
+    subs: list[SubAccount],
+    node_map: dict[int, Node],
+    *,
+    total_gb: int,
+    expire_at: datetime,
+    reset_usage: bool = False,
+    enable: bool = True,
+    update_wg_share: bool = False,
+) -> tuple[list[tuple[SubAccount, Node]], list[str]]:
+    """Push new limits to every subaccount's panel concurrently.
+
+    Returns the subaccounts whose limits were applied (what a rollback has to
+    restore) and the aggregated per-node errors.
+    """
+    targets, errors = await resolve_remote_targets(db, subs, node_map, user)
+    applied: set[int] = set()
+
+    async def push(s: SubAccount, n: Node, adapter) -> None:
+        await adapter.update_user_limits(s.remote_identifier, total_gb=total_gb, expire_at=expire_at)
+        applied.add(id(s))
+        if reset_usage:
+            await adapter.reset_usage(s.remote_identifier)
+        if enable:
+            await enable_if_needed(n.panel_type, adapter, s.remote_identifier)
+        if update_wg_share:
+            await _update_wg_share_expiry(s, n, expire_at)
+
+    _done, call_errors = await run_remote_calls(targets, push)
+    synced = [(s, n) for s, n, _adapter in targets if id(s) in applied]
+    return synced, errors + call_errors
+
+
 async def _new_unique_master_sub_token(db: AsyncSession) -> str:
     for _ in range(8):
         candidate = secrets.token_hex(16)
@@ -77,20 +154,14 @@ async def _delete_subaccounts_remote_first(
     subs: list[SubAccount],
     node_map: dict[int, Node],
 ) -> tuple[int, list[str]]:
-    """Best-effort remote delete for each subaccount, then delete local record."""
-    deleted_local = 0
-    errors: list[str] = []
+    """Best-effort remote delete for each subaccount, then delete local records."""
+    # Subaccounts whose node is gone have nothing to delete remotely.
+    targets, _missing = await resolve_remote_targets(db, [sa for sa in subs if sa.node_id in node_map], node_map)
+    _deleted, errors = await run_remote_calls(targets, lambda sa, _n, adapter: adapter.delete_user(sa.remote_identifier))
+    # Local deletes are queued after the remote calls so no row is locked meanwhile.
     for sa in subs:
-        n = node_map.get(sa.node_id)
-        if n:
-            try:
-                adapter = await get_adapter_for_subaccount(db, sa, n)
-                await adapter.delete_user(sa.remote_identifier)
-            except Exception as e:
-                errors.append(f"node#{sa.node_id}: {short_error(e)}")
         await db.delete(sa)
-        deleted_local += 1
-    return deleted_local, errors
+    return len(subs), errors
 
 @router.post("/{user_id}/extend", response_model=OpResult)
 async def extend_user(user_id: int, payload: ExtendRequest, request: Request, db: AsyncSession = Depends(get_db), reseller: Reseller = Depends(block_if_balance_zero)):
@@ -118,76 +189,36 @@ async def extend_user(user_id: int, payload: ExtendRequest, request: Request, db
     if reseller.price_per_day is not None and reseller.price_per_day > 0:
         time_amount = int(reseller.price_per_day) * int(payload.days)
 
-    if reseller.balance < time_amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
     order = Order(reseller_id=reseller.id, user_id=user.id, type=OrderType.extend, status=OrderStatus.pending, purchased_gb=None, price_per_gb_snapshot=None, client_request_id=request_id)
-    db.add(order)
-    await _flush_order_or_conflict(db, request_id)
+    hold = await _reserve_and_commit(db, reseller, order, request_id, amount=time_amount, user_id=user.id)
 
     old_total_gb = int(user.total_gb)
     old_expire_at = user.expire_at
-    user.expire_at = old_expire_at + timedelta(days=int(payload.days))
+    new_expire_at = old_expire_at + timedelta(days=int(payload.days))
 
-    # Update remote panels before local financial commit.
-    qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
-    subs = qs_sub.scalars().all()
-    remote_sync_errors: list[str] = []
-    remote_synced_ok: list[tuple[SubAccount, Node]] = []
-    if subs:
-        qn = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
-        node_map = {n.id: n for n in qn.scalars().all()}
-        for s in subs:
-            n = node_map.get(s.node_id)
-            if not n:
-                remote_sync_errors.append(f"node#{s.node_id}: node not found")
-                continue
-            adapter = await get_adapter_for_subaccount(db, s, n, user)
-            try:
-                await adapter.update_user_limits(s.remote_identifier, total_gb=int(user.total_gb), expire_at=user.expire_at)
-            except Exception as e:
-                remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-                continue
-            remote_synced_ok.append((s, n))
-            try:
-                await enable_if_needed(n.panel_type, adapter, s.remote_identifier)
-            except Exception as e:
-                remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-                continue
-
-            # WGDashboard share links (legacy support) - best-effort
-            try:
-                if (
-                    s.panel_sub_url_cached
-                    and "sharePeer/get" in s.panel_sub_url_cached
-                    and "ShareID=" in s.panel_sub_url_cached
-                    and getattr(n, "panel_type", None)
-                    and getattr(n.panel_type, "value", "") == "wg_dashboard"
-                ):
-                    qs = parse_qs(urlparse(s.panel_sub_url_cached).query)
-                    sid = (qs.get("ShareID") or [None])[0]
-                    if sid:
-                        async with build_async_client() as client:
-                            await client.post(
-                                f"{n.base_url.rstrip('/')}/api/sharePeer/update",
-                                headers={"wg-dashboard-apikey": (n.credentials or {}).get("apikey", "")},
-                                json={"ShareID": sid, "ExpireDate": user.expire_at.strftime("%Y-%m-%d %H:%M:%S")},
-                            )
-            except Exception:
-                pass
-    if remote_sync_errors:
-        rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
-        raise_remote_sync_failed_with_rollback("Extend", remote_sync_errors, rollback_errors)
-    now = _now()
-    charged = 0
-    if time_amount > 0:
-        reseller.balance -= time_amount
-        charged = time_amount
-        db.add(LedgerTransaction(reseller_id=reseller.id, order_id=order.id, client_request_id=request_id, amount=-time_amount, reason="extend", balance_after=reseller.balance, occurred_at=now))
+    async with release_on_error(db, hold):
+        # Update remote panels before local financial commit.
+        qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
+        subs = qs_sub.scalars().all()
+        remote_sync_errors: list[str] = []
+        remote_synced_ok: list[tuple[SubAccount, Node]] = []
+        if subs:
+            qn = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
+            node_map = {n.id: n for n in qn.scalars().all()}
+            remote_synced_ok, remote_sync_errors = await _push_user_limits(
+                db, user, subs, node_map, total_gb=old_total_gb, expire_at=new_expire_at, update_wg_share=True
+            )
+        if remote_sync_errors:
+            rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
+            raise_remote_sync_failed_with_rollback("Extend", remote_sync_errors, rollback_errors)
 
-    order.status = OrderStatus.completed
-    await db.commit()
-    return OpResult(ok=True, order_id=order.id, request_id=request_id, charged_amount=charged, refunded_amount=0, new_balance=reseller.balance, user_id=user.id)
+        reseller, _ledger = await capture_hold(db, hold, amount=-time_amount, reason="extend", request_id=request_id, occurred_at=_now())
+        user.expire_at = new_expire_at
+        order.status = OrderStatus.completed
+        await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
+    await schedule_user_expiry(user)
+    return OpResult(ok=True, order_id=order.id, request_id=request_id, charged_amount=time_amount, refunded_amount=0, new_balance=reseller.balance, user_id=user.id)
 
 
 @router.post("/{user_id}/renew", response_model=OpResult)
@@ -231,9 +262,6 @@ async def renew_user(user_id: int, payload: RenewRequest, request: Request, db:
         days=int(payload.days),
         pricing_mode=payload.pricing_mode,
     )
-    if reseller.balance < total_amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
     now = _now()
     old_total_gb = int(user.total_gb or 0)
     old_expire_at = user.expire_at
@@ -270,52 +298,36 @@ async def renew_user(user_id: int, payload: RenewRequest, request: Request, db:
         price_per_gb_snapshot=reseller.price_per_gb,
         client_request_id=request_id,
     )
-    db.add(order)
-    await _flush_order_or_conflict(db, request_id)
+    hold = await _reserve_and_commit(db, reseller, order, request_id, amount=total_amount, user_id=user.id)
 
-    remote_sync_errors: list[str] = []
-    remote_synced_ok: list[tuple[SubAccount, Node]] = []
-    for s in subs:
-        n = node_map.get(s.node_id)
-        if not n:
-            remote_sync_errors.append(f"node#{s.node_id}: node not found")
-            continue
-        try:
-            adapter = await get_adapter_for_subaccount(db, s, n, user)
-            await adapter.update_user_limits(s.remote_identifier, total_gb=new_total_gb, expire_at=new_expire_at)
-            if reset_usage:
-                await adapter.reset_usage(s.remote_identifier)
-                s.used_bytes = 0
-            await enable_if_needed(n.panel_type, adapter, s.remote_identifier)
-        except Exception as e:
-            remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-            continue
-        remote_synced_ok.append((s, n))
-
-    if remote_sync_errors:
-        rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
-        raise_remote_sync_failed_with_rollback("Renew", remote_sync_errors, rollback_errors)
-
-    user.total_gb = new_total_gb
-    user.expire_at = new_expire_at
-    user.status = UserStatus.active
-    if reset_usage:
-        user.used_bytes = 0
-
-    reseller.balance -= total_amount
-    db.add(
-        LedgerTransaction(
-            reseller_id=reseller.id,
-            order_id=order.id,
-            client_request_id=request_id,
+    async with release_on_error(db, hold):
+        remote_synced_ok, remote_sync_errors = await _push_user_limits(
+            db, user, subs, node_map, total_gb=new_total_gb, expire_at=new_expire_at, reset_usage=reset_usage
+        )
+
+        if remote_sync_errors:
+            rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
+            raise_remote_sync_failed_with_rollback("Renew", remote_sync_errors, rollback_errors)
+
+        reseller, _ledger = await capture_hold(
+            db,
+            hold,
             amount=-total_amount,
             reason=f"renew_{renewal_policy}",
-            balance_after=reseller.balance,
+            request_id=request_id,
             occurred_at=now,
         )
-    )
-    order.status = OrderStatus.completed
-    await db.commit()
+        user.total_gb = new_total_gb
+        user.expire_at = new_expire_at
+        user.status = UserStatus.active
+        if reset_usage:
+            user.used_bytes = 0
+            for s, _n in remote_synced_ok:
+                s.used_bytes = 0
+        order.status = OrderStatus.completed
+        await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
+    await schedule_user_expiry(user)
     return OpResult(ok=True, order_id=order.id, request_id=request_id, charged_amount=total_amount, refunded_amount=0, new_balance=reseller.balance, user_id=user.id)
 
 
@@ -340,18 +352,6 @@ async def decrease_time(user_id: int, payload: DecreaseTimeRequest, request: Req
     enforce_edit_allowed(policy, "Decrease time")
     enforce_policy_days(policy, payload.days)
 
-    order = Order(
-        reseller_id=reseller.id,
-        user_id=user.id,
-        type=OrderType.refund,
-        status=OrderStatus.pending,
-        purchased_gb=None,
-        price_per_gb_snapshot=None,
-        client_request_id=request_id,
-    )
-    db.add(order)
-    await _flush_order_or_conflict(db, request_id)
-
     old_total_gb = int(user.total_gb)
     old_expire_at = user.expire_at
     # Cap the decreased days to the time the user actually has left, so a reseller
@@ -363,77 +363,51 @@ async def decrease_time(user_id: int, payload: DecreaseTimeRequest, request: Req
     effective_days = max(0, min(int(payload.days), remaining_days))
     if effective_days <= 0:
         raise HTTPException(status_code=400, detail="No remaining time to decrease.")
-    user.expire_at = old_expire_at - timedelta(days=effective_days)
-
-    # Update remote panels before local financial commit.
-    qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
-    subs = qs_sub.scalars().all()
-    remote_sync_errors: list[str] = []
-    remote_synced_ok: list[tuple[SubAccount, Node]] = []
-    if subs:
-        qn = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
-        node_map = {n.id: n for n in qn.scalars().all()}
-        for s in subs:
-            n = node_map.get(s.node_id)
-            if not n:
-                remote_sync_errors.append(f"node#{s.node_id}: node not found")
-                continue
-            adapter = await get_adapter_for_subaccount(db, s, n, user)
-            try:
-                await adapter.update_user_limits(s.remote_identifier, total_gb=int(user.total_gb), expire_at=user.expire_at)
-            except Exception as e:
-                remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-                continue
-            remote_synced_ok.append((s, n))
-            try:
-                await enable_if_needed(n.panel_type, adapter, s.remote_identifier)
-            except Exception as e:
-                remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-                continue
-
-            # WGDashboard share links (legacy support) - best-effort
-            try:
-                if (
-                    s.panel_sub_url_cached
-                    and "sharePeer/get" in s.panel_sub_url_cached
-                    and "ShareID=" in s.panel_sub_url_cached
-                    and getattr(n, "panel_type", None)
-                    and getattr(n.panel_type, "value", "") == "wg_dashboard"
-                ):
-                    qs = parse_qs(urlparse(s.panel_sub_url_cached).query)
-                    sid = (qs.get("ShareID") or [None])[0]
-                    if sid:
-                        async with build_async_client() as client:
-                            await client.post(
-                                f"{n.base_url.rstrip('/')}/api/sharePeer/update",
-                                headers={"wg-dashboard-apikey": (n.credentials or {}).get("apikey", "")},
-                                json={"ShareID": sid, "ExpireDate": user.expire_at.strftime("%Y-%m-%d %H:%M:%S")},
-                            )
-            except Exception:
-                pass
-    if remote_sync_errors:
-        rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
-        raise_remote_sync_failed_with_rollback("Decrease time", remote_sync_errors, rollback_errors)
-
-    now = _now()
+    new_expire_at = old_expire_at - timedelta(days=effective_days)
     refund_amount = 0
     if reseller.price_per_day is not None and reseller.price_per_day > 0:
         refund_amount = int(reseller.price_per_day) * int(effective_days)
-        reseller.balance += refund_amount
-        db.add(
-            LedgerTransaction(
-                reseller_id=reseller.id,
-                order_id=order.id,
-                client_request_id=request_id,
-                amount=refund_amount,
-                reason="refund_decrease_time",
-                balance_after=reseller.balance,
-                occurred_at=now,
+
+    order = Order(
+        reseller_id=reseller.id,
+        user_id=user.id,
+        type=OrderType.refund,
+        status=OrderStatus.pending,
+        purchased_gb=None,
+        price_per_gb_snapshot=None,
+        client_request_id=request_id,
+    )
+    hold = await _reserve_and_commit(db, reseller, order, request_id, amount=0, user_id=user.id)
+
+    async with release_on_error(db, hold):
+        # Update remote panels before local financial commit.
+        qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
+        subs = qs_sub.scalars().all()
+        remote_sync_errors: list[str] = []
+        remote_synced_ok: list[tuple[SubAccount, Node]] = []
+        if subs:
+            qn = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
+            node_map = {n.id: n for n in qn.scalars().all()}
+            remote_synced_ok, remote_sync_errors = await _push_user_limits(
+                db, user, subs, node_map, total_gb=old_total_gb, expire_at=new_expire_at, update_wg_share=True
             )
+        if remote_sync_errors:
+            rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
+            raise_remote_sync_failed_with_rollback("Decrease time", remote_sync_errors, rollback_errors)
+
+        reseller, _ledger = await capture_hold(
+            db,
+            hold,
+            amount=refund_amount,
+            reason="refund_decrease_time",
+            request_id=request_id,
+            occurred_at=_now(),
         )
-
-    order.status = OrderStatus.completed
-    await db.commit()
+        user.expire_at = new_expire_at
+        order.status = OrderStatus.completed
+        await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
+    await schedule_user_expiry(user)
     return OpResult(ok=True, order_id=order.id, request_id=request_id, charged_amount=0, refunded_amount=refund_amount, new_balance=reseller.balance, user_id=user.id)
 
 
@@ -468,64 +442,29 @@ async def add_traffic(user_id: int, payload: AddTrafficRequest, request: Request
     nodes = qn.scalars().all()
 
     total_amount, per_node, _time_amount = await calculate_price(db, reseller, nodes, payload.add_gb, days=0)
-    if reseller.balance < total_amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
     order = Order(reseller_id=reseller.id, user_id=user.id, type=OrderType.add_traffic, status=OrderStatus.pending, purchased_gb=payload.add_gb, price_per_gb_snapshot=reseller.price_per_gb, client_request_id=request_id)
-    db.add(order)
-    await _flush_order_or_conflict(db, request_id)
+    hold = await _reserve_and_commit(db, reseller, order, request_id, amount=total_amount, user_id=user.id)
 
     old_total_gb = int(user.total_gb)
     old_expire_at = user.expire_at
-    user.total_gb = old_total_gb + int(payload.add_gb)
+    new_total_gb = old_total_gb + int(payload.add_gb)
 
-    # Update remote panels before local financial commit.
-    qn2 = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
-    node_map2 = {n.id: n for n in qn2.scalars().all()}
-    remote_sync_errors: list[str] = []
-    remote_synced_ok: list[tuple[SubAccount, Node]] = []
-    for s in subs:
-        n = node_map2.get(s.node_id)
-        if not n:
-            remote_sync_errors.append(f"node#{s.node_id}: node not found")
-            continue
-        adapter = await get_adapter_for_subaccount(db, s, n, user)
-        try:
-            await adapter.update_user_limits(s.remote_identifier, total_gb=int(user.total_gb), expire_at=user.expire_at)
-        except Exception as e:
-            remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-            continue
-        remote_synced_ok.append((s, n))
-        try:
-            await enable_if_needed(n.panel_type, adapter, s.remote_identifier)
-        except Exception as e:
-            remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-            continue
-        # WGDashboard: also update share link ExpireDate if we have ShareID in cached url
-        try:
-            if s.panel_sub_url_cached and "sharePeer/get" in s.panel_sub_url_cached and "ShareID=" in s.panel_sub_url_cached:
-                qs = parse_qs(urlparse(s.panel_sub_url_cached).query)
-                sid = (qs.get("ShareID") or [None])[0]
-                if sid and getattr(n, "panel_type", None) and n.panel_type.value == "wg_dashboard":
-                    async with build_async_client() as client:
-                        await client.post(
-                            f"{n.base_url.rstrip('/')}/api/sharePeer/update",
-                            headers={"wg-dashboard-apikey": (n.credentials or {}).get("apikey", "")},
-                            json={"ShareID": sid, "ExpireDate": user.expire_at.strftime("%Y-%m-%d %H:%M:%S")},
-                        )
-        except Exception:
-            pass
-
-    if remote_sync_errors:
-        rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
-        raise_remote_sync_failed_with_rollback("Add traffic", remote_sync_errors, rollback_errors)
+    async with release_on_error(db, hold):
+        # Update remote panels before local financial commit.
+        node_map2 = {n.id: n for n in nodes}
+        remote_synced_ok, remote_sync_errors = await _push_user_limits(
+            db, user, subs, node_map2, total_gb=new_total_gb, expire_at=old_expire_at, update_wg_share=True
+        )
 
-    now = _now()
-    reseller.balance -= total_amount
-    db.add(LedgerTransaction(reseller_id=reseller.id, order_id=order.id, client_request_id=request_id, amount=-total_amount, reason="add_traffic", balance_after=reseller.balance, occurred_at=now))
+        if remote_sync_errors:
+            rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
+            raise_remote_sync_failed_with_rollback("Add traffic", remote_sync_errors, rollback_errors)
 
-    order.status = OrderStatus.completed
-    await db.commit()
+        reseller, _ledger = await capture_hold(db, hold, amount=-total_amount, reason="add_traffic", request_id=request_id, occurred_at=_now())
+        user.total_gb = new_total_gb
+        order.status = OrderStatus.completed
+        await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
     return OpResult(ok=True, order_id=order.id, request_id=request_id, charged_amount=total_amount, refunded_amount=0, new_balance=reseller.balance, user_id=user.id)
 
 @router.post("/{user_id}/change-nodes", response_model=OpResult)
@@ -557,94 +496,85 @@ async def change_nodes(user_id: int, payload: ChangeNodesRequest, request: Reque
     subs = qs.scalars().all()
     current_ids = {sa.node_id for sa in subs}
 
+    # Add: must be allowed nodes for reseller
+    nodes: list[Node] = []
+    if add_ids:
+        nodes = await resolve_allowed_nodes(db, reseller.id, add_ids, node_group=None)
+        nodes = [n for n in nodes if n.id in add_ids and n.id not in current_ids]
+
+    charged = 0
+    order = None
+    hold = None
+    now = _now()
+    if nodes:
+        allocation_map = await get_enabled_allocation_map(db, reseller_id=reseller.id, node_ids=[n.id for n in nodes])
+        # Charge per GB for adding this user to new nodes: price_per_gb * user.total_gb for each added node
+        total_amount, per_node, _ = await calculate_price(db, reseller, nodes, total_gb=int(user.total_gb), days=0)
+        order = Order(reseller_id=reseller.id, user_id=user.id, type=OrderType.change_nodes, status=OrderStatus.pending, purchased_gb=None, price_per_gb_snapshot=reseller.price_per_gb, client_request_id=request_id)
+        hold = await _reserve_and_commit(db, reseller, order, request_id, amount=total_amount, user_id=user.id)
+    else:
+        await ensure_user_idle(db, user.id)
+        await db.commit()
+
     remove_errors: list[str] = []
     removed_count = 0
 
-    # Remove: delete from remote panel first (best-effort), then local subaccount
-    if remove_ids:
-        remove_targets = [sa for sa in subs if sa.node_id in remove_ids]
-        node_ids_for_remove = [sa.node_id for sa in remove_targets]
-        qn_remove = await db.execute(select(Node).where(Node.id.in_(node_ids_for_remove)))
-        node_map_remove = {n.id: n for n in qn_remove.scalars().all()}
-        for sa in subs:
-            if sa.node_id in remove_ids:
-                n = node_map_remove.get(sa.node_id)
-                if not n:
-                    remove_errors.append(f"node#{sa.node_id}: node not found")
-                    continue
-                try:
-                    adapter = await get_adapter_for_subaccount(db, sa, n, user)
-                    await adapter.delete_user(sa.remote_identifier)
-                except Exception as e:
-                    remove_errors.append(f"node#{sa.node_id}: {short_error(e)}")
-                    continue
+    async with release_on_error(db, hold) if hold else nullcontext():
+        # Remove: delete from remote panel first (best-effort), then local subaccount
+        if remove_ids:
+            remove_targets = [sa for sa in subs if sa.node_id in remove_ids]
+            node_ids_for_remove = [sa.node_id for sa in remove_targets]
+            qn_remove = await db.execute(select(Node).where(Node.id.in_(node_ids_for_remove)))
+            node_map_remove = {n.id: n for n in qn_remove.scalars().all()}
+            targets, remove_errors = await resolve_remote_targets(db, remove_targets, node_map_remove, user)
+            removed, delete_errors = await run_remote_calls(
+                targets, lambda sa, _n, adapter: adapter.delete_user(sa.remote_identifier)
+            )
+            remove_errors += delete_errors
+            for sa, _n in removed:
                 await db.delete(sa)
-                removed_count += 1
-
-    raise_remote_sync_failed("Change nodes (remove)", remove_errors)
+            removed_count = len(removed)
 
-    charged = 0
-    order_id = None
-    now = _now()
+        raise_remote_sync_failed("Change nodes (remove)", remove_errors)
 
-    # Add: must be allowed nodes for reseller
-    if add_ids:
-        nodes = await resolve_allowed_nodes(db, reseller.id, add_ids, node_group=None)
-        nodes = [n for n in nodes if n.id in add_ids and n.id not in current_ids]
-        if nodes:
-            allocation_map = await get_enabled_allocation_map(db, reseller_id=reseller.id, node_ids=[n.id for n in nodes])
-            # Charge per GB for adding this user to new nodes: price_per_gb * user.total_gb for each added node
-            total_amount, per_node, _ = await calculate_price(db, reseller, nodes, total_gb=int(user.total_gb), days=0)
-            if reseller.balance < total_amount:
-                raise HTTPException(status_code=400, detail="Insufficient balance")
-            order = Order(reseller_id=reseller.id, user_id=user.id, type=OrderType.change_nodes, status=OrderStatus.pending, purchased_gb=None, price_per_gb_snapshot=reseller.price_per_gb, client_request_id=request_id)
-            db.add(order)
-            await _flush_order_or_conflict(db, request_id)
-            order_id = order.id
-
-            # Provision on each added node; if partial failure happens, try best-effort cleanup.
-            provisioned_remote: list[tuple[Node, object, str]] = []
-            try:
-                for n in nodes:
-                    allocation = allocation_map.get(n.id)
-                    adapter = get_adapter_for_allocation(n, allocation)
-                    pr = await adapter.provision_user(label=user.label, total_gb=int(user.total_gb), expire_at=user.expire_at)
-                    provisioned_remote.append((n, allocation, pr.remote_identifier))
-                    direct_url = normalize_url(pr.direct_sub_url, n.base_url)
-                    db.add(
-                        SubAccount(
-                            user_id=user.id,
-                            node_id=n.id,
-                            allocation_id=allocation.id if allocation else None,
-                            remote_identifier=pr.remote_identifier,
-                            panel_sub_url_cached=direct_url,
-                            panel_sub_url_cached_at=now if direct_url else None,
-                            used_bytes=0,
-                        )
-                    )
-            except Exception as e:
-                cleanup_errors: list[str] = []
-                for pn, allocation, rid in provisioned_remote:
-                    try:
-                        cleanup_adapter = get_adapter_for_allocation(pn, allocation)
-                        await cleanup_adapter.delete_user(rid)
-                    except Exception as ce:
-                        cleanup_errors.append(f"node#{pn.id}: {short_error(ce)}")
-                detail = f"Change nodes provision failed: {short_error(e)}"
+        if order is not None and hold is not None:
+            # Provision on all added nodes concurrently; if any fails, best-effort cleanup of the rest.
+            outcomes = await provision_on_nodes(
+                nodes, allocation_map, label=user.label, total_gb=int(user.total_gb), expire_at=user.expire_at
+            )
+            failures = [o for o in outcomes if not o.ok]
+            if failures:
+                cleanup_errors = await undo_provisioning(outcomes)
+                detail = f"Change nodes provision failed: node#{failures[0].node.id}: {failures[0].error}"
                 if cleanup_errors:
                     detail = f"{detail}; cleanup_failures={len(cleanup_errors)}"
                 raise HTTPException(status_code=502, detail=detail)
 
-            reseller.balance -= total_amount
+            for outcome in outcomes:
+                allocation = outcome.allocation
+                direct_url = normalize_url(outcome.result.direct_sub_url, outcome.node.base_url)
+                db.add(
+                    SubAccount(
+                        user_id=user.id,
+                        node_id=outcome.node.id,
+                        allocation_id=allocation.id if allocation else None,
+                        remote_identifier=outcome.result.remote_identifier,
+                        panel_sub_url_cached=direct_url,
+                        panel_sub_url_cached_at=now if direct_url else None,
+                        used_bytes=0,
+                    )
+                )
+
+            reseller, _ledger = await capture_hold(db, hold, amount=-total_amount, reason="change_nodes_add", request_id=request_id, occurred_at=now)
             charged = total_amount
-            db.add(LedgerTransaction(reseller_id=reseller.id, order_id=order.id, client_request_id=request_id, amount=-total_amount, reason="change_nodes_add", balance_after=reseller.balance, occurred_at=now))
             order.status = OrderStatus.completed
 
-    await db.commit()
+        await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
     detail = None
     if removed_count:
         detail = f"removed_nodes={removed_count}"
-    return OpResult(ok=True, order_id=order_id, request_id=request_id, charged_amount=charged, refunded_amount=0, new_balance=reseller.balance, user_id=user.id, detail=detail)
+    return OpResult(ok=True, order_id=order.id if order else None, request_id=request_id, charged_amount=charged, refunded_amount=0, new_balance=reseller.balance, user_id=user.id, detail=detail)
 
 @router.post("/{user_id}/refund", response_model=OpResult)
 async def refund_or_delete(user_id: int, payload: RefundRequest, request: Request, db: AsyncSession = Depends(get_db), reseller: Reseller = Depends(require_reseller)):
@@ -724,65 +654,51 @@ async def refund_or_delete(user_id: int, payload: RefundRequest, request: Reques
         price_per_gb_snapshot=price_per_gb,
         client_request_id=request_id,
     )
-    db.add(order)
-    await _flush_order_or_conflict(db, request_id)
+    hold = await _reserve_and_commit(db, reseller, order, request_id, amount=0, user_id=user.id)
 
-    # Apply to user
     old_total_gb = int(user.total_gb)
     old_expire_at = user.expire_at
-    user.total_gb = max(0, old_total_gb - int(refund_gb))
-
-    remote_delete_errors: list[str] = []
-    remote_limit_errors: list[str] = []
-
-    qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
-    subs = qs_sub.scalars().all()
-    node_ids = [s.node_id for s in subs]
-    node_map: dict[int, Node] = {}
-    if node_ids:
-        qn = await db.execute(select(Node).where(Node.id.in_(node_ids)))
-        node_map = {n.id: n for n in qn.scalars().all()}
-
-    if payload.action == "delete":
-        _removed, remote_delete_errors = await _delete_subaccounts_remote_first(db, subs, node_map)
-        raise_remote_sync_failed("Delete", remote_delete_errors)
-        user.status = UserStatus.deleted
-    else:
-        # For partial refund, keep user and sync reduced limits to remote panels.
-        remote_synced_ok: list[tuple[SubAccount, Node]] = []
-        for sa in subs:
-            n = node_map.get(sa.node_id)
-            if not n:
-                remote_limit_errors.append(f"node#{sa.node_id}: node not found")
-                continue
-            try:
-                adapter = await get_adapter_for_subaccount(db, sa, n, user)
-                await adapter.update_user_limits(sa.remote_identifier, total_gb=int(user.total_gb), expire_at=user.expire_at)
-            except Exception as e:
-                remote_limit_errors.append(f"node#{sa.node_id}: {short_error(e)}")
-                continue
-            remote_synced_ok.append((sa, n))
-        if remote_limit_errors:
-            rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
-            raise_remote_sync_failed_with_rollback("Refund/decrease", remote_limit_errors, rollback_errors)
-
-    now = _now()
-    if refund_amount > 0:
-        reseller.balance += refund_amount
-        db.add(
-            LedgerTransaction(
-                reseller_id=reseller.id,
-                order_id=order.id,
-                client_request_id=request_id,
-                amount=refund_amount,
-                reason=f"refund_{payload.action}",
-                balance_after=reseller.balance,
-                occurred_at=now,
+    new_total_gb = max(0, old_total_gb - int(refund_gb))
+
+    async with release_on_error(db, hold):
+        remote_delete_errors: list[str] = []
+        remote_limit_errors: list[str] = []
+
+        qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
+        subs = qs_sub.scalars().all()
+        node_ids = [s.node_id for s in subs]
+        node_map: dict[int, Node] = {}
+        if node_ids:
+            qn = await db.execute(select(Node).where(Node.id.in_(node_ids)))
+            node_map = {n.id: n for n in qn.scalars().all()}
+
+        if payload.action == "delete":
+            _removed, remote_delete_errors = await _delete_subaccounts_remote_first(db, subs, node_map)
+            raise_remote_sync_failed("Delete", remote_delete_errors)
+        else:
+            # For partial refund, keep user and sync reduced limits to remote panels.
+            remote_synced_ok, remote_limit_errors = await _push_user_limits(
+                db, user, subs, node_map, total_gb=new_total_gb, expire_at=old_expire_at, enable=False
             )
+            if remote_limit_errors:
+                rollback_errors = await rollback_limit_changes(remote_synced_ok, total_gb=old_total_gb, expire_at=old_expire_at, db=db)
+                raise_remote_sync_failed_with_rollback("Refund/decrease", remote_limit_errors, rollback_errors)
+
+        reseller, _ledger = await capture_hold(
+            db,
+            hold,
+            amount=refund_amount,
+            reason=f"refund_{payload.action}",
+            request_id=request_id,
+            occurred_at=_now(),
         )
-    order.status = OrderStatus.completed
-
-    await db.commit()
+        if payload.action == "delete":
+            user.status = UserStatus.deleted
+        user.total_gb = new_total_gb
+        order.status = OrderStatus.completed
+        await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
+    await schedule_user_expiry(user)
     detail_parts = [f"refunded_gb={refund_gb}"]
     return OpResult(
         ok=True,
@@ -802,9 +718,9 @@ async def set_user_status(user_id: int, payload: SetStatusRequest, db: AsyncSess
     user = q.scalar_one_or_none()
     if not user or user.status == UserStatus.deleted:
         raise HTTPException(status_code=404, detail="User not found")
+    await ensure_user_idle(db, user.id)
 
     new_status = UserStatus(payload.status)
-    user.status = new_status
 
     qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
     subs = qs_sub.scalars().all()
@@ -812,23 +728,23 @@ async def set_user_status(user_id: int, payload: SetStatusRequest, db: AsyncSess
     if subs:
         qn = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
         node_map = {n.id: n for n in qn.scalars().all()}
-        for s in subs:
-            n = node_map.get(s.node_id)
-            if not n:
-                remote_sync_errors.append(f"node#{s.node_id}: node not found")
-                continue
-            try:
-                adapter = await get_adapter_for_subaccount(db, s, n, user)
-                if new_status == UserStatus.active:
-                    await adapter.enable_user(s.remote_identifier)
-                else:
-                    await adapter.disable_user(s.remote_identifier)
-            except Exception as e:
-                remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
+        targets, remote_sync_errors = await resolve_remote_targets(db, subs, node_map, user)
+
+        async def apply_status(s: SubAccount, _n: Node, adapter) -> None:
+            if new_status == UserStatus.active:
+                await adapter.enable_user(s.remote_identifier)
+            else:
+                await adapter.disable_user(s.remote_identifier)
+
+        _done, call_errors = await run_remote_calls(targets, apply_status)
+        remote_sync_errors += call_errors
 
     raise_remote_sync_failed("Set status", remote_sync_errors)
 
+    user.status = new_status
     await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
+    await schedule_user_expiry(user)
     return OpResult(ok=True, charged_amount=0, refunded_amount=0, new_balance=reseller.balance, user_id=user.id)
 
 
@@ -841,6 +757,7 @@ async def reset_user_usage(user_id: int, db: AsyncSession = Depends(get_db), res
     policy = await get_effective_user_policy(db, reseller.id)
     if not bool(policy.get("allow_reset_usage", True)):
         raise HTTPException(status_code=403, detail="Usage reset is disabled for your account.")
+    await ensure_user_idle(db, user.id)
 
     qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
     subs = qs_sub.scalars().all()
@@ -848,23 +765,19 @@ async def reset_user_usage(user_id: int, db: AsyncSession = Depends(get_db), res
     if subs:
         qn = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
         node_map = {n.id: n for n in qn.scalars().all()}
-        for s in subs:
-            n = node_map.get(s.node_id)
-            if not n:
-                remote_sync_errors.append(f"node#{s.node_id}: node not found")
-                continue
-            try:
-                adapter = await get_adapter_for_subaccount(db, s, n, user)
-                await adapter.reset_usage(s.remote_identifier)
-            except Exception as e:
-                remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
-                continue
+        targets, remote_sync_errors = await resolve_remote_targets(db, subs, node_map, user)
+        reset_ok, call_errors = await run_remote_calls(
+            targets, lambda s, _n, adapter: adapter.reset_usage(s.remote_identifier)
+        )
+        remote_sync_errors += call_errors
+        for s, _n in reset_ok:
             s.used_bytes = 0
 
     raise_remote_sync_failed("Reset usage", remote_sync_errors)
 
     user.used_bytes = 0
     await db.commit()
+    await invalidate_subscription_cache(user.master_sub_token)
     return OpResult(ok=True, charged_amount=0, refunded_amount=0, new_balance=reseller.balance, user_id=user.id)
 
 
@@ -874,6 +787,7 @@ async def revoke_user_subscription(user_id: int, db: AsyncSession = Depends(get_
     user = q.scalar_one_or_none()
     if not user or user.status == UserStatus.deleted:
         raise HTTPException(status_code=404, detail="User not found")
+    await ensure_user_idle(db, user.id)
 
     qs_sub = await db.execute(select(SubAccount).where(SubAccount.user_id == user.id))
     subs = qs_sub.scalars().all()
@@ -883,31 +797,28 @@ async def revoke_user_subscription(user_id: int, db: AsyncSession = Depends(get_
     qn = await db.execute(select(Node).where(Node.id.in_([s.node_id for s in subs])))
     node_map = {n.id: n for n in qn.scalars().all()}
     now = _now()
-    remote_sync_errors: list[str] = []
 
     # Revoke across all nodes and fail if any remote call fails.
-    for s in subs:
-        n = node_map.get(s.node_id)
-        if not n:
-            remote_sync_errors.append(f"node#{s.node_id}: node not found")
-            continue
-        try:
-            adapter = await get_adapter_for_subaccount(db, s, n, user)
-            pr = await adapter.revoke_subscription(label=user.label, remote_identifier=s.remote_identifier, total_gb=int(user.total_gb), expire_at=user.expire_at)
-            # WGDashboard may return a NEW identifier.
-            s.remote_identifier = pr.remote_identifier
-            if pr.direct_sub_url:
-                s.panel_sub_url_cached = normalize_url(pr.direct_sub_url, n.base_url) or pr.direct_sub_url
-                s.panel_sub_url_cached_at = now
-        except Exception as e:
-            remote_sync_errors.append(f"node#{s.node_id}: {short_error(e)}")
+    targets, remote_sync_errors = await resolve_remote_targets(db, subs, node_map, user)
+
+    async def revoke(s: SubAccount, n: Node, adapter) -> None:
+        pr = await adapter.revoke_subscription(label=user.label, remote_identifier=s.remote_identifier, total_gb=int(user.total_gb), expire_at=user.expire_at)
+        # WGDashboard may return a NEW identifier.
+        s.remote_identifier = pr.remote_identifier
+        if pr.direct_sub_url:
+            s.panel_sub_url_cached = normalize_url(pr.direct_sub_url, n.base_url) or pr.direct_sub_url
+            s.panel_sub_url_cached_at = now
+
+    _done, call_errors = await run_remote_calls(targets, revoke)
+    remote_sync_errors += call_errors
 
     raise_remote_sync_failed("Revoke subscription", remote_sync_errors)
 
     # Rotate master subscription token as well so old central link is invalidated.
     old_master_sub_token = user.master_sub_token
     user.master_sub_token = await _new_unique_master_sub_token(db)
-    await remember_revoked_master_sub_token(db, old_master_sub_token)
+    await remember_revoked_master_sub_token(db, old_master_sub_token, user_id=user.id)
 
     await db.commit()
+    await invalidate_subscription_cache(old_master_sub_token, drop_stale=True)
     return OpResult(ok=True, charged_amount=0, refunded_amount=0, new_balance=reseller.balance, user_id=user.id, detail="master_sub_rotated=1")
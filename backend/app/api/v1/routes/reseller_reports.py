@@ -8,6 +8,7 @@ from app.api.deps import require_reseller
 from app.core.db import get_db
 from app.models.ledger import LedgerTransaction
 from app.models.order import Order, OrderStatus
+from app.services.pagination import COUNT_MODE_PATTERN, count_rows, default_count_mode, fetch_page
 
 router = APIRouter()
 
@@ -66,18 +67,25 @@ async def reseller_ledger(
     reseller=Depends(require_reseller),
     offset: int = Query(0, ge=0),
     limit: int = Query(200, ge=1, le=1000),
+    cursor: str | None = Query(default=None, max_length=200),
+    count: str | None = Query(default=None, pattern=COUNT_MODE_PATTERN),
 ):
     stmt = (
         select(LedgerTransaction)
         .where(LedgerTransaction.reseller_id == reseller.id)
         .order_by(desc(LedgerTransaction.id))
     )
-    total_q = await db.execute(select(func.count()).select_from(stmt.subquery()))
-    total = int(total_q.scalar_one())
-    q = await db.execute(stmt.limit(limit).offset(offset))
+    mode = default_count_mode(count, cursor)
+    # The summary already counts every matching row; reuse it for an exact total.
+    summary = await _ledger_summary(db, reseller.id) if mode != "none" else None
+    if summary is not None and mode == "exact":
+        total = summary["count"]
+    else:
+        total = await count_rows(db, stmt, mode=mode, scope=f"reseller:ledger:{reseller.id}")
+    rows, next_cursor = await fetch_page(db, stmt, id_column=LedgerTransaction.id, limit=limit, offset=offset, cursor=cursor)
 
     items = []
-    for t in q.scalars().all():
+    for t in rows:
         items.append(
             {
                 "id": t.id,
@@ -89,7 +97,7 @@ async def reseller_ledger(
                 "occurred_at": t.occurred_at.isoformat() if t.occurred_at else None,
             }
         )
-    return {"items": items, "total": total, "summary": await _ledger_summary(db, reseller.id)}
+    return {"items": items, "total": total, "next_cursor": next_cursor, "summary": summary}
 
 
 @router.get("/orders")
@@ -98,18 +106,25 @@ async def reseller_orders(
     reseller=Depends(require_reseller),
     offset: int = Query(0, ge=0),
     limit: int = Query(200, ge=1, le=1000),
+    cursor: str | None = Query(default=None, max_length=200),
+    count: str | None = Query(default=None, pattern=COUNT_MODE_PATTERN),
 ):
     stmt = (
         select(Order)
         .where(Order.reseller_id == reseller.id)
         .order_by(desc(Order.id))
     )
-    total_q = await db.execute(select(func.count()).select_from(stmt.subquery()))
-    total = int(total_q.scalar_one())
-    q = await db.execute(stmt.limit(limit).offset(offset))
+    mode = default_count_mode(count, cursor)
+    # The summary already counts every matching row; reuse it for an exact total.
+    summary = await _orders_summary(db, reseller.id) if mode != "none" else None
+    if summary is not None and mode == "exact":
+        total = summary["total"]
+    else:
+        total = await count_rows(db, stmt, mode=mode, scope=f"reseller:orders:{reseller.id}")
+    rows, next_cursor = await fetch_page(db, stmt, id_column=Order.id, limit=limit, offset=offset, cursor=cursor)
 
     items = []
-    for o in q.scalars().all():
+    for o in rows:
         items.append(
             {
                 "id": o.id,
@@ -123,4 +138,4 @@ async def reseller_orders(
                 "created_at": o.created_at.isoformat() if o.created_at else None,
             }
         )
-    return {"items": items, "total": total, "summary": await _orders_summary(db, reseller.id)}
+    return {"items": items, "total": total, "next_cursor": next_cursor, "summary": summary}
@@ -13,18 +13,16 @@ from app.api.deps import require_reseller
 from app.models.user import GuardinoUser
 from app.models.node_allocation import NodeAllocation
 from app.models.node import Node
-from app.models.order import Order, OrderStatus
-from app.models.ledger import LedgerTransaction
 from app.models.dashboard_metric import DashboardDailyMetric
 from app.schemas.stats import ResellerStats
 from app.services.dashboard_metrics import (
     BYTES_PER_GB,
     accounted_user_condition,
-    build_daily_series,
     build_daily_snapshot_series,
     set_today_series_value,
     summarize_users_query,
 )
+from app.services.dashboard_rollups import activity_series, activity_totals
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -68,40 +66,8 @@ async def get_reseller_stats(
     )
     nodes_allowed = int(nq.scalar_one() or 0)
 
-    oq = await db.execute(select(func.count()).select_from(Order).where(Order.reseller_id == reseller.id))
-    orders_total = int(oq.scalar_one() or 0)
-    oq30 = await db.execute(
-        select(func.count()).select_from(Order).where(Order.reseller_id == reseller.id, Order.created_at >= since)
-    )
-    orders_30d = int(oq30.scalar_one() or 0)
-
-    lq = await db.execute(
-        select(func.coalesce(func.sum(-LedgerTransaction.amount), 0)).where(
-            LedgerTransaction.reseller_id == reseller.id,
-            LedgerTransaction.amount < 0,
-            LedgerTransaction.occurred_at >= since,
-        )
-    )
-    spent_30d = int(lq.scalar_one() or 0)
-
-    order_series_rows = (
-        await db.execute(
-            select(Order.created_at, Order.purchased_gb).where(
-                Order.reseller_id == reseller.id,
-                Order.created_at >= series_since,
-                Order.status == OrderStatus.completed,
-            )
-        )
-    ).all()
-    ledger_series_rows = (
-        await db.execute(
-            select(LedgerTransaction.occurred_at, LedgerTransaction.amount).where(
-                LedgerTransaction.reseller_id == reseller.id,
-                LedgerTransaction.occurred_at >= series_since,
-                LedgerTransaction.amount < 0,
-            )
-        )
-    ).all()
+    activity = await activity_totals(db, reseller_id=reseller.id, since_day=since.date())
+    activity_rows = await activity_series(db, reseller_id=reseller.id, since_day=series_since.date())
     try:
         metric_series_rows = (
             await db.execute(
@@ -149,10 +115,12 @@ async def get_reseller_stats(
         used_bytes_total=used_bytes_total,
         sold_gb_total=sold_gb_total,
         nodes_allowed=nodes_allowed,
-        orders_total=orders_total,
-        orders_30d=orders_30d,
-        spent_30d=spent_30d,
-        daily_sales=build_daily_series(ledger_series_rows, lambda row: row.occurred_at, lambda row: abs(row.amount), days),
-        daily_traffic_gb=build_daily_series(order_series_rows, lambda row: row.created_at, lambda row: row.purchased_gb or 0, days),
+        orders_total=activity["orders_total"],
+        orders_30d=activity["orders_recent"],
+        spent_30d=activity["spent_recent"],
+        daily_sales=build_daily_snapshot_series(activity_rows, lambda row: row.day, lambda row: row.spent, days, now.date()),
+        daily_traffic_gb=build_daily_snapshot_series(
+            activity_rows, lambda row: row.day, lambda row: row.traffic_gb, days, now.date()
+        ),
         daily_used_gb=daily_used_gb,
     )
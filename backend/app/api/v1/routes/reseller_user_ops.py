@@ -13,14 +13,16 @@ from app.models.reseller import Reseller
 from app.models.user import GuardinoUser, NodeSelectionMode
 from app.models.subaccount import SubAccount
 from app.models.order import Order, OrderType, OrderStatus
-from app.models.ledger import LedgerTransaction
 from app.services.billing import lock_reseller_for_billing
 from app.services.pricing import resolve_allowed_nodes, calculate_price
+from app.services.expiry_schedule import schedule_user_expiry
 from app.services.order_replay import existing_create_user_response
-from app.services.panel_access import get_adapter_for_allocation, get_enabled_allocation_map
+from app.services.panel_access import get_enabled_allocation_map
+from app.services.provisioning import NodeProvisionOutcome, provision_on_nodes, undo_provisioning
 from app.services.urls import normalize_url
+from app.services.wallet import capture_hold, release_on_error, reserve_funds
 from app.services.user_inputs import resolve_days, sanitize_username, random_username
-from app.schemas.reseller_user_ops import CreateUserRequest, CreateUserResponse, PriceQuoteResponse
+from app.schemas.reseller_user_ops import CreateUserRequest, CreateUserResponse, NodeProvisionResult, PriceQuoteResponse
 from app.services.reseller_user_policy import (
     get_effective_user_policy,
 )
@@ -111,9 +113,6 @@ async def create_user(
 
     estimated_amount, per_node, time_amount = await calculate_price(db, reseller, nodes, payload.total_gb, days_final, pricing_mode=payload.pricing_mode)
 
-    if reseller.balance < estimated_amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
     order = Order(
         reseller_id=reseller.id,
         user_id=None,
@@ -133,6 +132,9 @@ async def create_user(
             if replay:
                 return replay
         raise HTTPException(status_code=409, detail="request_id is already in use.")
+    # Hold the estimate and release the reseller lock before any panel call.
+    hold = await reserve_funds(db, reseller, order, amount=estimated_amount)
+    await db.commit()
 
     now = datetime.now(timezone.utc)
     # For "unlimited" we keep a long local expiry timestamp for internal sorting/filters.
@@ -141,121 +143,121 @@ async def create_user(
 
     create_status = "on_hold" if str(payload.create_status or "").strip().lower() == "on_hold" else "active"
 
-    user = GuardinoUser(
-        owner_reseller_id=reseller.id,
-        label=remote_label,
-        total_gb=payload.total_gb,
-        used_bytes=0,
-        expire_at=expire_at,
-        master_sub_token=token,
-        node_selection_mode=NodeSelectionMode.group if payload.node_group else NodeSelectionMode.manual,
-        node_group=payload.node_group,
-        meta={
-            "requested_node_ids": payload.node_ids,
-            "requested_node_group": payload.node_group,
-            "remote_label": remote_label,
-            "create_status": create_status,
-            "no_expire": bool(int(days_final) == 0),
-            "request_id": request_id,
-        },
-    )
-    db.add(user)
-    await db.flush()
-
     provisioned: list[int] = []
     provisioned_nodes = []
-    provisioned_remote = []
+    outcomes: list[NodeProvisionOutcome] = []
     provision_errors: list[str] = []
     committed = False
-    try:
-        for n in nodes:
-            try:
-                allocation = allocation_map.get(n.id)
-                adapter = get_adapter_for_allocation(n, allocation)
-                panel_username = _panel_username(remote_label)
-                pr = await adapter.provision_user(
-                    label=panel_username,
-                    total_gb=payload.total_gb,
-                    expire_at=expire_at,
-                    status=create_status,
-                )
-                provisioned_remote.append((n, allocation, pr.remote_identifier))
-            except Exception as e:
-                provision_errors.append(f"node#{n.id}: {str(e).strip()[:160]}")
-                continue
-            direct_url = normalize_url(pr.direct_sub_url, n.base_url)
-            sa = SubAccount(
-                user_id=user.id,
-                node_id=n.id,
-                allocation_id=allocation.id if allocation else None,
-                remote_identifier=pr.remote_identifier,
-                panel_sub_url_cached=direct_url,
-                panel_sub_url_cached_at=now if direct_url else None,
-                used_bytes=0,
-                last_sync_at=None,
+    async with release_on_error(db, hold):
+        try:
+            outcomes = await provision_on_nodes(
+                nodes,
+                allocation_map,
+                label=_panel_username(remote_label),
+                total_gb=payload.total_gb,
+                expire_at=expire_at,
+                status=create_status,
             )
-            db.add(sa)
-            provisioned.append(n.id)
-            provisioned_nodes.append(n)
+            for outcome in outcomes:
+                if outcome.ok:
+                    provisioned.append(outcome.node.id)
+                    provisioned_nodes.append(outcome.node)
+                else:
+                    provision_errors.append(f"node#{outcome.node.id}: {outcome.error}")
+
+            if not provisioned_nodes:
+                sample = " | ".join(provision_errors[:3])
+                raise HTTPException(status_code=502, detail=f"Provision failed on all selected nodes: {sample}")
 
-        if not provisioned_nodes:
-            raise HTTPException(status_code=502, detail="Provision failed on all selected nodes")
+            # Only the nodes that were actually provisioned are billed; this is
+            # never more than the held estimate.
+            total_amount, per_node, time_amount = await calculate_price(
+                db,
+                reseller,
+                provisioned_nodes,
+                payload.total_gb,
+                days_final,
+                pricing_mode=payload.pricing_mode,
+            )
 
-        total_amount, per_node, time_amount = await calculate_price(
-            db,
-            reseller,
-            provisioned_nodes,
-            payload.total_gb,
-            days_final,
-            pricing_mode=payload.pricing_mode,
-        )
-        if reseller.balance < total_amount:
-            raise HTTPException(status_code=400, detail="Insufficient balance")
+            user = GuardinoUser(
+                owner_reseller_id=reseller.id,
+                label=remote_label,
+                total_gb=payload.total_gb,
+                used_bytes=0,
+                expire_at=expire_at,
+                master_sub_token=token,
+                node_selection_mode=NodeSelectionMode.group if payload.node_group else NodeSelectionMode.manual,
+                node_group=payload.node_group,
+                meta={
+                    "requested_node_ids": payload.node_ids,
+                    "requested_node_group": payload.node_group,
+                    "remote_label": remote_label,
+                    "create_status": create_status,
+                    "no_expire": bool(int(days_final) == 0),
+                    "request_id": request_id,
+                },
+            )
+            if provision_errors:
+                user.meta = {**(user.meta or {}), "provision_errors": provision_errors}
+            db.add(user)
+            await db.flush()
 
-        if provision_errors:
-            user.meta = {**(user.meta or {}), "provision_errors": provision_errors}
+            for outcome in outcomes:
+                if not outcome.ok:
+                    continue
+                n, allocation, pr = outcome.node, outcome.allocation, outcome.result
+                direct_url = normalize_url(pr.direct_sub_url, n.base_url)
+                db.add(
+                    SubAccount(
+                        user_id=user.id,
+                        node_id=n.id,
+                        allocation_id=allocation.id if allocation else None,
+                        remote_identifier=pr.remote_identifier,
+                        panel_sub_url_cached=direct_url,
+                        panel_sub_url_cached_at=now if direct_url else None,
+                        used_bytes=0,
+                        last_sync_at=None,
+                    )
+                )
 
-        reseller.balance -= total_amount
-        ledger = LedgerTransaction(
-            reseller_id=reseller.id,
-            order_id=order.id,
-            client_request_id=request_id,
-            amount=-total_amount,
-            reason="user_create",
-            balance_after=reseller.balance,
-            occurred_at=now,
-        )
-        db.add(ledger)
+            reseller, _ledger = await capture_hold(
+                db,
+                hold,
+                amount=-total_amount,
+                reason="user_create",
+                request_id=request_id,
+                occurred_at=now,
+            )
 
-        order.user_id = user.id
-        order.status = OrderStatus.completed
+            order.user_id = user.id
+            order.status = OrderStatus.completed
 
-        subscription_url = str(request.base_url).rstrip("/") + f"/api/v1/sub/{user.master_sub_token}"
-        response = CreateUserResponse(
-            user_id=user.id,
-            label=user.label,
-            order_id=order.id,
-            request_id=request_id,
-            master_sub_token=user.master_sub_token,
-            subscription_url=subscription_url,
-            expire_at=user.expire_at,
-            charged_amount=total_amount,
-            balance_after=reseller.balance,
-            nodes_provisioned=provisioned,
-        )
-        await db.commit()
-        committed = True
-        return response
-    except Exception:
-        await db.rollback()
-        if not committed:
-            cleanup_errors: list[str] = []
-            for node, allocation, remote_identifier in reversed(provisioned_remote):
-                try:
-                    cleanup_adapter = get_adapter_for_allocation(node, allocation)
-                    await cleanup_adapter.delete_user(remote_identifier)
-                except Exception as cleanup_exc:
-                    cleanup_errors.append(f"node#{node.id}: {str(cleanup_exc).strip()[:160]}")
-            if cleanup_errors:
-                logger.error("create user remote rollback incomplete errors=%s", cleanup_errors)
-        raise
+            subscription_url = str(request.base_url).rstrip("/") + f"/api/v1/sub/{user.master_sub_token}"
+            response = CreateUserResponse(
+                user_id=user.id,
+                label=user.label,
+                order_id=order.id,
+                request_id=request_id,
+                master_sub_token=user.master_sub_token,
+                subscription_url=subscription_url,
+                expire_at=user.expire_at,
+                charged_amount=total_amount,
+                balance_after=reseller.balance,
+                nodes_provisioned=provisioned,
+                node_results=[
+                    NodeProvisionResult(node_id=o.node.id, ok=o.ok, error=o.error) for o in outcomes
+                ],
+            )
+            await db.commit()
+            committed = True
+        except Exception:
+            # Remote cleanup runs before the hold is released (which rolls the
+            # session back and expires the loaded nodes).
+            if not committed:
+                cleanup_errors = await undo_provisioning(outcomes)
+                if cleanup_errors:
+                    logger.error("create user remote rollback incomplete errors=%s", cleanup_errors)
+            raise
+    await schedule_user_expiry(user)
+    return response
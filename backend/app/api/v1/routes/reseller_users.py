@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, Request, Query, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import BigInteger, and_, cast, func, not_, or_, select
+from sqlalchemy import BigInteger, and_, cast, func, not_, select
 from datetime import datetime, timezone
 from app.core.db import get_db
 from app.api.deps import require_reseller, enforce_balance_or_readonly_users
 from app.models.user import GuardinoUser, UserStatus
 from app.schemas.user import UsersPage, UserOut
+from app.services.pagination import COUNT_MODE_PATTERN, count_rows, default_count_mode, fetch_page
+from app.services.user_search import apply_user_search
 
 router = APIRouter()
 
@@ -25,6 +27,8 @@ async def list_users(
     reseller = Depends(require_reseller),
     offset: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = Query(default=None, max_length=200),
+    count: str | None = Query(default=None, pattern=COUNT_MODE_PATTERN),
     q: str | None = Query(default=None, max_length=128),
     status: str | None = Query(default=None, pattern="^(all|active|disabled|expired|limited|on_hold)$"),
 ):
@@ -39,11 +43,10 @@ async def list_users(
         .order_by(GuardinoUser.id.desc())
     )
     term = (q or "").strip()
+    # Search results are ranked by relevance unless the client pages with a cursor.
+    ranked = bool(term) and not cursor
     if term:
-        conditions = [GuardinoUser.label.ilike(f"%{term}%")]
-        if term.isdigit():
-            conditions.append(GuardinoUser.id == int(term))
-        base = base.where(or_(*conditions))
+        base = await apply_user_search(db, base, term, ranked=ranked)
     status_filter = (status or "all").strip().lower()
     now = datetime.now(timezone.utc)
     create_status = func.coalesce(GuardinoUser.meta["create_status"].as_string(), "")
@@ -69,9 +72,21 @@ async def list_users(
         base = base.where(limited_cond, not_(expired_cond))
     elif status_filter == "on_hold":
         base = base.where(on_hold_cond, not_(expired_cond), not_(limited_cond))
-    total_q = await db.execute(select(func.count()).select_from(base.subquery()))
-    total = int(total_q.scalar_one())
-    q = await db.execute(base.limit(limit).offset(offset))
+    total = await count_rows(
+        db,
+        base,
+        mode=default_count_mode(count, cursor),
+        scope=f"users:{reseller.id}:{status_filter}:{term}",
+    )
+    rows, next_cursor = await fetch_page(
+        db,
+        base,
+        id_column=GuardinoUser.id,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        keyset=not ranked,
+    )
     items = [
         UserOut(
             id=u.id,
@@ -82,9 +97,9 @@ async def list_users(
             status=u.status.value,
             create_status=_create_status_for(u),
         )
-        for u in q.scalars().all()
+        for u in rows
     ]
-    return UsersPage(items=items, total=total)
+    return UsersPage(items=items, total=total, next_cursor=next_cursor)
 
 
 @router.get("/{user_id}", response_model=UserOut)
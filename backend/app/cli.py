@@ -1,5 +1,7 @@
 import argparse
 import asyncio
+from datetime import date
+from functools import partial
 from sqlalchemy import select
 from app.core.db import AsyncSessionLocal
 from app.core.security import hash_password
@@ -7,7 +9,10 @@ from app.models.node import Node, PanelType
 from app.models.reseller import Reseller
 from app.models.subaccount import SubAccount
 from app.models.user import GuardinoUser, UserStatus
-from app.services.panel_access import get_adapter_for_subaccount
+from app.services.adapters.bulk import disable_many, run_per_user, update_limits_many
+from app.services.dashboard_rollups import rebuild_daily_activity
+from app.services.http_client import closing_shared_clients
+from app.services.panel_access import load_adapter_resolver
 
 async def create_superadmin(username: str, password: str):
     async with AsyncSessionLocal() as db:
@@ -54,7 +59,13 @@ async def reconcile_wg_jobs(batch_size: int = 500, include_inactive: bool = Fals
             if not rows:
                 break
 
-            adapters: dict[tuple[int, int | None], object] = {}
+            resolver = await load_adapter_resolver(
+                db,
+                [sub for sub, _user, _node in rows],
+                users=[user for _sub, user, _node in rows],
+                node_map={node.id: node for _sub, _user, node in rows},
+            )
+            groups: dict[int, tuple[object, list[tuple[SubAccount, GuardinoUser, Node]]]] = {}
             for sub, user, node in rows:
                 scanned += 1
 
@@ -65,31 +76,45 @@ async def reconcile_wg_jobs(batch_size: int = 500, include_inactive: bool = Fals
                     skipped += 1
                     continue
 
-                adapter_key = (node.id, int(sub.allocation_id) if sub.allocation_id else None)
-                adapter = adapters.get(adapter_key)
-                if adapter is None:
-                    try:
-                        adapter = await get_adapter_for_subaccount(db, sub, node, user)
-                    except Exception as e:
-                        failed += 1
-                        if error_budget > 0:
-                            print(f"[ERR] adapter init failed node_id={node.id}: {e}")
-                            error_budget -= 1
-                        continue
-                    adapters[adapter_key] = adapter
+                try:
+                    adapter = resolver.adapter_for(sub, node)
+                except Exception as e:
+                    failed += 1
+                    if error_budget > 0:
+                        print(f"[ERR] adapter init failed node_id={node.id}: {e}")
+                        error_budget -= 1
+                    continue
 
                 if dry_run:
                     synced += 1
                     continue
+                groups.setdefault(id(adapter), (adapter, []))[1].append((sub, user, node))
 
-                try:
-                    await adapter.update_user_limits(sub.remote_identifier, int(user.total_gb), user.expire_at)
-                    if user.status == UserStatus.active:
-                        await adapter.enable_user(sub.remote_identifier)
-                    else:
-                        await adapter.disable_user(sub.remote_identifier)
-                    synced += 1
-                except Exception as e:
+            # Per panel login: limits for the whole batch in one bulk call, then
+            # status for the peers whose limits were written.
+            for adapter, items in groups.values():
+                errors = await update_limits_many(
+                    adapter, [(sub.remote_identifier, int(user.total_gb), user.expire_at) for sub, user, _node in items]
+                )
+                written = [(sub, user) for sub, user, _node in items if str(sub.remote_identifier).strip() not in errors]
+                errors.update(
+                    await disable_many(adapter, [sub.remote_identifier for sub, user in written if user.status != UserStatus.active])
+                )
+                errors.update(
+                    await run_per_user(
+                        adapter,
+                        {
+                            str(sub.remote_identifier).strip(): partial(adapter.enable_user, sub.remote_identifier)
+                            for sub, user in written
+                            if user.status == UserStatus.active
+                        },
+                    )
+                )
+                for sub, user, node in items:
+                    e = errors.get(str(sub.remote_identifier).strip())
+                    if e is None:
+                        synced += 1
+                        continue
                     failed += 1
                     if error_budget > 0:
                         print(
@@ -109,6 +134,90 @@ async def reconcile_wg_jobs(batch_size: int = 500, include_inactive: bool = Fals
     )
 
 
+async def backfill_rollups(since: date | None = None):
+    """Recompute dashboard_daily_activity from orders and ledger_transactions."""
+    async with AsyncSessionLocal() as db:
+        rows = await rebuild_daily_activity(db, since=since)
+        await db.commit()
+    scope = since.isoformat() if since else "all"
+    print(f"[ROLLUP-BACKFILL] since={scope} buckets={rows}")
+
+
+async def check_indexes(users: int = 50000, resellers: int = 20):
+    from app.devtools.explain_check import run_index_check
+
+    if not await run_index_check(users=users, resellers=resellers):
+        raise SystemExit(1)
+
+
+async def bench_provision(nodes: int = 6, latency_ms: int = 150, rounds: int = 10):
+    from app.devtools.provision_bench import run_provision_benchmark
+
+    await run_provision_benchmark(nodes=nodes, latency_ms=latency_ms, rounds=rounds)
+
+
+async def bench_usage_sync(**kwargs):
+    from app.devtools.usage_bench import run_usage_benchmark
+
+    await run_usage_benchmark(**kwargs)
+
+
+async def load_test(**kwargs):
+    from app.devtools.load_test import run_load_test
+
+    await run_load_test(**kwargs)
+
+
+async def fake_panel(
+    panel: str,
+    host: str = "127.0.0.1",
+    port: int = 8800,
+    users: int = 0,
+    apikey: str = "sim",
+    configurations: str = "wg0",
+    latency_ms: int = 0,
+    jitter_ms: int = 0,
+    error_rate: float = 0.0,
+    not_found_rate: float = 0.0,
+    max_page_size: int | None = None,
+    omit_total: bool = False,
+    ignore_offset: bool = False,
+    seed: int | None = None,
+):
+    from app.devtools.fake_panels import (
+        Faults,
+        UserStore,
+        WGState,
+        marzban_app,
+        pasarguard_app,
+        serve_panel,
+        wg_dashboard_app,
+    )
+
+    faults = Faults(
+        latency=max(0, latency_ms) / 1000.0,
+        jitter=max(0, jitter_ms) / 1000.0,
+        error_rate=max(0.0, error_rate),
+        not_found_rate=max(0.0, not_found_rate),
+        max_page_size=max_page_size,
+        omit_total=omit_total,
+        ignore_offset=ignore_offset,
+        seed=seed,
+    )
+    if panel == "wg_dashboard":
+        state = WGState(tuple(n.strip() for n in configurations.split(",") if n.strip()) or ("wg0",), seed=seed)
+        state.seed(users)
+        app = wg_dashboard_app(state, faults, apikey=apikey)
+        creds = f'{{"apikey": "{apikey}"}}'
+    else:
+        store = UserStore(seed=seed)
+        store.seed(users)
+        app = (marzban_app if panel == "marzban" else pasarguard_app)(store, faults)
+        creds = '{"username": "admin", "password": "admin"}'
+    print(f"[FAKE-PANEL] {panel} http://{host}:{port} users={users} credentials={creds}")
+    await serve_panel(app, host=host, port=port)
+
+
 def main():
     parser = argparse.ArgumentParser()
     sub = parser.add_subparsers(dest="cmd")
@@ -122,15 +231,152 @@ def main():
     r.add_argument("--include-inactive", action="store_true")
     r.add_argument("--dry-run", action="store_true")
 
+    b = sub.add_parser("backfill-rollups")
+    b.add_argument("--since", type=date.fromisoformat, default=None, help="YYYY-MM-DD; default: all history")
+
+    x = sub.add_parser("check-indexes", help="EXPLAIN user scans on seeded data (rolled back)")
+    x.add_argument("--users", type=int, default=50000)
+    x.add_argument("--resellers", type=int, default=20)
+
+    bp = sub.add_parser("bench-provision", help="Sequential vs concurrent provisioning against local fake panels")
+    bp.add_argument("--nodes", type=int, default=6)
+    bp.add_argument("--latency-ms", type=int, default=150)
+    bp.add_argument("--rounds", type=int, default=10)
+
+    bu = sub.add_parser("bench-usage-sync", help="Usage sync and expiry scan on seeded data against local fake panels")
+    bu.add_argument("--users", type=int, default=10000)
+    bu.add_argument("--resellers", type=int, default=20)
+    bu.add_argument("--nodes", type=int, default=6)
+    bu.add_argument("--subs-per-user", type=int, default=2)
+    bu.add_argument("--panels", default="marzban,pasarguard,wg_dashboard", help="panel types assigned to nodes round-robin")
+    bu.add_argument("--latency-ms", type=int, default=20)
+    bu.add_argument("--expired-percent", type=int, default=1, help="share of users already past expiry")
+    bu.add_argument("--cycles", type=int, default=2, help="usage sync runs, with new traffic between them")
+    bu.add_argument("--traffic-mb", type=int, default=500, help="max new traffic per subaccount between cycles")
+    bu.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE", help="override a setting")
+    bu.add_argument("--output", default="usage-bench.json")
+    bu.add_argument("--baseline", default=None, help="earlier --output file to compare with")
+    bu.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    bu.add_argument("--seed", type=int, default=1)
+
+    lt = sub.add_parser("load-test", help="Drive subscription/reseller API scenarios against local fake panels")
+    lt.add_argument(
+        "--scenario",
+        action="append",
+        default=[],
+        help="client-polling-storm, bot-bulk-creation, dashboard-refresh or all (repeatable)",
+    )
+    lt.add_argument("--duration", type=float, default=30.0, help="seconds per scenario")
+    lt.add_argument("--concurrency", type=int, default=None, help="override the scenario's concurrent clients")
+    lt.add_argument("--users", type=int, default=200, help="users created through the API before the scenarios")
+    lt.add_argument("--panels", default="marzban,pasarguard,wg_dashboard", help="one fake node per entry")
+    lt.add_argument("--latency-ms", type=int, default=30)
+    lt.add_argument("--base-url", default=None, help="target an already running app instead of serving one in-process")
+    lt.add_argument("--output", default=None)
+
+    fp = sub.add_parser("fake-panel", help="Serve a simulated Marzban/PasarGuard/WGDashboard panel")
+    fp.add_argument("--panel", choices=["marzban", "pasarguard", "wg_dashboard"], required=True)
+    fp.add_argument("--host", default="127.0.0.1")
+    fp.add_argument("--port", type=int, default=8800)
+    fp.add_argument("--users", type=int, default=0, help="synthetic users/peers to seed")
+    fp.add_argument("--apikey", default="sim", help="WGDashboard API key")
+    fp.add_argument("--configurations", default="wg0", help="WGDashboard configuration names, comma separated")
+    fp.add_argument("--latency-ms", type=int, default=0)
+    fp.add_argument("--jitter-ms", type=int, default=0)
+    fp.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 503")
+    fp.add_argument("--not-found-rate", type=float, default=0.0, help="chance a per-user request starts a 404 burst")
+    fp.add_argument("--max-page-size", type=int, default=None, help="clamp list page size")
+    fp.add_argument("--omit-total", action="store_true", help="list endpoints return a bare array")
+    fp.add_argument("--ignore-offset", action="store_true", help="list endpoints always return the first page")
+    fp.add_argument("--seed", type=int, default=None)
+
     args = parser.parse_args()
     if args.cmd == "create-superadmin":
         asyncio.run(create_superadmin(args.username, args.password))
     elif args.cmd == "reconcile-wg":
         asyncio.run(
-            reconcile_wg_jobs(
-                batch_size=args.batch_size,
-                include_inactive=args.include_inactive,
-                dry_run=args.dry_run,
+            closing_shared_clients(
+                reconcile_wg_jobs(
+                    batch_size=args.batch_size,
+                    include_inactive=args.include_inactive,
+                    dry_run=args.dry_run,
+                )
+            )
+        )
+    elif args.cmd == "backfill-rollups":
+        asyncio.run(backfill_rollups(since=args.since))
+    elif args.cmd == "check-indexes":
+        asyncio.run(check_indexes(users=args.users, resellers=args.resellers))
+    elif args.cmd == "bench-provision":
+        asyncio.run(
+            closing_shared_clients(bench_provision(nodes=args.nodes, latency_ms=args.latency_ms, rounds=args.rounds))
+        )
+    elif args.cmd == "bench-usage-sync":
+        panels = tuple(p.strip() for p in args.panels.split(",") if p.strip())
+        unknown = [p for p in panels if p not in {t.value for t in PanelType}]
+        if not panels or unknown:
+            parser.error(f"--panels: unknown panel type(s) {', '.join(unknown) or '(none given)'}")
+        asyncio.run(
+            closing_shared_clients(
+                bench_usage_sync(
+                    users=args.users,
+                    resellers=args.resellers,
+                    nodes=args.nodes,
+                    subs_per_user=args.subs_per_user,
+                    panels=panels,
+                    latency_ms=args.latency_ms,
+                    expired_percent=args.expired_percent,
+                    cycles=args.cycles,
+                    traffic_mb=args.traffic_mb,
+                    overrides=args.overrides,
+                    output=args.output,
+                    baseline=args.baseline,
+                    keep=args.keep,
+                    seed=args.seed,
+                )
+            )
+        )
+    elif args.cmd == "load-test":
+        from app.devtools.load_test import SCENARIOS
+
+        scenarios = list(SCENARIOS) if "all" in args.scenario else args.scenario
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if not scenarios or unknown:
+            parser.error(f"--scenario: choose from {', '.join(SCENARIOS)} or all")
+        panels = tuple(p.strip() for p in args.panels.split(",") if p.strip())
+        if not panels or any(p not in {t.value for t in PanelType} for p in panels):
+            parser.error("--panels: expected marzban, pasarguard and/or wg_dashboard")
+        asyncio.run(
+            closing_shared_clients(
+                load_test(
+                    scenarios=scenarios,
+                    duration=args.duration,
+                    concurrency=args.concurrency,
+                    users=args.users,
+                    panels=panels,
+                    latency_ms=args.latency_ms,
+                    base_url=args.base_url,
+                    output=args.output,
+                )
+            )
+        )
+    elif args.cmd == "fake-panel":
+        asyncio.run(
+            fake_panel(
+                args.panel,
+                host=args.host,
+                port=args.port,
+                users=args.users,
+                apikey=args.apikey,
+                configurations=args.configurations,
+                latency_ms=args.latency_ms,
+                jitter_ms=args.jitter_ms,
+                error_rate=args.error_rate,
+                not_found_rate=args.not_found_rate,
+                max_page_size=args.max_page_size,
+                omit_total=args.omit_total,
+                ignore_offset=args.ignore_offset,
+                seed=args.seed,
             )
         )
     else:
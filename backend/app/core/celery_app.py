@@ -1,6 +1,6 @@
 from __future__ import annotations
 from celery import Celery
-from celery.signals import worker_ready
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_ready
 import logging
 from app.core.config import settings
 
@@ -17,12 +17,19 @@ celery_app.conf.timezone = "UTC"
 
 usage_every = max(30, min(3600, int(getattr(settings, "USAGE_SYNC_SECONDS", 60) or 60)))
 expiry_every = max(30, min(3600, int(getattr(settings, "EXPIRY_SYNC_SECONDS", 60) or 60)))
+expiry_scheduler_every = max(1, min(60, int(getattr(settings, "EXPIRY_SCHEDULER_SECONDS", 5) or 5)))
 
 celery_app.conf.beat_schedule = {
     "expire_users_every_interval": {
         "task": "app.tasks.expiry.expire_due_users",
         "schedule": float(expiry_every),
     },
+    "expire_scheduled_users_every_interval": {
+        "task": "app.tasks.expiry.expire_scheduled_users",
+        "schedule": float(expiry_scheduler_every),
+        # A missed tick is superseded by the next one a few seconds later.
+        "options": {"expires": float(expiry_scheduler_every)},
+    },
     "sync_usage_every_interval": {
         "task": "app.tasks.usage.sync_usage",
         "schedule": float(usage_every),
@@ -30,6 +37,28 @@ celery_app.conf.beat_schedule = {
 }
 
 
+@worker_init.connect
+def _reset_metrics_dir(**kwargs):
+    # Runs in the main process before the pool forks.
+    from app.core.metrics import reset_multiprocess_dir
+
+    reset_multiprocess_dir()
+
+
+@worker_ready.connect
+def _start_metrics_exporter(**kwargs):
+    from app.core.metrics import start_exporter
+
+    start_exporter(int(getattr(settings, "CELERY_METRICS_PORT", 0) or 0))
+
+
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid=None, **kwargs):
+    from app.core.metrics import mark_process_dead
+
+    mark_process_dead(pid)
+
+
 @worker_ready.connect
 def _kickoff_sync_tasks(sender=None, **kwargs):
     app = getattr(sender, "app", celery_app)
@@ -38,3 +67,13 @@ def _kickoff_sync_tasks(sender=None, **kwargs):
             app.send_task(task_name)
         except Exception as e:
             logger.warning("celery startup task dispatch failed task=%s err=%s", task_name, str(e)[:220])
+
+
+@worker_process_init.connect
+@worker_process_shutdown.connect
+def _reset_panel_http_clients(**kwargs):
+    # Pooled panel clients never survive a fork or the end of a worker process;
+    # tasks close their own pools when their event loop finishes.
+    from app.services.http_client import drop_shared_clients
+
+    drop_shared_clients()
@@ -12,6 +12,11 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "please-change-me"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
     API_TOKEN_TOUCH_INTERVAL_SECONDS: int = 300
+    API_TOKEN_TOUCH_FLUSH_SECONDS: int = 15
+    # Authenticated resellers/API tokens are cached per process for this long;
+    # commits that change them invalidate every process over Redis pub/sub.
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 4096
     AUTH_RATE_LIMIT_WINDOW_SECONDS: int = 300
     AUTH_RATE_LIMIT_ATTEMPTS: int = 10
     AUTH_RATE_LIMIT_IP_ATTEMPTS: int = 100
@@ -20,7 +25,12 @@ class Settings(BaseSettings):
 
     REDIS_URL: str = "redis://localhost:6379/0"
     USAGE_SYNC_SECONDS: int = 180
-    EXPIRY_SYNC_SECONDS: int = 120
+    # Expiry is enforced from a Redis timeline (EXPIRY_SCHEDULER_SECONDS tick);
+    # EXPIRY_SYNC_SECONDS is the reconciliation scan that expires anything the
+    # timeline missed and schedules users expiring within the horizon.
+    EXPIRY_SYNC_SECONDS: int = 600
+    EXPIRY_SCHEDULER_SECONDS: int = 5
+    EXPIRY_SCHEDULE_HORIZON_SECONDS: int = 3600
     USAGE_SYNC_BATCH_SIZE: int = 5000
     USAGE_SYNC_REMOTE_LIST_PAGE_SIZE: int = 1000
     USAGE_SYNC_REMOTE_LIST_MAX_PAGES: int = 200
@@ -29,15 +39,58 @@ class Settings(BaseSettings):
     # least this many wall-clock hours (in addition to the confirmation count),
     # so a transient panel/proxy outage that returns 404 cannot wipe live users.
     USAGE_SYNC_REMOTE_MISSING_MIN_HOURS: int = 6
+    # Subaccounts whose usage did not change only get last_sync_at rewritten
+    # this often, so idle rows are not updated on every usage sync.
+    USAGE_SYNC_TOUCH_SECONDS: int = 900
+    # sync_usage / expire_due_users runs are kept in sync_runs for this many days.
+    SYNC_RUN_HISTORY_DAYS: int = 14
     EXPIRY_SYNC_BATCH_SIZE: int = 1000
+    # Concurrent remote panel calls (sync fan-out): overall, per panel host,
+    # and the time budget of a single node call once it has started.
+    REMOTE_FANOUT_CONCURRENCY: int = 16
+    REMOTE_FANOUT_PER_HOST: int = 4
+    REMOTE_FANOUT_TIMEOUT_SECONDS: int = 120
 
     REFUND_WINDOW_DAYS: int = 10
+    # Wallet holds left open longer than this (crashed request) are released
+    # by the reseller's next reservation; keep it above the slowest operation.
+    WALLET_HOLD_TTL_SECONDS: int = 1800
 
     CORS_ORIGINS: str = ""  # comma separated
     PANEL_TLS_VERIFY: bool = True
     HTTP_TIMEOUT_SECONDS: int = 60
+    # Pooled keep-alive connections to panels, per (origin, verify_ssl).
+    PANEL_HTTP_MAX_CONNECTIONS: int = 100
+    PANEL_HTTP_MAX_KEEPALIVE: int = 20
+    PANEL_HTTP_KEEPALIVE_EXPIRY_SECONDS: int = 30
+    # Negotiated per host via ALPN; needs the `h2` package (httpx[http2]).
+    PANEL_HTTP2: bool = True
+    # Marzban/PasarGuard admin tokens are shared via Redis and renewed this many
+    # seconds before their JWT exp; tokens without exp are kept for the default TTL.
+    PANEL_TOKEN_REFRESH_MARGIN_SECONDS: int = 120
+    PANEL_TOKEN_DEFAULT_TTL_SECONDS: int = 1800
+    # WGDashboard peer lists are cached per dashboard in each process for this
+    # long (0 disables); writes through the adapter invalidate the touched config.
+    WG_PEER_INDEX_TTL_SECONDS: int = 30
+    # /sub/{token}: merged payload cache TTL (0 disables), how long last good
+    # per-node bodies are kept for stale fallback, and the per-node fetch budget.
+    SUB_CACHE_TTL_SECONDS: int = 60
+    SUB_CACHE_STALE_SECONDS: int = 86400
+    SUB_FETCH_TIMEOUT_SECONDS: int = 15
+    # How often each process tops up its in-memory filter of revoked sub tokens
+    # (revocations from other processes also arrive over Redis pub/sub), and
+    # how often it rebuilds the filter from the whole table.
+    REVOKED_SUB_TOKEN_REFRESH_SECONDS: int = 30
+    REVOKED_SUB_TOKEN_REBUILD_SECONDS: int = 3600
+    # Lifetime of shared list totals requested with count=cached.
+    PAGE_COUNT_CACHE_SECONDS: int = 30
     # Set to false to hide /docs, /redoc and /openapi.json in production.
     EXPOSE_API_DOCS: bool = True
+    # Prometheus: /metrics on the API (optionally behind a bearer token) and,
+    # when the port is set, a standalone exporter in the Celery worker.
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""
+    CELERY_METRICS_PORT: int = 0
 
     @property
     def cors_origins_list(self) -> List[str]:
@@ -0,0 +1,283 @@
+"""Prometheus metrics for the API, the panel adapters and the Celery tasks.
+
+Every process records into the default registry. With PROMETHEUS_MULTIPROC_DIR
+set (docker-compose sets it for the api and worker services) samples go to
+files in that directory instead, so `/metrics` on any gunicorn worker and the
+Celery exporter report the totals of all sibling processes.
+
+Upstream panel calls are timed once, in `shared_request`; the panel and
+operation labels come from `instrument_upstream_calls` on the adapter classes.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import glob
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+from urllib.parse import urlsplit
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "").strip()
+if MULTIPROC_DIR:
+    # Metric files are opened as soon as a metric is created.
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_TASK_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+UPSTREAM_DURATION = Histogram(
+    "guardino_upstream_request_duration_seconds",
+    "Panel HTTP request latency.",
+    ["panel", "node", "operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "guardino_upstream_responses_total",
+    "Panel HTTP responses by status code (or exception name when no response arrived).",
+    ["panel", "node", "operation", "status"],
+)
+PANEL_TOKEN_REFRESHES = Counter(
+    "guardino_panel_token_refreshes_total",
+    "Panel admin logins; reason is expired (no usable cached token) or rejected (the panel refused it).",
+    ["panel", "reason"],
+)
+CACHE_REQUESTS = Counter(
+    "guardino_cache_requests_total",
+    "Lookups against Guardino's caches.",
+    ["cache", "result"],
+)
+DB_POOL_CHECKOUT = Histogram(
+    "guardino_db_pool_checkout_seconds",
+    "Time spent waiting for a database connection from the pool.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+HTTP_DURATION = Histogram(
+    "guardino_http_request_duration_seconds",
+    "API request latency by route template.",
+    ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_RESPONSES = Counter(
+    "guardino_http_responses_total",
+    "API responses by route template and status code.",
+    ["method", "route", "status"],
+)
+TASK_DURATION = Histogram(
+    "guardino_task_duration_seconds",
+    "Wall time of one Celery task run.",
+    ["task"],
+    buckets=_TASK_BUCKETS,
+)
+TASK_PHASE_DURATION = Histogram(
+    "guardino_task_phase_duration_seconds",
+    "Wall time of one phase within a Celery task run, summed over its batches.",
+    ["task", "phase"],
+    buckets=_TASK_BUCKETS,
+)
+TASK_RUNS = Counter(
+    "guardino_task_runs_total",
+    "Celery task runs by outcome.",
+    ["task", "result"],
+)
+TASK_EVENTS = Counter(
+    "guardino_task_events_total",
+    "TaskRunStats counters accumulated over every run.",
+    ["task", "event"],
+)
+TASK_LAST_RUN_USERS = Gauge(
+    "guardino_task_last_run_users",
+    "Users scanned by the most recent run.",
+    ["task"],
+    multiprocess_mode="mostrecent",
+)
+TASK_LAST_RUN_FINISHED = Gauge(
+    "guardino_task_last_run_finished_timestamp_seconds",
+    "Unix time the most recent run finished.",
+    ["task"],
+    multiprocess_mode="mostrecent",
+)
+
+
+def collector_registry() -> CollectorRegistry:
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Exposition body and content type for a scrape."""
+    return generate_latest(collector_registry()), CONTENT_TYPE_LATEST
+
+
+def reset_multiprocess_dir() -> None:
+    """Remove metric files left by a previous run; call before any worker starts."""
+    if not MULTIPROC_DIR:
+        return
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def mark_process_dead(pid: int | None = None) -> None:
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid() if pid is None else pid)
+
+
+def start_exporter(port: int) -> None:
+    """Serve /metrics on `port` from a background thread (used by the Celery worker)."""
+    if port <= 0:
+        return
+    try:
+        start_http_server(port, registry=collector_registry())
+    except OSError as exc:
+        logger.warning("metrics exporter failed to start port=%s err=%s", port, str(exc)[:160])
+        return
+    logger.info("metrics exporter listening port=%s multiprocess=%s", port, bool(MULTIPROC_DIR))
+
+
+# (panel, operation) of the adapter call the current task is inside.
+_upstream_call: contextvars.ContextVar[tuple[str, str] | None] = contextvars.ContextVar("guardino_upstream_call", default=None)
+
+
+@contextmanager
+def upstream_call(panel: str, operation: str) -> Iterator[None]:
+    """Label the panel requests made inside the block; an enclosing label wins."""
+    if _upstream_call.get() is not None:
+        yield
+        return
+    token = _upstream_call.set((panel, operation))
+    try:
+        yield
+    finally:
+        _upstream_call.reset(token)
+
+
+def _labelled(panel: str, operation: str, method: Any) -> Any:
+    @functools.wraps(method)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with upstream_call(panel, operation):
+            return await method(*args, **kwargs)
+
+    return wrapper
+
+
+def instrument_upstream_calls(panel: str):
+    """Class decorator for panel adapters.
+
+    Every public coroutine method labels the requests it makes with `panel`
+    and its own name. Calls between public methods keep the outermost name, so
+    a `get_used_bytes_many` that pages through `list_users` is reported once,
+    as `get_used_bytes_many`. The panel label is also kept on the class as
+    `metrics_panel` for callers that issue requests on an adapter's behalf.
+    """
+
+    def decorate(cls):
+        for name, member in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(member):
+                continue
+            setattr(cls, name, _labelled(panel, name, member))
+        cls.metrics_panel = panel
+        return cls
+
+    return decorate
+
+
+# Per-host request stats of the task run the current context belongs to.
+_call_log: contextvars.ContextVar[dict[str, dict[str, Any]] | None] = contextvars.ContextVar("guardino_call_log", default=None)
+
+
+@contextmanager
+def collect_upstream_calls() -> Iterator[dict[str, dict[str, Any]]]:
+    """Collect {host: calls, failures, total_ms, max_ms, slowest_operation} for the block.
+
+    Failures are requests without a response or with a 5xx status.
+    """
+    calls: dict[str, dict[str, Any]] = {}
+    token = _call_log.set(calls)
+    try:
+        yield calls
+    finally:
+        _call_log.reset(token)
+
+
+def observe_upstream(url: str, seconds: float, status: str) -> None:
+    panel, operation = _upstream_call.get() or ("unknown", "other")
+    node = urlsplit(str(url or "")).netloc.lower() or "unknown"
+    UPSTREAM_DURATION.labels(panel, node, operation).observe(seconds)
+    UPSTREAM_RESPONSES.labels(panel, node, operation, status).inc()
+    calls = _call_log.get()
+    if calls is None:
+        return
+    entry = calls.setdefault(node, {"calls": 0, "failures": 0, "total_ms": 0, "max_ms": 0, "slowest_operation": ""})
+    ms = int(seconds * 1000)
+    entry["calls"] += 1
+    entry["total_ms"] += ms
+    if not status.isdigit() or int(status) >= 500:
+        entry["failures"] += 1
+    if ms >= entry["max_ms"]:
+        entry["max_ms"] = ms
+        entry["slowest_operation"] = operation
+
+
+def record_token_refresh(*, rejected: bool) -> None:
+    panel = (_upstream_call.get() or ("unknown", ""))[0]
+    PANEL_TOKEN_REFRESHES.labels(panel, "rejected" if rejected else "expired").inc()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency and status per route template.
+
+    The route is read after the call, once the router has put the matched
+    route on the scope; requests no route matched share one `<unmatched>`
+    label so scanners cannot blow up the label set.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = int(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            method = str(scope.get("method") or "")
+            HTTP_DURATION.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_RESPONSES.labels(method, route, str(status)).inc()
@@ -0,0 +1 @@
+"""Operator/developer tooling (plan checks, simulators, benchmarks); not imported by the API or workers."""
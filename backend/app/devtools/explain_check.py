@@ -0,0 +1,145 @@
+"""EXPLAIN-based check that the user scan queries use the indexes of migration 0017.
+
+Seeds resellers/users inside a transaction, ANALYZEs, EXPLAINs the exact
+statements the tasks and endpoints run and rolls everything back. Run it
+against a development/staging database: `python -m app.cli check-indexes`.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.db import engine
+from app.models.user import GuardinoUser, UserStatus
+from app.services.dashboard_metrics import summarize_users_stmt
+from app.services.user_scans import due_users_batch, live_users_batch
+
+_SEED_PREFIX = "explain-check-"
+
+
+@dataclass
+class PlanCheck:
+    name: str
+    build: Callable[[int, datetime], Any]  # (seeded reseller id, now) -> statement
+    expected: set[str]
+
+
+CHECKS = [
+    PlanCheck(
+        "expiry scan",
+        lambda reseller_id, now: due_users_batch(now, 0, 1000),
+        {"ix_users_active_expire_id"},
+    ),
+    PlanCheck(
+        "usage sync scan",
+        lambda reseller_id, now: live_users_batch(0, 5000),
+        {"ix_users_live_id"},
+    ),
+    PlanCheck(
+        "reseller active users",
+        lambda reseller_id, now: select(func.count()).select_from(GuardinoUser).where(
+            GuardinoUser.owner_reseller_id == reseller_id,
+            GuardinoUser.status == UserStatus.active,
+            GuardinoUser.expire_at >= now,
+        ),
+        {"ix_users_owner_status_expire"},
+    ),
+    PlanCheck(
+        "reseller dashboard summary",
+        lambda reseller_id, now: summarize_users_stmt(reseller_id, now),
+        {"ix_users_owner_status_expire", "ix_users_owner_reseller_id"},
+    ),
+]
+
+
+async def _seed(conn: AsyncConnection, users: int, resellers: int) -> int:
+    await conn.execute(
+        text(
+            """
+            INSERT INTO resellers (
+              username, password_hash, role, status, balance, price_per_gb, price_per_day,
+              bundle_price_per_gb, can_create_subreseller, two_factor_enabled,
+              two_factor_recovery_hashes, created_at, updated_at
+            )
+            SELECT CAST(:prefix AS text) || g, 'x', 'reseller', 'active', 0, 0, 0, 0, false, false, '[]', NOW(), NOW()
+            FROM generate_series(1, :resellers) AS g
+            """
+        ),
+        {"prefix": _SEED_PREFIX, "resellers": resellers},
+    )
+    ids = (
+        await conn.execute(
+            text("SELECT id FROM resellers WHERE username LIKE :pattern ORDER BY id"),
+            {"pattern": _SEED_PREFIX + "%"},
+        )
+    ).scalars().all()
+    # Realistic shape: ~30% deleted, 10% disabled, and only ~1% of active users
+    # past expiry (the expiry task keeps that set small).
+    await conn.execute(
+        text(
+            """
+            INSERT INTO users (
+              owner_reseller_id, label, total_gb, used_bytes, expire_at, status,
+              master_sub_token, node_selection_mode, metadata, created_at, updated_at
+            )
+            SELECT
+              (CAST(:ids AS integer[]))[1 + (g % cardinality(CAST(:ids AS integer[])))],
+              CAST(:prefix AS text) || g,
+              50,
+              0,
+              NOW() + CASE WHEN g % 100 = 0 THEN -INTERVAL '1 day' ELSE (1 + g % 365) * INTERVAL '1 day' END,
+              (CASE WHEN g % 10 < 3 THEN 'deleted' WHEN g % 10 = 3 THEN 'disabled' ELSE 'active' END)::userstatus,
+              md5(CAST(:prefix AS text) || g || random()::text),
+              'manual',
+              '{}',
+              NOW(),
+              NOW()
+            FROM generate_series(1, :users) AS g
+            """
+        ),
+        {"ids": list(ids), "prefix": _SEED_PREFIX, "users": users},
+    )
+    await conn.execute(text("ANALYZE users"))
+    return int(ids[len(ids) // 2])
+
+
+def _index_names(plan: dict) -> set[str]:
+    names = {plan["Index Name"]} if plan.get("Index Name") else set()
+    for child in plan.get("Plans") or []:
+        names |= _index_names(child)
+    return names
+
+
+async def _explain(conn: AsyncConnection, stmt) -> dict:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    raw = (await conn.execute(text("EXPLAIN (FORMAT JSON) " + sql))).scalar_one()
+    data = json.loads(raw) if isinstance(raw, str) else raw
+    return data[0]["Plan"]
+
+
+async def run_index_check(users: int = 50000, resellers: int = 20) -> bool:
+    ok = True
+    now = datetime.now(timezone.utc)
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            reseller_id = await _seed(conn, max(1000, users), max(1, resellers))
+            for check in CHECKS:
+                plan = await _explain(conn, check.build(reseller_id, now))
+                used = _index_names(plan)
+                passed = bool(used & check.expected)
+                ok = ok and passed
+                status = "OK  " if passed else "FAIL"
+                print(
+                    f"[{status}] {check.name}: plan={plan.get('Node Type')} "
+                    f"indexes={sorted(used) or '-'} expected one of {sorted(check.expected)}"
+                )
+        finally:
+            await transaction.rollback()
+    return ok
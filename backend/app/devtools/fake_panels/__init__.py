@@ -0,0 +1,20 @@
+"""In-process fake upstream panels for benchmarks, load and correctness checks.
+
+Each simulator is a FastAPI app implementing the endpoints the real
+adapters call (Marzban, PasarGuard, WGDashboard v4), plus `/sub/{token}`
+for the subscription proxy. State lives in plain objects (UserStore,
+WGState) that can be seeded with tens of thousands of synthetic users and
+advanced between sync cycles with add_traffic(). Faults adds latency,
+jitter, injected 503s, 404 bursts and pagination quirks (clamped page size,
+missing total, ignored offset).
+
+Serve them with running_panels() (ephemeral ports, inside a benchmark) or
+`python -m app.cli fake-panel` (fixed port, for manual or external load).
+"""
+
+from app.devtools.fake_panels.faults import FaultInjector, Faults
+from app.devtools.fake_panels.marzban import marzban_app
+from app.devtools.fake_panels.pasarguard import pasarguard_app
+from app.devtools.fake_panels.server import running_panels, serve_panel
+from app.devtools.fake_panels.users import UserStore
+from app.devtools.fake_panels.wg_dashboard import WGState, wg_dashboard_app
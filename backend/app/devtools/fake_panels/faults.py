@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass(frozen=True)
+class Faults:
+    """Misbehaviour a fake panel injects into its responses."""
+
+    latency: float = 0.0  # seconds added to every request
+    jitter: float = 0.0  # plus up to this many seconds, uniformly random
+    error_rate: float = 0.0  # share of requests answered with HTTP 503
+    not_found_rate: float = 0.0  # chance that a per-user request starts a 404 burst
+    not_found_burst: int = 20  # per-user requests answered "not found" once a burst starts
+    max_page_size: int | None = None  # list endpoints silently clamp `limit` to this
+    omit_total: bool = False  # list endpoints return a bare array without `total`
+    ignore_offset: bool = False  # list endpoints always return the first page
+    seed: int | None = None
+
+
+class FaultInjector:
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.rng = random.Random(faults.seed)
+        self.counts: Counter[str] = Counter()
+        self._burst_left = 0
+
+    async def delay(self) -> None:
+        seconds = self.faults.latency
+        if self.faults.jitter > 0:
+            seconds += self.rng.uniform(0, self.faults.jitter)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def fail_now(self) -> bool:
+        if self.faults.error_rate > 0 and self.rng.random() < self.faults.error_rate:
+            self.counts["injected_errors"] += 1
+            return True
+        return False
+
+    def not_found_now(self) -> bool:
+        if self._burst_left <= 0 and self.faults.not_found_rate > 0 and self.rng.random() < self.faults.not_found_rate:
+            self._burst_left = max(1, self.faults.not_found_burst)
+        if self._burst_left > 0:
+            self._burst_left -= 1
+            self.counts["injected_not_found"] += 1
+            return True
+        return False
+
+    def page(self, items: list[Any], offset: int, limit: int) -> list[Any]:
+        if self.faults.ignore_offset:
+            offset = 0
+        if self.faults.max_page_size:
+            limit = min(limit, self.faults.max_page_size)
+        offset = max(0, int(offset))
+        return items[offset : offset + max(0, int(limit))]
+
+    def list_payload(self, key: str, page: list[Any], total: int) -> Any:
+        if self.faults.omit_total:
+            return page
+        return {key: page, "total": total}
+
+
+def install_faults(app: FastAPI, faults: Faults | None, *, not_found_prefixes: tuple[str, ...] = ()) -> FaultInjector:
+    """Apply latency and injected errors to every request of `app`.
+
+    Requests whose path starts with one of `not_found_prefixes` take part in
+    404 bursts. The injector is also kept on `app.state.faults` so handlers
+    can apply the pagination quirks and tests can read its counters.
+    """
+    injector = FaultInjector(faults or Faults())
+    app.state.faults = injector
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        injector.counts["requests"] += 1
+        await injector.delay()
+        if injector.fail_now():
+            return JSONResponse({"detail": "Injected upstream failure"}, status_code=503)
+        if not_found_prefixes and request.url.path.startswith(not_found_prefixes) and injector.not_found_now():
+            return JSONResponse({"detail": "User not found"}, status_code=404)
+        return await call_next(request)
+
+    return injector
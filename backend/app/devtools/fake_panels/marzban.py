@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import secrets
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.devtools.fake_panels.faults import Faults, install_faults
+from app.devtools.fake_panels.users import UserStore, require_bearer
+
+INBOUNDS = {"vless": [{"tag": "VLESS TCP REALITY"}], "vmess": [{"tag": "VMESS WS"}]}
+
+
+def marzban_app(store: UserStore | None = None, faults: Faults | None = None) -> FastAPI:
+    """The Marzban API surface MarzbanAdapter and the subscription proxy use.
+
+    The user store is on `app.state.store` and the fault injector on
+    `app.state.faults`.
+    """
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+    store = store or UserStore()
+    app.state.store = store
+    faults_state = install_faults(app, faults, not_found_prefixes=("/api/user/",))
+    auth = [Depends(require_bearer)]
+
+    @app.post("/api/admin/token")
+    async def token():
+        return {"access_token": secrets.token_hex(16), "token_type": "bearer"}
+
+    @app.get("/api/system", dependencies=auth)
+    async def system():
+        return {"version": "0.8.4-sim", "total_user": len(store.users)}
+
+    @app.get("/api/inbounds", dependencies=auth)
+    async def inbounds():
+        return INBOUNDS
+
+    @app.get("/api/users", dependencies=auth)
+    async def list_users(offset: int = 0, limit: int = 100):
+        users = list(store.users.values())
+        return JSONResponse(faults_state.list_payload("users", faults_state.page(users, offset, limit), len(users)))
+
+    @app.post("/api/user", dependencies=auth)
+    async def create_user(request: Request):
+        return store.create(await request.json())
+
+    @app.get("/api/user/{username}", dependencies=auth)
+    async def get_user(username: str):
+        return store.get(username)
+
+    @app.put("/api/user/{username}", dependencies=auth)
+    async def modify_user(username: str, request: Request):
+        return store.update(username, await request.json())
+
+    @app.delete("/api/user/{username}", dependencies=auth)
+    async def delete_user(username: str):
+        store.delete(username)
+        return {}
+
+    @app.post("/api/user/{username}/reset", dependencies=auth)
+    async def reset_user(username: str):
+        return store.reset(username)
+
+    @app.post("/api/user/{username}/revoke_sub", dependencies=auth)
+    async def revoke_sub(username: str):
+        return store.revoke_sub(username)
+
+    @app.get("/api/user/{username}/usage", dependencies=auth)
+    async def user_usage(username: str):
+        user = store.get(username)
+        return {"username": username, "usages": [{"node_name": "Master", "used_traffic": user["used_traffic"]}]}
+
+    @app.get("/sub/{token}")
+    async def subscription(token: str):
+        return PlainTextResponse(store.subscription_body(token))
+
+    return app
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import secrets
+import uuid
+from typing import Any
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.devtools.fake_panels.faults import Faults, install_faults
+from app.devtools.fake_panels.users import UserStore, require_bearer
+
+INBOUND_TAGS = ["VLESS TCP REALITY", "VMESS WS", "TROJAN WS", "Shadowsocks TCP"]
+
+
+def _proxy_settings(requested: Any) -> dict[str, Any]:
+    # PasarGuard fills in every protocol the caller leaves out.
+    settings = dict(requested) if isinstance(requested, dict) else {}
+    settings.setdefault("vless", {"id": str(uuid.uuid4())})
+    settings.setdefault("vmess", {"id": str(uuid.uuid4())})
+    settings.setdefault("trojan", {"password": secrets.token_urlsafe(12)})
+    settings.setdefault("shadowsocks", {"password": secrets.token_urlsafe(12), "method": "chacha20-ietf-poly1305"})
+    return {k: (v if v else {"id": str(uuid.uuid4())}) for k, v in settings.items()}
+
+
+def pasarguard_app(store: UserStore | None = None, faults: Faults | None = None) -> FastAPI:
+    """The PasarGuard API surface PasarguardAdapter and the subscription proxy use.
+
+    Includes groups, simple user lookups and the bulk disable/enable/delete
+    endpoints. The user store is on `app.state.store` and the fault injector
+    on `app.state.faults`.
+    """
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+    store = store or UserStore()
+    app.state.store = store
+    faults_state = install_faults(app, faults, not_found_prefixes=("/api/user/",))
+    auth = [Depends(require_bearer)]
+    groups: dict[int, dict[str, Any]] = {1: {"id": 1, "name": "all", "inbound_tags": list(INBOUND_TAGS), "is_disabled": False}}
+
+    def users_by_ids(ids: list[int]) -> list[dict[str, Any]]:
+        wanted = set(ids)
+        return [u for u in store.users.values() if u["id"] in wanted]
+
+    def view(user: dict[str, Any], *, load_sub: bool = True) -> dict[str, Any]:
+        return user if load_sub else {k: v for k, v in user.items() if k != "subscription_url"}
+
+    @app.post("/api/admin/token")
+    async def token():
+        return {"access_token": secrets.token_hex(16), "token_type": "bearer"}
+
+    @app.get("/api/system", dependencies=auth)
+    async def system():
+        return {"version": "1.0.0-sim", "total_user": len(store.users)}
+
+    @app.get("/api/inbounds", dependencies=auth)
+    async def inbounds():
+        return INBOUND_TAGS
+
+    @app.get("/api/groups", dependencies=auth)
+    async def list_groups(offset: int = 0, limit: int = 100):
+        items = list(groups.values())
+        return {"groups": items[offset : offset + limit], "total": len(items)}
+
+    @app.get("/api/groups/simple", dependencies=auth)
+    async def list_groups_simple():
+        return {"groups": [{"id": g["id"], "name": g["name"]} for g in groups.values()], "total": len(groups)}
+
+    @app.post("/api/group", dependencies=auth)
+    async def create_group(request: Request):
+        payload = await request.json()
+        gid = max(groups, default=0) + 1
+        groups[gid] = {"id": gid, "name": str(payload.get("name") or ""), "inbound_tags": list(payload.get("inbound_tags") or []), "is_disabled": False}
+        return groups[gid]
+
+    @app.put("/api/group/{gid}", dependencies=auth)
+    async def modify_group(gid: int, request: Request):
+        if gid not in groups:
+            raise HTTPException(status_code=404, detail="Group not found")
+        groups[gid].update(await request.json())
+        return groups[gid]
+
+    @app.get("/api/user_templates/simple", dependencies=auth)
+    async def list_templates():
+        return {"templates": [], "total": 0}
+
+    @app.get("/api/users", dependencies=auth)
+    async def list_users(offset: int = 0, limit: int = 100, load_sub: bool = False):
+        users = list(store.users.values())
+        page = [view(u, load_sub=load_sub) for u in faults_state.page(users, offset, limit)]
+        return JSONResponse(faults_state.list_payload("users", page, len(users)))
+
+    @app.get("/api/users/simple", dependencies=auth)
+    async def list_users_simple(usernames: list[str] | None = Query(default=None), offset: int = 0, limit: int = 100, all_: bool = Query(default=False, alias="all")):
+        if usernames:
+            wanted = {name.lower() for name in usernames}
+            users = [u for u in store.users.values() if u["username"].lower() in wanted]
+        else:
+            users = list(store.users.values())
+        rows = [{"id": u["id"], "username": u["username"]} for u in users]
+        return {"users": rows if all_ else rows[offset : offset + limit], "total": len(rows)}
+
+    @app.post("/api/user", dependencies=auth)
+    async def create_user(request: Request):
+        payload = await request.json()
+        payload["proxy_settings"] = _proxy_settings(payload.get("proxy_settings"))
+        payload.setdefault("group_ids", [])
+        return store.create(payload)
+
+    @app.get("/api/user/{username}", dependencies=auth)
+    async def get_user(username: str):
+        return store.get(username)
+
+    @app.put("/api/user/{username}", dependencies=auth)
+    async def modify_user(username: str, request: Request):
+        changes = await request.json()
+        if "proxy_settings" in changes:
+            changes["proxy_settings"] = _proxy_settings(changes["proxy_settings"])
+        return store.update(username, changes)
+
+    @app.put("/api/user/{username}/disabled", dependencies=auth)
+    async def set_disabled(username: str, request: Request):
+        disabled = bool((await request.json()).get("disabled"))
+        return store.update(username, {"status": "disabled" if disabled else "active"})
+
+    @app.delete("/api/user/{username}", dependencies=auth)
+    async def delete_user(username: str):
+        store.delete(username)
+        return {}
+
+    @app.post("/api/user/{username}/reset", dependencies=auth)
+    async def reset_user(username: str):
+        return store.reset(username)
+
+    @app.post("/api/user/{username}/revoke_sub", dependencies=auth)
+    async def revoke_sub(username: str):
+        return store.revoke_sub(username)
+
+    @app.get("/api/user/{username}/usage", dependencies=auth)
+    async def user_usage(username: str, period: str = "month"):
+        user = store.get(username)
+        return {"period": period, "stats": {"-1": [{"total_traffic": user["used_traffic"]}]}}
+
+    @app.post("/api/users/bulk/{action}", dependencies=auth)
+    async def bulk_action(action: str, request: Request):
+        payload = await request.json()
+        if action == "proxy_settings":
+            for user in users_by_ids(list(payload.get("users") or [])):
+                user["proxy_settings"] = _proxy_settings(user.get("proxy_settings"))
+                if payload.get("group_ids"):
+                    user["group_ids"] = list(payload["group_ids"])
+            return {}
+        if action not in {"disable", "enable", "delete"}:
+            raise HTTPException(status_code=404, detail="Not Found")
+        users = users_by_ids(list(payload.get("ids") or []))
+        for user in users:
+            if action == "delete":
+                store.delete(user["username"])
+            else:
+                user["status"] = "disabled" if action == "disable" else "active"
+        return {"users": [u["username"] for u in users], "count": len(users)}
+
+    @app.get("/sub/{token}")
+    async def subscription(token: str):
+        return PlainTextResponse(store.subscription_body(token))
+
+    return app
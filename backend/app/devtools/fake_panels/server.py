@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI
+
+
+def _server(app: FastAPI, host: str, port: int, lifespan: str = "off") -> uvicorn.Server:
+    return uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan=lifespan, access_log=False))
+
+
+@asynccontextmanager
+async def running_panels(apps: list[FastAPI], *, lifespan: str = "off") -> AsyncIterator[list[str]]:
+    """Serve each app on its own ephemeral port; yields their base URLs.
+
+    lifespan="on" runs the apps' startup/shutdown hooks (needed to serve the
+    Guardino API itself next to the panels).
+    """
+    servers: list[uvicorn.Server] = []
+    tasks: list[asyncio.Task] = []
+    try:
+        for app in apps:
+            server = _server(app, "127.0.0.1", 0, lifespan)
+            servers.append(server)
+            tasks.append(asyncio.create_task(server.serve()))
+        while not all(server.started for server in servers):
+            if any(task.done() for task in tasks):
+                raise RuntimeError("fake panel failed to start")
+            await asyncio.sleep(0.01)
+        urls = []
+        for server in servers:
+            port = server.servers[0].sockets[0].getsockname()[1]
+            urls.append(f"http://127.0.0.1:{port}")
+        yield urls
+    finally:
+        for server in servers:
+            server.should_exit = True
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def serve_panel(app: FastAPI, host: str = "127.0.0.1", port: int = 8800) -> None:
+    """Serve one fake panel on a fixed address until interrupted."""
+    await _server(app, host, port).serve()
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import random
+import secrets
+import time
+from typing import Any
+
+from fastapi import Header, HTTPException
+
+GB = 1024 ** 3
+
+
+class UserStore:
+    """Users of a fake Marzban or PasarGuard panel, keyed by username in creation order."""
+
+    def __init__(self, *, seed: int | None = None):
+        self.users: dict[str, dict[str, Any]] = {}
+        self.by_sub_token: dict[str, str] = {}
+        self.rng = random.Random(seed)
+        self._next_id = 1
+
+    def _new_sub_token(self, username: str) -> str:
+        token = secrets.token_urlsafe(12)
+        self.by_sub_token[token] = username
+        return token
+
+    def create(self, payload: dict[str, Any]) -> dict[str, Any]:
+        username = str(payload.get("username") or "")
+        if not username or username in self.users:
+            raise HTTPException(status_code=409, detail="User already exists")
+        user = {
+            **payload,
+            "id": self._next_id,
+            "username": username,
+            "status": str(payload.get("status") or "active"),
+            "used_traffic": int(payload.get("used_traffic") or 0),
+            "lifetime_used_traffic": int(payload.get("used_traffic") or 0),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        user["subscription_url"] = f"/sub/{self._new_sub_token(username)}"
+        self._next_id += 1
+        self.users[username] = user
+        return user
+
+    def get(self, username: str) -> dict[str, Any]:
+        user = self.users.get(username)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    def update(self, username: str, changes: dict[str, Any]) -> dict[str, Any]:
+        user = self.get(username)
+        user.update({k: v for k, v in changes.items() if k not in {"id", "username", "used_traffic"}})
+        return user
+
+    def delete(self, username: str) -> None:
+        user = self.users.pop(username, None)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        self.by_sub_token.pop(str(user["subscription_url"]).rsplit("/", 1)[-1], None)
+
+    def revoke_sub(self, username: str) -> dict[str, Any]:
+        user = self.get(username)
+        self.by_sub_token.pop(str(user["subscription_url"]).rsplit("/", 1)[-1], None)
+        user["subscription_url"] = f"/sub/{self._new_sub_token(username)}"
+        return user
+
+    def reset(self, username: str) -> dict[str, Any]:
+        user = self.get(username)
+        user["used_traffic"] = 0
+        if user.get("status") == "limited":
+            user["status"] = "active"
+        return user
+
+    def seed(self, count: int, *, prefix: str = "sim", data_limit_gb: int = 50, days: int = 30, max_used_ratio: float = 1.2) -> list[str]:
+        """Create `count` active users; used traffic is random up to `max_used_ratio` of the limit."""
+        now = int(time.time())
+        names: list[str] = []
+        for _ in range(count):
+            username = f"{prefix}{self._next_id:06d}"
+            suffix = 1
+            while username in self.users:
+                username = f"{prefix}{self._next_id:06d}_{suffix}"
+                suffix += 1
+            limit = int(data_limit_gb) * GB
+            self.create(
+                {
+                    "username": username,
+                    "data_limit": limit,
+                    "expire": now + self.rng.randint(1, max(1, days)) * 86400,
+                    "data_limit_reset_strategy": "no_reset",
+                }
+            )
+            self.add_usage(username, int(limit * self.rng.uniform(0, max_used_ratio)) if limit else 0)
+            names.append(username)
+        return names
+
+    def add_usage(self, username: str, used_bytes: int) -> None:
+        user = self.get(username)
+        user["used_traffic"] = int(user.get("used_traffic") or 0) + max(0, int(used_bytes))
+        user["lifetime_used_traffic"] = int(user.get("lifetime_used_traffic") or 0) + max(0, int(used_bytes))
+        limit = int(user.get("data_limit") or 0)
+        if limit and user["used_traffic"] >= limit and user.get("status") == "active":
+            user["status"] = "limited"
+
+    def add_traffic(self, max_bytes: int) -> None:
+        """Simulate a sync interval: every active user uses 0..max_bytes more."""
+        for username, user in self.users.items():
+            if user.get("status") == "active":
+                self.add_usage(username, self.rng.randint(0, max(0, int(max_bytes))))
+
+    def subscription_body(self, token: str) -> str:
+        username = self.by_sub_token.get(token)
+        if username is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return f"vless://{secrets.token_hex(16)}@127.0.0.1:443?security=none#{username}\n"
+
+
+def require_bearer(authorization: str = Header(default="")) -> str:
+    """Accept any bearer token, as if issued by /api/admin/token or configured statically."""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return token
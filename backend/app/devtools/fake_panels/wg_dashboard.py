@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import base64
+import ipaddress
+import random
+from datetime import datetime
+from typing import Any
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from app.devtools.fake_panels.faults import Faults, install_faults
+
+GB = 1024 ** 3
+
+
+class WGState:
+    """Configurations, peers and peer schedule jobs of a fake WGDashboard.
+
+    Usage is kept in bytes and reported the way WGDashboard does, as GB
+    floats. Restrict jobs on total_data are applied by add_traffic.
+    """
+
+    def __init__(self, configurations: tuple[str, ...] = ("wg0",), *, seed: int | None = None):
+        self.rng = random.Random(seed)
+        self.peers: dict[str, dict[str, dict[str, Any]]] = {name: {} for name in configurations}
+        self.jobs: dict[str, dict[str, Any]] = {}
+        self._networks = {
+            name: ipaddress.ip_network(f"10.{10 + i}.0.0/16").hosts() for i, name in enumerate(configurations)
+        }
+
+    def _new_peer_id(self) -> str:
+        return base64.b64encode(self.rng.randbytes(32)).decode("ascii")
+
+    def config(self, name: str) -> dict[str, dict[str, Any]]:
+        peers = self.peers.get(name)
+        if peers is None:
+            raise HTTPException(status_code=404, detail=f"Configuration {name} does not exist")
+        return peers
+
+    def next_ip(self, config_name: str) -> str:
+        self.config(config_name)
+        return f"{next(self._networks[config_name])}/32"
+
+    def add_peer(self, config_name: str, name: str, allowed_ip: str | None = None) -> dict[str, Any]:
+        peers = self.config(config_name)
+        peer = {
+            "id": self._new_peer_id(),
+            "name": name,
+            "allowed_ip": allowed_ip or self.next_ip(config_name),
+            "restricted": False,
+            "recv_bytes": 0,
+            "sent_bytes": 0,
+            "cumu_recv_bytes": 0,
+            "cumu_sent_bytes": 0,
+        }
+        peers[peer["id"]] = peer
+        return peer
+
+    def find(self, peer_id: str) -> tuple[str, dict[str, Any]] | None:
+        for config_name, peers in self.peers.items():
+            if peer_id in peers:
+                return config_name, peers[peer_id]
+        return None
+
+    def seed(self, count: int, *, prefix: str = "sim", data_limit_gb: int = 50, max_used_ratio: float = 1.2) -> list[str]:
+        """Create `count` peers spread over the configurations, each with a volume job."""
+        names = list(self.peers)
+        ids: list[str] = []
+        for i in range(count):
+            peer = self.add_peer(names[i % len(names)], f"{prefix}{i + 1:06d}")
+            used = int(data_limit_gb * GB * self.rng.uniform(0, max_used_ratio))
+            peer["recv_bytes"] = used * 3 // 4
+            peer["sent_bytes"] = used - peer["recv_bytes"]
+            job_id = f"seed-{peer['id']}"
+            self.jobs[job_id] = {
+                "JobID": job_id,
+                "Configuration": names[i % len(names)],
+                "Peer": peer["id"],
+                "Field": "total_data",
+                "Operator": "lgt",
+                "Value": str(data_limit_gb),
+                "CreationDate": "",
+                "ExpireDate": "",
+                "Action": "restrict",
+            }
+            ids.append(peer["id"])
+        return ids
+
+    def add_traffic(self, max_bytes: int) -> None:
+        """Simulate a sync interval, then apply total_data restrict jobs."""
+        for peers in self.peers.values():
+            for peer in peers.values():
+                if not peer["restricted"]:
+                    used = self.rng.randint(0, max(0, int(max_bytes)))
+                    peer["recv_bytes"] += used * 3 // 4
+                    peer["sent_bytes"] += used - used * 3 // 4
+        for job in self.jobs.values():
+            if job.get("Field") != "total_data" or job.get("Action") != "restrict":
+                continue
+            found = self.find(str(job.get("Peer") or ""))
+            if found and (found[1]["recv_bytes"] + found[1]["sent_bytes"]) / GB > float(job.get("Value") or 0):
+                found[1]["restricted"] = True
+
+    def view(self, peer: dict[str, Any], jobs_by_peer: dict[str, list[dict[str, Any]]]) -> dict[str, Any]:
+        recv, sent = peer["recv_bytes"] / GB, peer["sent_bytes"] / GB
+        cumu_recv, cumu_sent = peer["cumu_recv_bytes"] / GB, peer["cumu_sent_bytes"] / GB
+        return {
+            "id": peer["id"],
+            "name": peer["name"],
+            "allowed_ip": peer["allowed_ip"],
+            "status": "stopped" if peer["restricted"] else "running",
+            "total_receive": round(recv, 4),
+            "total_sent": round(sent, 4),
+            "total_data": round(recv + sent, 4),
+            "cumu_receive": round(cumu_recv, 4),
+            "cumu_sent": round(cumu_sent, 4),
+            "cumu_data": round(cumu_recv + cumu_sent, 4),
+            "jobs": jobs_by_peer.get(peer["id"], []),
+        }
+
+
+def _ok(data: Any = None, message: str | None = None) -> dict[str, Any]:
+    return {"status": True, "message": message, "data": data}
+
+
+def wg_dashboard_app(state: WGState | None = None, faults: Faults | None = None, *, apikey: str = "sim") -> FastAPI:
+    """The WGDashboard v4 API surface WGDashboardAdapter uses.
+
+    A 404 burst here hides every peer from getWireguardConfigurationInfo,
+    like a dashboard answering with an empty configuration. The state is on
+    `app.state.wg` and the fault injector on `app.state.faults`.
+    """
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+    state = state or WGState()
+    app.state.wg = state
+    faults_state = install_faults(app, faults)
+
+    def require_apikey(wg_dashboard_apikey: str = Header(default="")) -> None:
+        if wg_dashboard_apikey != apikey:
+            raise HTTPException(status_code=401, detail="Unauthorized access")
+
+    auth = [Depends(require_apikey)]
+
+    def peer_ids(payload: dict[str, Any]) -> list[str]:
+        return [str(p) for p in payload.get("peers") or []]
+
+    @app.get("/api/handshake", dependencies=auth)
+    async def handshake():
+        return _ok()
+
+    @app.get("/api/getWireguardConfigurations", dependencies=auth)
+    async def configurations():
+        return _ok([{"Name": name, "Status": True, "TotalPeers": len(peers)} for name, peers in state.peers.items()])
+
+    @app.get("/api/getWireguardConfigurationInfo", dependencies=auth)
+    async def configuration_info(configurationName: str):
+        peers = state.config(configurationName)
+        jobs_by_peer: dict[str, list[dict[str, Any]]] = {}
+        for job in state.jobs.values():
+            jobs_by_peer.setdefault(str(job.get("Peer")), []).append(job)
+        views = [] if faults_state.not_found_now() else [state.view(p, jobs_by_peer) for p in peers.values()]
+        return JSONResponse(
+            _ok(
+                {
+                    "configurationInfo": {"Name": configurationName},
+                    "configurationPeers": [v for v in views if v["status"] == "running"],
+                    "configurationRestrictedPeers": [v for v in views if v["status"] == "stopped"],
+                }
+            )
+        )
+
+    @app.get("/api/getAvailableIPs/{config_name}", dependencies=auth)
+    async def available_ips(config_name: str):
+        return _ok({"10.0.0.0/8": [state.next_ip(config_name)]})
+
+    @app.post("/api/addPeers/{config_name}", dependencies=auth)
+    async def add_peers(config_name: str, request: Request):
+        payload = await request.json()
+        allowed = payload.get("allowed_ips")
+        peer = state.add_peer(config_name, str(payload.get("name") or ""), allowed[0] if allowed else None)
+        return _ok([state.view(peer, {})])
+
+    @app.post("/api/allowAccessPeers/{config_name}", dependencies=auth)
+    async def allow_peers(config_name: str, request: Request):
+        peers = state.config(config_name)
+        for pid in peer_ids(await request.json()):
+            if pid in peers:
+                peers[pid]["restricted"] = False
+        return _ok(message="Allow access successfully")
+
+    @app.post("/api/restrictPeers/{config_name}", dependencies=auth)
+    async def restrict_peers(config_name: str, request: Request):
+        peers = state.config(config_name)
+        ids = peer_ids(await request.json())
+        missing = [pid for pid in ids if pid not in peers]
+        for pid in ids:
+            if pid in peers:
+                peers[pid]["restricted"] = True
+        if missing:
+            return {"status": False, "message": f"Failed to restrict {len(missing)} peer(s)", "data": None}
+        return _ok(message="Restricted successfully")
+
+    @app.post("/api/deletePeers/{config_name}", dependencies=auth)
+    async def delete_peers(config_name: str, request: Request):
+        peers = state.config(config_name)
+        ids = peer_ids(await request.json())
+        missing = [pid for pid in ids if pid not in peers]
+        for pid in ids:
+            peers.pop(pid, None)
+        if missing:
+            return {"status": False, "message": f"Failed to delete {len(missing)} peer(s)", "data": None}
+        return _ok(message="Deleted successfully")
+
+    @app.get("/api/downloadPeer/{config_name}", dependencies=auth)
+    async def download_peer(config_name: str, id: str):
+        peer = state.config(config_name).get(id)
+        if peer is None:
+            return {"status": False, "message": "Peer does not exist", "data": None}
+        content = f"[Interface]\nAddress = {peer['allowed_ip']}\n\n[Peer]\nPublicKey = {id}\n"
+        return _ok({"fileName": peer["name"] or "peer", "file": content})
+
+    @app.post("/api/resetPeerData/{config_name}", dependencies=auth)
+    async def reset_peer_data(config_name: str, request: Request):
+        payload = await request.json()
+        peer = state.config(config_name).get(str(payload.get("id") or ""))
+        if peer is None:
+            return {"status": False, "message": "Peer does not exist", "data": None}
+        kind = str(payload.get("type") or "total")
+        if kind == "total":
+            peer["recv_bytes"] = peer["sent_bytes"] = 0
+        elif kind == "cumu":
+            peer["cumu_recv_bytes"] = peer["cumu_sent_bytes"] = 0
+        return _ok()
+
+    @app.post("/api/savePeerScheduleJob", dependencies=auth)
+    async def save_job(request: Request):
+        job = dict((await request.json()).get("Job") or {})
+        if not job.get("JobID") or state.find(str(job.get("Peer") or "")) is None:
+            return {"status": False, "message": "Peer does not exist", "data": None}
+        job["CreationDate"] = job.get("CreationDate") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        state.jobs[str(job["JobID"])] = job
+        return _ok([job])
+
+    @app.post("/api/deletePeerScheduleJob", dependencies=auth)
+    async def delete_job(request: Request):
+        job = dict((await request.json()).get("Job") or {})
+        if state.jobs.pop(str(job.get("JobID") or ""), None) is None:
+            return {"status": False, "message": "Job does not exist", "data": None}
+        return _ok()
+
+    return app
@@ -0,0 +1,434 @@
+"""Load test of the public subscription and reseller API hot paths.
+
+Serves the Guardino API in-process next to fake Marzban, PasarGuard and
+WGDashboard panels (app.devtools.fake_panels), creates a reseller with
+allocations on those nodes and a pool of users through the API, then drives
+a named scenario with N concurrent clients for a fixed time. Per endpoint it
+reports throughput, p50/p95/p99 latency, error rate and how long requests
+waited for a database connection from the pool.
+
+    python -m app.cli load-test --scenario client-polling-storm --duration 30
+    python -m app.cli load-test --scenario all --output load.json
+
+With --base-url the scenarios run against an app that is already running
+(same database and SECRET_KEY); pool wait is then not available. Everything
+seeded is deleted afterwards. Run it against a development database with
+Redis available; the client, the app and the panels share one process, so
+compare runs with each other rather than with production numbers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import random
+import secrets
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+import httpx
+from sqlalchemy import insert, text
+
+from app.core.db import engine
+from app.core.security import create_access_token, hash_password
+from app.devtools.fake_panels import Faults, marzban_app, pasarguard_app, running_panels, wg_dashboard_app
+from app.models.node import Node, PanelType
+from app.models.node_allocation import NodeAllocation
+from app.models.reseller import Reseller
+
+_SEED_PREFIX = "bench-load-"
+_OP_HEADER = "x-load-op"
+
+# Per-request accumulator of seconds spent in pool checkout, set by _PoolWaitRecorder.
+_pool_wait: contextvars.ContextVar[list[float] | None] = contextvars.ContextVar("load_test_pool_wait", default=None)
+
+
+@dataclass
+class LoadContext:
+    headers: dict[str, str]
+    node_ids: list[int]
+    wg_node_ids: list[int]
+    rng: random.Random
+    user_ids: list[int] = field(default_factory=list)
+    sub_tokens: list[str] = field(default_factory=list)
+    created: int = 0
+
+
+@dataclass(frozen=True)
+class Operation:
+    label: str
+    # -> (method, path, json body, authenticated) or None when there is nothing to target yet
+    build: Callable[[LoadContext], tuple[str, str, dict[str, Any] | None, bool] | None]
+    on_success: Callable[[LoadContext, httpx.Response], None] | None = None
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    description: str
+    mix: tuple[tuple[str, int], ...]  # (operation name, weight)
+    concurrency: int
+
+
+def _create_user(ctx: LoadContext):
+    ctx.created += 1
+    body = {"label": f"load-{ctx.created}-{secrets.token_hex(3)}", "total_gb": 50, "days": 30, "node_ids": ctx.node_ids}
+    return "POST", "/api/v1/reseller/user-ops", body, True
+
+
+def _remember_user(ctx: LoadContext, response: httpx.Response) -> None:
+    data = response.json()
+    ctx.user_ids.append(int(data["user_id"]))
+    ctx.sub_tokens.append(str(data["master_sub_token"]))
+
+
+def _user_op(path: str, body: dict[str, Any]):
+    def build(ctx: LoadContext):
+        if not ctx.user_ids:
+            return None
+        return "POST", f"/api/v1/reseller/users/{ctx.rng.choice(ctx.user_ids)}/{path}", body, True
+
+    return build
+
+
+def _sub(ctx: LoadContext):
+    return ("GET", f"/api/v1/sub/{ctx.rng.choice(ctx.sub_tokens)}", None, False) if ctx.sub_tokens else None
+
+
+def _wg_conf(ctx: LoadContext):
+    if not ctx.sub_tokens or not ctx.wg_node_ids:
+        return None
+    return "GET", f"/api/v1/sub/wg/{ctx.rng.choice(ctx.sub_tokens)}/{ctx.rng.choice(ctx.wg_node_ids)}.conf", None, False
+
+
+def _list_users(query: Callable[[LoadContext], str]):
+    return lambda ctx: ("GET", f"/api/v1/reseller/users?{query(ctx)}", None, True)
+
+
+OPERATIONS: dict[str, Operation] = {
+    "sub": Operation("GET /sub/{token}", _sub),
+    "wg_conf": Operation("GET /sub/wg/{token}/{node}.conf", _wg_conf),
+    "create_user": Operation("POST /reseller/user-ops", _create_user, _remember_user),
+    "extend": Operation("POST /reseller/users/{id}/extend", _user_op("extend", {"days": 30})),
+    "add_traffic": Operation("POST /reseller/users/{id}/add-traffic", _user_op("add-traffic", {"add_gb": 10})),
+    "list_users": Operation(
+        "GET /reseller/users",
+        _list_users(lambda ctx: f"limit=50&offset={ctx.rng.choice((0, 0, 0, 50, 100))}"),
+    ),
+    "list_active": Operation("GET /reseller/users?status=active", _list_users(lambda ctx: "limit=50&status=active")),
+    "search_users": Operation(
+        "GET /reseller/users?q=",
+        _list_users(lambda ctx: f"limit=50&q=load-{ctx.rng.randint(1, max(1, ctx.created))}"),
+    ),
+    "stats": Operation("GET /reseller/stats", lambda ctx: ("GET", "/api/v1/reseller/stats", None, True)),
+}
+
+SCENARIOS: dict[str, Scenario] = {
+    s.name: s
+    for s in (
+        Scenario(
+            "client-polling-storm",
+            "VPN clients refreshing subscriptions and WireGuard configs",
+            (("sub", 85), ("wg_conf", 15)),
+            concurrency=200,
+        ),
+        Scenario(
+            "bot-bulk-creation",
+            "A sales bot creating users while renewing existing ones",
+            (("create_user", 70), ("extend", 15), ("add_traffic", 15)),
+            concurrency=20,
+        ),
+        Scenario(
+            "dashboard-refresh",
+            "Reseller dashboards reloading user lists, filters, search and stats",
+            (("list_users", 40), ("list_active", 20), ("search_users", 20), ("stats", 20)),
+            concurrency=50,
+        ),
+    )
+}
+
+
+class _PoolWaitRecorder:
+    """ASGI wrapper that attributes pool checkout time to the operation named in the request header."""
+
+    def __init__(self, app: Any):
+        self.app = app
+        self.waits: dict[str, list[float]] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        label = dict(scope.get("headers") or []).get(_OP_HEADER.encode(), b"").decode() or scope.get("path", "")
+        bucket = [0.0]
+        token = _pool_wait.set(bucket)
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            _pool_wait.reset(token)
+            self.waits.setdefault(label, []).append(bucket[0])
+
+
+def _time_pool_checkout() -> Callable[[], None]:
+    """Time every connection checkout of the app engine; returns the undo function."""
+    pool = engine.sync_engine.pool
+    original = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return original()
+        finally:
+            bucket = _pool_wait.get()
+            if bucket is not None:
+                bucket[0] += time.perf_counter() - started
+
+    pool._do_get = timed_do_get  # type: ignore[method-assign]
+    return lambda: pool.__dict__.pop("_do_get", None)
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+@dataclass
+class _EndpointSamples:
+    latencies: list[float] = field(default_factory=list)
+    statuses: dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def add(self, seconds: float, status: str, ok: bool) -> None:
+        self.latencies.append(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self, duration: float, pool_waits: list[float] | None) -> dict[str, Any]:
+        ms = sorted(s * 1000 for s in self.latencies)
+        out: dict[str, Any] = {
+            "requests": len(ms),
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(ms), 4) if ms else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+            "throughput_rps": round(len(ms) / duration, 1) if duration > 0 else 0.0,
+            "p50_ms": round(_percentile(ms, 50), 1),
+            "p95_ms": round(_percentile(ms, 95), 1),
+            "p99_ms": round(_percentile(ms, 99), 1),
+            "pool_wait_mean_ms": None,
+            "pool_wait_p95_ms": None,
+        }
+        if pool_waits:
+            waits = sorted(w * 1000 for w in pool_waits)
+            out["pool_wait_mean_ms"] = round(sum(waits) / len(waits), 2)
+            out["pool_wait_p95_ms"] = round(_percentile(waits, 95), 2)
+        return out
+
+
+async def _send(client: httpx.AsyncClient, ctx: LoadContext, op: Operation) -> tuple[float, str, bool] | None:
+    request = op.build(ctx)
+    if request is None:
+        return None
+    method, path, body, authenticated = request
+    headers = {_OP_HEADER: op.label, **(ctx.headers if authenticated else {})}
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=body, headers=headers)
+    except httpx.HTTPError as e:
+        return time.perf_counter() - started, type(e).__name__, False
+    elapsed = time.perf_counter() - started
+    ok = response.status_code < 400
+    if ok and op.on_success is not None:
+        op.on_success(ctx, response)
+    return elapsed, str(response.status_code), ok
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    ctx: LoadContext,
+    scenario: Scenario,
+    *,
+    duration: float,
+    concurrency: int | None = None,
+    recorder: _PoolWaitRecorder | None = None,
+) -> dict[str, Any]:
+    ops = [OPERATIONS[name] for name, _weight in scenario.mix]
+    weights = [weight for _name, weight in scenario.mix]
+    samples: dict[str, _EndpointSamples] = {op.label: _EndpointSamples() for op in ops}
+    if recorder is not None:
+        recorder.waits.clear()
+    workers = max(1, concurrency or scenario.concurrency)
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            op = ctx.rng.choices(ops, weights)[0]
+            sample = await _send(client, ctx, op)
+            if sample is None:
+                await asyncio.sleep(0.01)
+                continue
+            samples[op.label].add(*sample)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+    endpoints = {
+        label: s.summary(elapsed, recorder.waits.get(label) if recorder is not None else None)
+        for label, s in samples.items()
+        if s.latencies
+    }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "scenario": scenario.name,
+        "concurrency": workers,
+        "duration_seconds": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def _print_result(result: dict[str, Any]) -> None:
+    print(
+        f"[LOAD] {result['scenario']} concurrency={result['concurrency']} "
+        f"requests={result['requests']} throughput={result['throughput_rps']}/s"
+    )
+    for label, e in result["endpoints"].items():
+        pool = "-" if e["pool_wait_mean_ms"] is None else f"{e['pool_wait_mean_ms']:.2f}/{e['pool_wait_p95_ms']:.2f}ms"
+        print(
+            f"  {label:<40} n={e['requests']:6d} rps={e['throughput_rps']:7.1f} "
+            f"p50={e['p50_ms']:7.1f} p95={e['p95_ms']:7.1f} p99={e['p99_ms']:7.1f}ms "
+            f"err={e['error_rate'] * 100:5.1f}% pool_wait(mean/p95)={pool}"
+        )
+
+
+async def _cleanup() -> None:
+    pattern = {"pattern": _SEED_PREFIX + "%"}
+    resellers = "SELECT id FROM resellers WHERE username LIKE :pattern"
+    nodes = "SELECT id FROM nodes WHERE name LIKE :pattern"
+    async with engine.begin() as conn:
+        for table in ("wallet_holds", "ledger_transactions", "orders"):
+            await conn.execute(text(f"DELETE FROM {table} WHERE reseller_id IN ({resellers})"), pattern)
+        await conn.execute(text(f"DELETE FROM subaccounts WHERE node_id IN ({nodes})"), pattern)
+        await conn.execute(text(f"DELETE FROM users WHERE owner_reseller_id IN ({resellers})"), pattern)
+        for table in ("node_allocations", "dashboard_daily_metrics", "dashboard_daily_activity", "api_tokens"):
+            await conn.execute(text(f"DELETE FROM {table} WHERE reseller_id IN ({resellers})"), pattern)
+        await conn.execute(text(f"DELETE FROM node_allocations WHERE node_id IN ({nodes})"), pattern)
+        await conn.execute(text("DELETE FROM nodes WHERE name LIKE :pattern"), pattern)
+        await conn.execute(text("DELETE FROM resellers WHERE username LIKE :pattern"), pattern)
+
+
+async def _seed(panel_urls: list[tuple[PanelType, str]]) -> LoadContext:
+    username = f"{_SEED_PREFIX}{secrets.token_hex(4)}"
+    async with engine.begin() as conn:
+        reseller_id = (
+            await conn.execute(
+                insert(Reseller)
+                .values(
+                    username=username,
+                    password_hash=hash_password(secrets.token_urlsafe(16)),
+                    role="reseller",
+                    balance=10 ** 15,
+                    price_per_gb=0,
+                    price_per_day=0,
+                    bundle_price_per_gb=0,
+                )
+                .returning(Reseller.id)
+            )
+        ).scalar_one()
+        node_ids: list[int] = []
+        wg_node_ids: list[int] = []
+        for i, (panel_type, url) in enumerate(panel_urls):
+            credentials = {"apikey": "sim"} if panel_type == PanelType.wg_dashboard else {"username": "admin", "password": "admin"}
+            node_id = (
+                await conn.execute(
+                    insert(Node)
+                    .values(name=f"{_SEED_PREFIX}{i + 1}", panel_type=panel_type, base_url=url, credentials=credentials, tags=[])
+                    .returning(Node.id)
+                )
+            ).scalar_one()
+            await conn.execute(
+                insert(NodeAllocation).values(reseller_id=reseller_id, node_id=node_id, enabled=True, default_for_reseller=True)
+            )
+            node_ids.append(node_id)
+            if panel_type == PanelType.wg_dashboard:
+                wg_node_ids.append(node_id)
+    token = create_access_token(subject=username, role="reseller", expires_minutes=24 * 60)
+    return LoadContext(
+        headers={"Authorization": f"Bearer {token}"},
+        node_ids=node_ids,
+        wg_node_ids=wg_node_ids,
+        rng=random.Random(),
+    )
+
+
+async def _create_users(client: httpx.AsyncClient, ctx: LoadContext, count: int, concurrency: int = 8) -> None:
+    op = OPERATIONS["create_user"]
+    remaining = [count]
+    failures: list[str] = []
+
+    async def worker() -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            sample = await _send(client, ctx, op)
+            if sample is not None and not sample[2]:
+                failures.append(sample[1])
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    if failures and len(failures) * 2 >= count:
+        raise SystemExit(f"load-test setup: {len(failures)}/{count} user creations failed (statuses {sorted(set(failures))})")
+
+
+async def run_load_test(
+    scenarios: list[str],
+    duration: float = 30.0,
+    concurrency: int | None = None,
+    users: int = 200,
+    panels: tuple[str, ...] = ("marzban", "pasarguard", "wg_dashboard"),
+    latency_ms: int = 30,
+    base_url: str | None = None,
+    output: str | None = None,
+) -> list[dict[str, Any]]:
+    from app.main import app
+
+    panel_types = [PanelType(p) for p in panels]
+    faults = Faults(latency=max(0, latency_ms) / 1000.0)
+    panel_apps = [
+        wg_dashboard_app(faults=faults)
+        if t == PanelType.wg_dashboard
+        else (marzban_app if t == PanelType.marzban else pasarguard_app)(faults=faults)
+        for t in panel_types
+    ]
+    recorder = None if base_url else _PoolWaitRecorder(app)
+    results: list[dict[str, Any]] = []
+
+    async with running_panels(panel_apps) as panel_urls:
+        ctx = await _seed(list(zip(panel_types, panel_urls)))
+        undo_timing = _time_pool_checkout() if recorder is not None else None
+        try:
+            serving = running_panels([recorder], lifespan="on") if recorder is not None else nullcontext([str(base_url).rstrip("/")])
+            async with serving as urls:
+                limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+                async with httpx.AsyncClient(base_url=urls[0], limits=limits, timeout=60.0) as client:
+                    started = time.perf_counter()
+                    await _create_users(client, ctx, max(1, users))
+                    print(f"[LOAD] setup: {len(ctx.user_ids)} users on {len(ctx.node_ids)} nodes in {time.perf_counter() - started:.1f}s")
+                    for name in scenarios:
+                        result = await run_scenario(
+                            client, ctx, SCENARIOS[name], duration=duration, concurrency=concurrency, recorder=recorder
+                        )
+                        _print_result(result)
+                        results.append(result)
+        finally:
+            if undo_timing is not None:
+                undo_timing()
+            await _cleanup()
+
+    if output:
+        with open(output, "w") as fh:
+            json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "results": results}, fh, indent=2)
+        print(f"[LOAD] results written to {output}")
+    return results
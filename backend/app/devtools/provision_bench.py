@@ -0,0 +1,68 @@
+"""Benchmark: sequential vs concurrent multi-node provisioning.
+
+Runs services.provisioning (the code path of create_user and change-nodes)
+against local fake Marzban panels with a fixed latency per request, once
+with the fan-out limited to one call at a time (the old behaviour) and once
+with the configured REMOTE_FANOUT_* limits. Every round also runs the
+compensating delete. `python -m app.cli bench-provision`.
+"""
+
+from __future__ import annotations
+
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.devtools.fake_panels import Faults, marzban_app, running_panels
+from app.models.node import Node, PanelType
+from app.services.provisioning import provision_on_nodes, undo_provisioning
+
+
+def _summary(samples: list[float]) -> str:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]
+    return f"p50={statistics.median(ms):7.1f}ms p95={p95:7.1f}ms mean={statistics.fmean(ms):7.1f}ms"
+
+
+async def run_provision_benchmark(nodes: int = 6, latency_ms: int = 150, rounds: int = 10) -> dict[str, float]:
+    nodes = max(1, nodes)
+    rounds = max(1, rounds)
+    latency = max(0, latency_ms) / 1000.0
+    expire_at = datetime.now(timezone.utc) + timedelta(days=30)
+    medians: dict[str, float] = {}
+
+    async with running_panels([marzban_app(faults=Faults(latency=latency)) for _ in range(nodes)]) as urls:
+        fake_nodes = [
+            Node(id=i + 1, name=f"bench-{i + 1}", panel_type=PanelType.marzban, base_url=url, credentials={"token": "bench"})
+            for i, url in enumerate(urls)
+        ]
+        print(f"[BENCH-PROVISION] nodes={nodes} latency={latency_ms}ms/request rounds={rounds}")
+        for mode, concurrency in (("sequential", 1), ("concurrent", None)):
+            provision_times: list[float] = []
+            undo_times: list[float] = []
+            for round_no in range(rounds):
+                started = time.perf_counter()
+                outcomes = await provision_on_nodes(
+                    fake_nodes,
+                    {},
+                    label=f"bench-{mode}-{round_no}",
+                    total_gb=10,
+                    expire_at=expire_at,
+                    concurrency=concurrency,
+                )
+                provision_times.append(time.perf_counter() - started)
+                failed = [o for o in outcomes if not o.ok]
+                if failed:
+                    raise RuntimeError(f"provision failed on node#{failed[0].node.id}: {failed[0].error}")
+
+                started = time.perf_counter()
+                errors = await undo_provisioning(outcomes, concurrency=concurrency)
+                undo_times.append(time.perf_counter() - started)
+                if errors:
+                    raise RuntimeError(f"compensation failed: {errors[0]}")
+            medians[mode] = statistics.median(provision_times)
+            print(f"  {mode:<10} provision {_summary(provision_times)} | compensate {_summary(undo_times)}")
+
+    if medians.get("concurrent"):
+        print(f"  speedup (p50 provision): {medians['sequential'] / medians['concurrent']:.1f}x")
+    return medians
@@ -0,0 +1,436 @@
+"""Benchmark: usage sync and expiry scan end to end on seeded data.
+
+Seeds the configured database with resellers, users and subaccounts spread
+over simulated Marzban, PasarGuard and WGDashboard nodes (the in-process
+panels of app.devtools.fake_panels), then runs _sync_usage_async and
+_expire_due_users_async the way the Celery tasks do. Every phase reports
+wall time, users/sec, upstream requests, DB statements and peak RSS. The
+result is written as JSON and can be compared with an earlier run, e.g. to
+check a different USAGE_SYNC_BATCH_SIZE or USAGE_SYNC_REMOTE_LIST_PAGE_SIZE:
+
+    python -m app.cli bench-usage-sync --users 100000 --output base.json
+    python -m app.cli bench-usage-sync --users 100000 --set USAGE_SYNC_BATCH_SIZE=2000 --baseline base.json
+
+The tasks commit as they go, so the seeded rows are deleted afterwards
+instead of rolled back. Use a dedicated database (the run refuses to start
+when live users exist) and a Redis instance. The fake panels share the
+process and event loop with the tasks, so compare runs with each other
+rather than with production timings.
+"""
+
+from __future__ import annotations
+
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Iterator
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+from app.core.db import engine
+from app.devtools.fake_panels import (
+    FaultInjector,
+    Faults,
+    UserStore,
+    WGState,
+    marzban_app,
+    pasarguard_app,
+    running_panels,
+    wg_dashboard_app,
+)
+from app.models.node import Node, PanelType
+from app.models.subaccount import SubAccount
+from app.services.task_metrics import TaskRunStats
+from app.services.wg_peer_index import invalidate_peer_index, peer_index_key
+
+_SEED_PREFIX = "bench-usage-"
+_WG_CONFIGURATIONS = ("wg0", "wg1")
+_DATA_LIMIT_GB = 50
+_INSERT_CHUNK = 5000
+_MB = 1024 ** 2
+
+# Settings that shape the sync; recorded with every result so runs stay comparable.
+_TRACKED_SETTINGS = (
+    "USAGE_SYNC_BATCH_SIZE",
+    "USAGE_SYNC_REMOTE_LIST_PAGE_SIZE",
+    "USAGE_SYNC_REMOTE_LIST_MAX_PAGES",
+    "USAGE_SYNC_TOUCH_SECONDS",
+    "EXPIRY_SYNC_BATCH_SIZE",
+    "REMOTE_FANOUT_CONCURRENCY",
+    "REMOTE_FANOUT_PER_HOST",
+    "PANEL_HTTP_MAX_CONNECTIONS",
+    "PANEL_HTTP_MAX_KEEPALIVE",
+    "WG_PEER_INDEX_TTL_SECONDS",
+)
+_COMPARED = ("wall_seconds", "users_per_second", "upstream_requests", "db_statements", "peak_rss_mb")
+
+
+def apply_setting_overrides(pairs: list[str]) -> dict[str, Any]:
+    """Apply KEY=VALUE overrides to the process settings, coerced to the current type."""
+    applied: dict[str, Any] = {}
+    for pair in pairs:
+        key, sep, raw = pair.partition("=")
+        key = key.strip()
+        if not sep or not hasattr(settings, key):
+            raise SystemExit(f"unknown setting override: {pair}")
+        current = getattr(settings, key)
+        if isinstance(current, bool):
+            value: Any = raw.strip().lower() in {"1", "true", "yes", "on"}
+        elif isinstance(current, (int, float)):
+            value = type(current)(raw)
+        else:
+            value = raw
+        setattr(settings, key, value)
+        applied[key] = value
+    return applied
+
+
+def _reset_peak_rss() -> bool:
+    # Linux resets VmHWM when "5" is written to clear_refs; elsewhere the
+    # reported peak covers the whole process, seeding included.
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / _MB if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def _count_statements() -> Iterator[list[int]]:
+    counter = [0]
+
+    def on_execute(*_args: Any) -> None:
+        counter[0] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+
+
+def _node_positions(users: int, nodes: int, subs_per_user: int) -> list[list[int]]:
+    """User positions served by each node; user p has subaccounts on nodes p, p+1, ... (mod nodes)."""
+    positions: list[list[int]] = [[] for _ in range(nodes)]
+    for p in range(users):
+        for k in range(subs_per_user):
+            positions[(p + k) % nodes].append(p)
+    return positions
+
+
+def _build_panels(panel_types: list[PanelType], counts: list[int], latency: float, max_used_ratio: float, seed: int):
+    """One seeded fake panel per node; returns (apps, remote identifiers per node, stores)."""
+    apps = []
+    identifiers: list[list[str]] = []
+    stores: list[UserStore | WGState] = []
+    for i, (panel_type, count) in enumerate(zip(panel_types, counts)):
+        node_faults = Faults(latency=latency, seed=seed + i)
+        if panel_type == PanelType.wg_dashboard:
+            state = WGState(_WG_CONFIGURATIONS, seed=seed + i)
+            identifiers.append(state.seed(count, data_limit_gb=_DATA_LIMIT_GB, max_used_ratio=max_used_ratio))
+            apps.append(wg_dashboard_app(state, node_faults))
+            stores.append(state)
+        else:
+            store = UserStore(seed=seed + i)
+            identifiers.append(store.seed(count, data_limit_gb=_DATA_LIMIT_GB, max_used_ratio=max_used_ratio))
+            apps.append((marzban_app if panel_type == PanelType.marzban else pasarguard_app)(store, node_faults))
+            stores.append(store)
+    return apps, identifiers, stores
+
+
+async def _cleanup(conn: AsyncConnection) -> int:
+    pattern = {"pattern": _SEED_PREFIX + "%"}
+    resellers = "SELECT id FROM resellers WHERE username LIKE :pattern"
+    await conn.execute(
+        text("DELETE FROM subaccounts WHERE node_id IN (SELECT id FROM nodes WHERE name LIKE :pattern)"), pattern
+    )
+    deleted = (await conn.execute(text(f"DELETE FROM users WHERE owner_reseller_id IN ({resellers})"), pattern)).rowcount
+    for table in ("dashboard_daily_metrics", "dashboard_daily_activity"):
+        await conn.execute(text(f"DELETE FROM {table} WHERE reseller_id IN ({resellers})"), pattern)
+    await conn.execute(text("DELETE FROM nodes WHERE name LIKE :pattern"), pattern)
+    await conn.execute(text("DELETE FROM resellers WHERE username LIKE :pattern"), pattern)
+    return int(deleted or 0)
+
+
+async def _seed_database(
+    conn: AsyncConnection,
+    *,
+    users: int,
+    resellers: int,
+    expired_percent: int,
+    nodes: list[tuple[PanelType, str, dict[str, Any]]],
+    positions: list[list[int]],
+    identifiers: list[list[str]],
+) -> None:
+    await conn.execute(
+        text(
+            """
+            INSERT INTO resellers (
+              username, password_hash, role, status, balance, price_per_gb, price_per_day,
+              bundle_price_per_gb, can_create_subreseller, two_factor_enabled,
+              two_factor_recovery_hashes, created_at, updated_at
+            )
+            SELECT CAST(:prefix AS text) || g, 'x', 'reseller', 'active', 0, 0, 0, 0, false, false, '[]', NOW(), NOW()
+            FROM generate_series(1, :resellers) AS g
+            """
+        ),
+        {"prefix": _SEED_PREFIX, "resellers": resellers},
+    )
+    reseller_ids = (
+        await conn.execute(
+            text("SELECT id FROM resellers WHERE username LIKE :pattern ORDER BY id"),
+            {"pattern": _SEED_PREFIX + "%"},
+        )
+    ).scalars().all()
+    # All users are active; `expired_percent` of them are already past expiry
+    # and the rest expire over the next year.
+    await conn.execute(
+        text(
+            """
+            INSERT INTO users (
+              owner_reseller_id, label, total_gb, used_bytes, expire_at, status,
+              master_sub_token, node_selection_mode, metadata, created_at, updated_at
+            )
+            SELECT
+              (CAST(:ids AS integer[]))[1 + (g % cardinality(CAST(:ids AS integer[])))],
+              CAST(:prefix AS text) || g,
+              :total_gb,
+              0,
+              NOW() + CASE WHEN g % 100 < :expired_percent THEN -INTERVAL '1 hour' ELSE (1 + g % 365) * INTERVAL '1 day' END,
+              'active',
+              md5(CAST(:prefix AS text) || g || random()::text),
+              'manual',
+              '{}',
+              NOW(),
+              NOW()
+            FROM generate_series(1, :users) AS g
+            """
+        ),
+        {
+            "ids": list(reseller_ids),
+            "prefix": _SEED_PREFIX,
+            "users": users,
+            "total_gb": _DATA_LIMIT_GB,
+            "expired_percent": expired_percent,
+        },
+    )
+    user_ids = (
+        await conn.execute(
+            text("SELECT id FROM users WHERE owner_reseller_id = ANY(CAST(:ids AS integer[])) ORDER BY id"),
+            {"ids": list(reseller_ids)},
+        )
+    ).scalars().all()
+
+    rows: list[dict[str, Any]] = []
+    for i, (panel_type, base_url, credentials) in enumerate(nodes):
+        node_id = (
+            await conn.execute(
+                insert(Node)
+                .values(
+                    name=f"{_SEED_PREFIX}{i + 1}",
+                    panel_type=panel_type,
+                    base_url=base_url,
+                    credentials=credentials,
+                    tags=[],
+                )
+                .returning(Node.id)
+            )
+        ).scalar_one()
+        for p, remote_id in zip(positions[i], identifiers[i]):
+            rows.append({"user_id": user_ids[p], "node_id": node_id, "remote_identifier": remote_id, "used_bytes": 0})
+            if len(rows) >= _INSERT_CHUNK:
+                await conn.execute(insert(SubAccount), rows)
+                rows = []
+    if rows:
+        await conn.execute(insert(SubAccount), rows)
+    await conn.execute(text("ANALYZE users"))
+    await conn.execute(text("ANALYZE subaccounts"))
+
+
+async def _run_phase(run: Callable[[], Awaitable[TaskRunStats]], injectors: list[FaultInjector]) -> dict[str, Any]:
+    requests_before = sum(i.counts["requests"] for i in injectors)
+    phase_scoped = _reset_peak_rss()
+    with _count_statements() as statements:
+        started = time.perf_counter()
+        stats = await run()
+        wall = time.perf_counter() - started
+    return {
+        "wall_seconds": round(wall, 3),
+        "users_per_second": round(stats.scanned_users / wall, 1) if wall > 0 else 0.0,
+        "upstream_requests": sum(i.counts["requests"] for i in injectors) - requests_before,
+        "db_statements": statements[0],
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "peak_rss_scope": "phase" if phase_scoped else "process",
+        "stats": asdict(stats),
+    }
+
+
+def _print_phase(name: str, phase: dict[str, Any]) -> None:
+    print(
+        f"  {name:<16} wall={phase['wall_seconds']:8.2f}s users/s={phase['users_per_second']:9.1f} "
+        f"upstream={phase['upstream_requests']:7d} statements={phase['db_statements']:6d} "
+        f"peak_rss={phase['peak_rss_mb']:7.1f}MB"
+    )
+
+
+def compare_with_baseline(result: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """Print each phase metric next to the baseline value and the relative change."""
+    if baseline.get("params") != result["params"]:
+        print("  note: the baseline was seeded with different parameters")
+    changed = sorted(k for k in result["settings"] if baseline.get("settings", {}).get(k) != result["settings"][k])
+    if changed:
+        print("  settings changed: " + ", ".join(f"{k}={result['settings'][k]}" for k in changed))
+    for name, phase in result["phases"].items():
+        before = (baseline.get("phases") or {}).get(name)
+        if not before:
+            continue
+        parts = []
+        for metric in _COMPARED:
+            old, new = before.get(metric), phase.get(metric)
+            if old:
+                parts.append(f"{metric} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+            else:
+                parts.append(f"{metric} {new}")
+        print(f"  {name:<16} " + " | ".join(parts))
+
+
+async def run_usage_benchmark(
+    users: int = 10000,
+    resellers: int = 20,
+    nodes: int = 6,
+    subs_per_user: int = 2,
+    panels: tuple[str, ...] = ("marzban", "pasarguard", "wg_dashboard"),
+    latency_ms: int = 20,
+    expired_percent: int = 1,
+    cycles: int = 2,
+    traffic_mb: int = 500,
+    overrides: list[str] | None = None,
+    output: str | None = "usage-bench.json",
+    baseline: str | None = None,
+    keep: bool = False,
+    seed: int = 1,
+) -> dict[str, Any]:
+    # Imported here: the task modules pull in the Celery app.
+    from app.tasks.expiry import _expire_due_users_async
+    from app.tasks.usage import _sync_usage_async
+
+    users = max(1, users)
+    resellers = max(1, resellers)
+    nodes = max(1, nodes)
+    subs_per_user = max(1, min(subs_per_user, nodes))
+    expired_percent = max(0, min(100, expired_percent))
+    cycles = max(1, cycles)
+    panel_types = [PanelType(panels[i % len(panels)]) for i in range(nodes)]
+    applied = apply_setting_overrides(list(overrides or []))
+    baseline_data = None
+    if baseline:
+        with open(baseline) as fh:
+            baseline_data = json.load(fh)
+
+    params = {
+        "users": users,
+        "resellers": resellers,
+        "nodes": nodes,
+        "subs_per_user": subs_per_user,
+        "panels": [p.value for p in panel_types],
+        "latency_ms": latency_ms,
+        "expired_percent": expired_percent,
+        "cycles": cycles,
+        "traffic_mb": traffic_mb,
+        "seed": seed,
+    }
+    result: dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "params": params,
+        "settings": {k: getattr(settings, k) for k in (*_TRACKED_SETTINGS, *applied) if hasattr(settings, k)},
+        "phases": {},
+    }
+    print(
+        f"[BENCH-USAGE] users={users} subaccounts={users * subs_per_user} nodes={nodes} "
+        f"({', '.join(sorted({p.value for p in panel_types}))}) latency={latency_ms}ms/request"
+    )
+
+    started = time.perf_counter()
+    positions = _node_positions(users, nodes, subs_per_user)
+    # Keep a user's usage summed over its subaccounts mostly under its quota,
+    # so exhaustion is an occasional event rather than the common case.
+    apps, identifiers, stores = _build_panels(
+        panel_types,
+        [len(p) for p in positions],
+        max(0, latency_ms) / 1000.0,
+        1.1 / subs_per_user,
+        seed,
+    )
+    injectors: list[FaultInjector] = [app.state.faults for app in apps]
+
+    async with running_panels(apps) as urls:
+        node_rows = [
+            (panel_type, url, {"apikey": "sim"} if panel_type == PanelType.wg_dashboard else {"token": "bench"})
+            for panel_type, url in zip(panel_types, urls)
+        ]
+        async with engine.begin() as conn:
+            leftovers = await _cleanup(conn)
+            if leftovers:
+                print(f"  removed {leftovers} users left over from an earlier run")
+            live = (await conn.execute(text("SELECT count(*) FROM users WHERE status <> 'deleted'"))).scalar_one()
+            if live:
+                raise SystemExit(f"bench-usage-sync needs a dedicated database: found {live} live users")
+            await _seed_database(
+                conn,
+                users=users,
+                resellers=resellers,
+                expired_percent=expired_percent,
+                nodes=node_rows,
+                positions=positions,
+                identifiers=identifiers,
+            )
+        result["seed_seconds"] = round(time.perf_counter() - started, 3)
+        print(f"  seeded in {result['seed_seconds']:.1f}s")
+
+        try:
+            for cycle in range(1, cycles + 1):
+                if cycle > 1:
+                    # A new sync interval: more traffic, and (as USAGE_SYNC_SECONDS is
+                    # longer than WG_PEER_INDEX_TTL_SECONDS) no cached peer lists.
+                    for store in stores:
+                        store.add_traffic(traffic_mb * _MB)
+                    for panel_type, url, credentials in node_rows:
+                        if panel_type == PanelType.wg_dashboard:
+                            invalidate_peer_index(peer_index_key(url, credentials["apikey"]))
+                name = f"sync_usage_{cycle}"
+                result["phases"][name] = await _run_phase(_sync_usage_async, injectors)
+                _print_phase(name, result["phases"][name])
+            result["phases"]["expire_due_users"] = await _run_phase(_expire_due_users_async, injectors)
+            _print_phase("expire_due_users", result["phases"]["expire_due_users"])
+        finally:
+            if not keep:
+                async with engine.begin() as conn:
+                    await _cleanup(conn)
+
+    if output:
+        with open(output, "w") as fh:
+            json.dump(result, fh, indent=2, default=str)
+        print(f"  results written to {output}")
+    if baseline_data is not None:
+        print(f"[BENCH-USAGE] compared with {baseline}")
+        compare_with_baseline(result, baseline_data)
+    return result
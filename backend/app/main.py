@@ -1,12 +1,18 @@
+import hmac
 import logging
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from app.core.config import settings
 from app.api.v1.router import api_router
 from app.core.db import AsyncSessionLocal
+from app.core.metrics import MetricsMiddleware, render_latest
+from app.services import dashboard_rollups  # noqa: F401  (registers rollup ORM hooks)
+from app.services.http_client import aclose_shared_clients, drop_shared_clients
+from app.services.principal_cache import start_principal_cache, stop_principal_cache
+from app.services.subscription_tokens import start_revocation_listener, stop_revocation_listener
 from sqlalchemy import text
 from redis.asyncio import Redis
 
@@ -49,6 +55,17 @@ app = FastAPI(
 @app.on_event("startup")
 async def _on_startup() -> None:
     _validate_runtime_security()
+    # Forked workers must not reuse pooled panel clients from the parent.
+    drop_shared_clients()
+    start_principal_cache()
+    start_revocation_listener()
+
+
+@app.on_event("shutdown")
+async def _on_shutdown() -> None:
+    await stop_principal_cache()
+    await stop_revocation_listener()
+    await aclose_shared_clients()
 
 if settings.cors_origins_list:
     app.add_middleware(
@@ -59,6 +76,9 @@ if settings.cors_origins_list:
         allow_headers=["*"],
     )
 
+if bool(getattr(settings, "METRICS_ENABLED", True)):
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
 
 
@@ -102,6 +122,18 @@ async def openapi():
     _docs_guard()
     return JSONResponse(app.openapi())
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: str | None = Header(default=None)):
+    # nginx does not proxy /metrics; scrape the api service directly.
+    if not bool(getattr(settings, "METRICS_ENABLED", True)):
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = str(getattr(settings, "METRICS_TOKEN", "") or "")
+    if token and not hmac.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 async def health():
     db_ok = False
@@ -7,4 +7,7 @@ from app.models.order import Order
 from app.models.ledger import LedgerTransaction
 from app.models.app_setting import AppSetting
 from app.models.api_token import ApiToken
-from app.models.dashboard_metric import DashboardDailyMetric
+from app.models.dashboard_metric import DashboardDailyActivity, DashboardDailyMetric
+from app.models.revoked_sub_token import RevokedSubToken
+from app.models.wallet_hold import WalletHold
+from app.models.sync_run import SyncRun
@@ -29,3 +29,26 @@ class DashboardDailyMetric(Base, TimestampMixin):
 
     sold_gb_total: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
     used_bytes_total: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+
+class DashboardDailyActivity(Base, TimestampMixin):
+    """Per-reseller daily order/ledger counters, kept up to date as rows are written."""
+
+    __tablename__ = "dashboard_daily_activity"
+    __table_args__ = (
+        UniqueConstraint("day", "reseller_id", name="uq_dashboard_daily_activity_day_reseller"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, nullable=False, index=True)
+    reseller_id: Mapped[int] = mapped_column(Integer, ForeignKey("resellers.id"), nullable=False, index=True)
+
+    orders_total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    orders_completed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # purchased_gb of completed orders, bucketed by order creation day
+    traffic_gb: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+    ledger_entries: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    ledger_net: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    # sum of -amount over negative ledger entries (charges)
+    spent: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
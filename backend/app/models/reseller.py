@@ -38,6 +38,8 @@ class Reseller(Base, TimestampMixin):
 
     # BigInteger so high-value (e.g. Rial-denominated) wallets cannot overflow int32.
     balance: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    # Sum of open wallet holds (migration 0018); spendable = balance - held_balance.
+    held_balance: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
 
     # default pricing for this reseller
     price_per_gb: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
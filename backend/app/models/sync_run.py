@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, Index, Integer, JSON, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.db import Base
+
+
+class SyncRun(Base):
+    """One finished run of a periodic sync task (sync_usage, expire_due_users)."""
+
+    __tablename__ = "sync_runs"
+    __table_args__ = (
+        Index("ix_sync_runs_task_started_at", "task", "started_at"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    task: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)  # ok | failed
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    duration_ms: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    scanned_users: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    # TaskRunStats counters, seconds per phase, seconds per remote fetch of an
+    # access group, and per panel host request stats (calls, failures,
+    # total_ms, max_ms, slowest_operation).
+    counters: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    phases: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    group_fetches: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    node_calls: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    error: Mapped[str | None] = mapped_column(String(500), nullable=True)
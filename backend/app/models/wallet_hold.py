@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import enum
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, Enum, ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.db import Base
+from app.models.common import TimestampMixin
+
+
+class WalletHoldStatus(str, enum.Enum):
+    held = "held"
+    captured = "captured"
+    released = "released"
+
+
+class WalletHold(Base, TimestampMixin):
+    """Funds reserved for one pending order while its panel calls run."""
+
+    __tablename__ = "wallet_holds"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    reseller_id: Mapped[int] = mapped_column(Integer, ForeignKey("resellers.id"), index=True, nullable=False)
+    order_id: Mapped[int] = mapped_column(Integer, ForeignKey("orders.id"), unique=True, index=True, nullable=False)
+    # Target user of the operation (None for create); at most one open hold per user.
+    user_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("users.id"), index=True, nullable=True)
+
+    amount: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status: Mapped[WalletHoldStatus] = mapped_column(
+        Enum(WalletHoldStatus), default=WalletHoldStatus.held, nullable=False
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    settled_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -55,6 +55,11 @@ class CreateUserRequest(BaseModel):
             raise ValueError("Use either node_ids or node_group, not both.")
         return self
 
+class NodeProvisionResult(BaseModel):
+    node_id: int
+    ok: bool
+    error: Optional[str] = None
+
 class CreateUserResponse(BaseModel):
     user_id: int
     label: str
@@ -66,6 +71,8 @@ class CreateUserResponse(BaseModel):
     charged_amount: int
     balance_after: int
     nodes_provisioned: List[int]
+    # Per selected node: provisioned or the panel error (partial success is billed per node).
+    node_results: List[NodeProvisionResult] = Field(default_factory=list)
 
 class PriceQuoteResponse(BaseModel):
     total_amount: int
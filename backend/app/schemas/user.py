@@ -13,4 +13,5 @@ class UserOut(BaseModel):
 
 class UsersPage(BaseModel):
     items: list[UserOut]
-    total: int
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
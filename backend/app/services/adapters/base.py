@@ -76,3 +76,10 @@ class PanelAdapter(Protocol):
     async def get_used_bytes(self, remote_identifier: str) -> int | None: ...
 
     async def get_user_snapshot(self, remote_identifier: str) -> RemoteUserSnapshot: ...
+
+    # Optional bulk capabilities, each returning {remote_identifier: error} for
+    # the failures. Call them through services.adapters.bulk, which falls back
+    # to the per-user methods above when an adapter does not implement them:
+    #   async def disable_many(self, remote_identifiers: list[str]) -> dict[str, BaseException]
+    #   async def delete_many(self, remote_identifiers: list[str]) -> dict[str, BaseException]
+    #   async def update_limits_many(self, items: list[tuple[str, int, datetime]]) -> dict[str, BaseException]
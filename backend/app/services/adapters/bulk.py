@@ -0,0 +1,91 @@
+"""Bulk remote operations over one adapter.
+
+Adapters may implement disable_many / delete_many / update_limits_many
+natively (a few requests per chunk of users). These helpers call the native
+method when the adapter has one and otherwise run the per-user method
+concurrently under the REMOTE_FANOUT_* limits. Every helper returns
+{remote_identifier: exception} for the identifiers that failed; an empty
+dict means all succeeded.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from functools import partial
+from typing import Any, Awaitable, Callable, Iterable, Mapping, Sequence
+
+from app.services.remote_fanout import run_bounded
+
+BulkErrors = dict[str, BaseException]
+
+
+def unique_identifiers(remote_identifiers: Iterable[str]) -> list[str]:
+    out: list[str] = []
+    seen: set[str] = set()
+    for rid in remote_identifiers:
+        key = str(rid or "").strip()
+        if key and key not in seen:
+            seen.add(key)
+            out.append(key)
+    return out
+
+
+async def run_per_user(
+    adapter: Any,
+    calls: Mapping[str, Callable[[], Awaitable[object]]],
+    *,
+    concurrency: int | None = None,
+) -> BulkErrors:
+    """Run one call per identifier against `adapter`'s host; return the failures."""
+    if not calls:
+        return {}
+    base_url = str(getattr(adapter, "base_url", "") or "")
+    results = await run_bounded({rid: (base_url, factory) for rid, factory in calls.items()}, concurrency=concurrency)
+    return {rid: result for rid, result in results.items() if isinstance(result, BaseException)}
+
+
+async def _native(method: Callable[..., Awaitable[BulkErrors]], ids: list[str], *args: Any) -> BulkErrors:
+    try:
+        return dict(await method(*args) or {})
+    except Exception as exc:
+        return {rid: exc for rid in ids}
+
+
+async def disable_many(adapter: Any, remote_identifiers: Iterable[str], *, concurrency: int | None = None) -> BulkErrors:
+    ids = unique_identifiers(remote_identifiers)
+    if not ids:
+        return {}
+    native = getattr(adapter, "disable_many", None)
+    if native is not None:
+        return await _native(native, ids, ids)
+    return await run_per_user(adapter, {rid: partial(adapter.disable_user, rid) for rid in ids}, concurrency=concurrency)
+
+
+async def delete_many(adapter: Any, remote_identifiers: Iterable[str], *, concurrency: int | None = None) -> BulkErrors:
+    ids = unique_identifiers(remote_identifiers)
+    if not ids:
+        return {}
+    native = getattr(adapter, "delete_many", None)
+    if native is not None:
+        return await _native(native, ids, ids)
+    return await run_per_user(adapter, {rid: partial(adapter.delete_user, rid) for rid in ids}, concurrency=concurrency)
+
+
+async def update_limits_many(
+    adapter: Any,
+    items: Sequence[tuple[str, int, datetime]],
+    *,
+    concurrency: int | None = None,
+) -> BulkErrors:
+    """`items` are (remote_identifier, total_gb, expire_at); the last entry per identifier wins."""
+    limits = {str(rid).strip(): (int(total_gb), expire_at) for rid, total_gb, expire_at in items if str(rid or "").strip()}
+    if not limits:
+        return {}
+    native = getattr(adapter, "update_limits_many", None)
+    if native is not None:
+        return await _native(native, list(limits), [(rid, gb, exp) for rid, (gb, exp) in limits.items()])
+    return await run_per_user(
+        adapter,
+        {rid: partial(adapter.update_user_limits, rid, gb, exp) for rid, (gb, exp) in limits.items()},
+        concurrency=concurrency,
+    )
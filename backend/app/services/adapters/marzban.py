@@ -7,6 +7,7 @@ from urllib.parse import urlencode
 
 import httpx
 
+from app.core.metrics import instrument_upstream_calls
 from app.services.adapters.base import (
     AdapterError,
     ProvisionResult,
@@ -16,8 +17,11 @@ from app.services.adapters.base import (
     RemoteUserSnapshot,
     TestConnectionResult,
 )
+from app.services.http_client import shared_request
+from app.services.panel_tokens import get_panel_token, panel_token_key
 
 
+@instrument_upstream_calls("marzban")
 class MarzbanAdapter:
     def __init__(self, base_url: str, credentials: dict[str, Any], verify_ssl: bool = True, timeout: float = 20.0):
         self.base_url = base_url.rstrip("/")
@@ -26,14 +30,11 @@ class MarzbanAdapter:
 
         self._username = str(credentials.get("username") or "")
         self._password = str(credentials.get("password") or "")
-        self._token = str(credentials.get("token") or "")
-
-    async def _ensure_token(self) -> str:
-        if self._token:
-            return self._token
-        if not (self._username and self._password):
-            raise AdapterError("Marzban credentials must include token OR username/password")
+        self._static_token = str(credentials.get("token") or "")
+        self._token = self._static_token
+        self._token_key = panel_token_key(self.base_url, self._username, self._password)
 
+    async def _login(self) -> str:
         url = f"{self.base_url}/api/admin/token"
         data = {
             "grant_type": "password",
@@ -41,25 +42,43 @@ class MarzbanAdapter:
             "password": self._password,
             "scope": "",
         }
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.post(url, data=data, headers={"Accept": "application/json"})
+        r = await shared_request("POST", url, data=data, headers={"Accept": "application/json"}, verify_ssl=self.verify_ssl, timeout=self.timeout)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} POST /api/admin/token: {r.text[:300]}")
         js = r.json()
         tok = js.get("access_token")
         if not tok:
             raise AdapterError("Marzban token response missing access_token")
-        self._token = str(tok)
+        return str(tok)
+
+    async def _ensure_token(self, stale_token: str | None = None) -> str:
+        if self._static_token:
+            return self._static_token
+        if not (self._username and self._password):
+            raise AdapterError("Marzban credentials must include token OR username/password")
+        self._token = await get_panel_token(self._token_key, self._login, stale_token=stale_token)
         return self._token
 
-    async def _headers(self) -> dict[str, str]:
+    async def _request(self, method: str, path: str, *, headers: dict[str, str] | None = None, **kwargs: Any) -> httpx.Response:
+        url = f"{self.base_url}{path}"
         token = await self._ensure_token()
-        return {"Accept": "application/json", "Authorization": f"Bearer {token}"}
+        for attempt in range(2):
+            r = await shared_request(
+                method,
+                url,
+                headers={"Accept": "application/json", **(headers or {}), "Authorization": f"Bearer {token}"},
+                verify_ssl=self.verify_ssl,
+                timeout=self.timeout,
+                **kwargs,
+            )
+            # A cached login may have been revoked or outlived its exp; log in again once.
+            if r.status_code != 401 or self._static_token or attempt:
+                return r
+            token = await self._ensure_token(stale_token=token)
+        return r
 
     async def _get_json(self, path: str) -> Any:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.get(url, headers=await self._headers())
+        r = await self._request("GET", path)
         if r.status_code == 404:
             raise RemoteUserNotFound(f"HTTP 404 GET {path}: {r.text[:300]}")
         if r.status_code >= 400:
@@ -67,33 +86,19 @@ class MarzbanAdapter:
         return r.json()
 
     async def _post_json(self, path: str, payload: dict[str, Any] | None = None) -> Any:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.post(
-                url,
-                headers={**(await self._headers()), "Content-Type": "application/json"},
-                json=payload or {},
-            )
+        r = await self._request("POST", path, headers={"Content-Type": "application/json"}, json=payload or {})
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} POST {path}: {r.text[:300]}")
         return r.json() if r.text else None
 
     async def _put_json(self, path: str, payload: dict[str, Any]) -> Any:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.put(
-                url,
-                headers={**(await self._headers()), "Content-Type": "application/json"},
-                json=payload,
-            )
+        r = await self._request("PUT", path, headers={"Content-Type": "application/json"}, json=payload)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} PUT {path}: {r.text[:300]}")
         return r.json() if r.text else None
 
     async def _delete(self, path: str) -> None:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.delete(url, headers=await self._headers())
+        r = await self._request("DELETE", path)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} DELETE {path}: {r.text[:300]}")
 
@@ -217,8 +222,9 @@ class MarzbanAdapter:
             raw_items = js.get("users") if isinstance(js.get("users"), list) else []
             total = self._as_int(js.get("total"))
         elif isinstance(js, list):
+            # Legacy bare-array response: the length is this page's, not the total.
             raw_items = js
-            total = len(js)
+            total = None
         else:
             raw_items = []
             total = 0
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
+from functools import partial
 import asyncio
 import math
 from typing import Any
@@ -8,6 +9,7 @@ from urllib.parse import urlencode
 
 import httpx
 
+from app.core.metrics import instrument_upstream_calls
 from app.services.adapters.base import (
     AdapterError,
     ProvisionResult,
@@ -17,9 +19,16 @@ from app.services.adapters.base import (
     RemoteUserSnapshot,
     TestConnectionResult,
 )
+from app.services.adapters.bulk import BulkErrors, run_per_user
+from app.services.http_client import shared_request
+from app.services.panel_tokens import get_panel_token, panel_token_key
 
 
+@instrument_upstream_calls("pasarguard")
 class PasarguardAdapter:
+    # Usernames per /api/users/simple lookup and ids per /api/users/bulk/* request.
+    _BULK_CHUNK = 100
+
     def __init__(self, base_url: str, credentials: dict[str, Any], verify_ssl: bool = True, timeout: float = 20.0):
         self.base_url = base_url.rstrip("/")
         self.verify_ssl = verify_ssl
@@ -27,14 +36,11 @@ class PasarguardAdapter:
 
         self._username = str(credentials.get("username") or "")
         self._password = str(credentials.get("password") or "")
-        self._token = str(credentials.get("token") or "")
-
-    async def _ensure_token(self) -> str:
-        if self._token:
-            return self._token
-        if not (self._username and self._password):
-            raise AdapterError("Pasarguard credentials must include token OR username/password")
+        self._static_token = str(credentials.get("token") or "")
+        self._token = self._static_token
+        self._token_key = panel_token_key(self.base_url, self._username, self._password)
 
+    async def _login(self) -> str:
         url = f"{self.base_url}/api/admin/token"
         data = {
             "grant_type": "password",
@@ -42,25 +48,43 @@ class PasarguardAdapter:
             "password": self._password,
             "scope": "",
         }
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.post(url, data=data, headers={"Accept": "application/json"})
+        r = await shared_request("POST", url, data=data, headers={"Accept": "application/json"}, verify_ssl=self.verify_ssl, timeout=self.timeout)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} POST /api/admin/token: {r.text[:300]}")
         js = r.json()
         tok = js.get("access_token")
         if not tok:
             raise AdapterError("Pasarguard token response missing access_token")
-        self._token = str(tok)
+        return str(tok)
+
+    async def _ensure_token(self, stale_token: str | None = None) -> str:
+        if self._static_token:
+            return self._static_token
+        if not (self._username and self._password):
+            raise AdapterError("Pasarguard credentials must include token OR username/password")
+        self._token = await get_panel_token(self._token_key, self._login, stale_token=stale_token)
         return self._token
 
-    async def _headers(self) -> dict[str, str]:
+    async def _request(self, method: str, path: str, *, headers: dict[str, str] | None = None, **kwargs: Any) -> httpx.Response:
+        url = f"{self.base_url}{path}"
         token = await self._ensure_token()
-        return {"Accept": "application/json", "Authorization": f"Bearer {token}"}
+        for attempt in range(2):
+            r = await shared_request(
+                method,
+                url,
+                headers={"Accept": "application/json", **(headers or {}), "Authorization": f"Bearer {token}"},
+                verify_ssl=self.verify_ssl,
+                timeout=self.timeout,
+                **kwargs,
+            )
+            # A cached login may have been revoked or outlived its exp; log in again once.
+            if r.status_code != 401 or self._static_token or attempt:
+                return r
+            token = await self._ensure_token(stale_token=token)
+        return r
 
     async def _get_json(self, path: str) -> Any:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.get(url, headers=await self._headers())
+        r = await self._request("GET", path)
         if r.status_code == 404:
             raise RemoteUserNotFound(f"HTTP 404 GET {path}: {r.text[:300]}")
         if r.status_code >= 400:
@@ -68,33 +92,19 @@ class PasarguardAdapter:
         return r.json()
 
     async def _post_json(self, path: str, payload: dict[str, Any] | None = None) -> Any:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.post(
-                url,
-                headers={**(await self._headers()), "Content-Type": "application/json"},
-                json=payload or {},
-            )
+        r = await self._request("POST", path, headers={"Content-Type": "application/json"}, json=payload or {})
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} POST {path}: {r.text[:300]}")
         return r.json() if r.text else None
 
     async def _put_json(self, path: str, payload: dict[str, Any]) -> Any:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.put(
-                url,
-                headers={**(await self._headers()), "Content-Type": "application/json"},
-                json=payload,
-            )
+        r = await self._request("PUT", path, headers={"Content-Type": "application/json"}, json=payload)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} PUT {path}: {r.text[:300]}")
         return r.json() if r.text else None
 
     async def _delete(self, path: str) -> None:
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.delete(url, headers=await self._headers())
+        r = await self._request("DELETE", path)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} DELETE {path}: {r.text[:300]}")
 
@@ -269,8 +279,9 @@ class PasarguardAdapter:
             raw_items = js.get("users") if isinstance(js.get("users"), list) else []
             total = self._as_int(js.get("total"))
         elif isinstance(js, list):
+            # Legacy bare-array response: the length is this page's, not the total.
             raw_items = js
-            total = len(js)
+            total = None
         else:
             raw_items = []
             total = 0
@@ -514,6 +525,50 @@ class PasarguardAdapter:
     async def disable_user(self, remote_identifier: str) -> None:
         await self.set_status(remote_identifier, "disabled")
 
+    async def _user_ids_by_username(self, usernames: list[str]) -> dict[str, int]:
+        ids: dict[str, int] = {}
+        for start in range(0, len(usernames), self._BULK_CHUNK):
+            chunk = usernames[start : start + self._BULK_CHUNK]
+            query = urlencode([("usernames", name) for name in chunk] + [("all", "true")])
+            js = await self._get_json(f"/api/users/simple?{query}")
+            rows = js.get("users") if isinstance(js, dict) else js
+            for row in rows if isinstance(rows, list) else []:
+                if isinstance(row, dict) and isinstance(row.get("id"), int) and row.get("username"):
+                    ids[str(row["username"]).lower()] = int(row["id"])
+        return ids
+
+    async def _bulk_action(self, action: str, remote_identifiers: list[str], per_user) -> BulkErrors:
+        """POST /api/users/bulk/{action} by numeric id, in chunks.
+
+        Usernames the panel does not know are reported as RemoteUserNotFound.
+        Panels without the simple/bulk endpoints, or a chunk the panel
+        rejects, fall back to `per_user` for the affected users.
+        """
+        try:
+            user_ids = await self._user_ids_by_username(remote_identifiers)
+        except AdapterError:
+            return await run_per_user(self, {rid: partial(per_user, rid) for rid in remote_identifiers})
+        errors: BulkErrors = {}
+        found: list[str] = []
+        for rid in remote_identifiers:
+            if rid.lower() in user_ids:
+                found.append(rid)
+            else:
+                errors[rid] = RemoteUserNotFound(f"Pasarguard user not found: {rid}")
+        for start in range(0, len(found), self._BULK_CHUNK):
+            chunk = found[start : start + self._BULK_CHUNK]
+            try:
+                await self._post_json(f"/api/users/bulk/{action}", {"ids": [user_ids[rid.lower()] for rid in chunk]})
+            except AdapterError:
+                errors.update(await run_per_user(self, {rid: partial(per_user, rid) for rid in chunk}))
+        return errors
+
+    async def disable_many(self, remote_identifiers: list[str]) -> BulkErrors:
+        return await self._bulk_action("disable", remote_identifiers, self.disable_user)
+
+    async def delete_many(self, remote_identifiers: list[str]) -> BulkErrors:
+        return await self._bulk_action("delete", remote_identifiers, self.delete_user)
+
     async def enable_user(self, remote_identifier: str) -> None:
         await self.set_status(remote_identifier, "active")
 
@@ -3,15 +3,25 @@ from __future__ import annotations
 import re
 import uuid
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import Any
 from urllib.parse import quote, unquote
 
-import httpx
-
+from app.core.metrics import instrument_upstream_calls
 from app.services.adapters.base import AdapterError, ProvisionResult, TestConnectionResult
-
-
+from app.services.adapters.bulk import BulkErrors, run_per_user
+from app.services.http_client import shared_request
+from app.services.wg_peer_index import (
+    PeerIndex,
+    configuration_names,
+    get_peer_index,
+    invalidate_peer_index,
+    peer_index_key,
+)
+
+
+@instrument_upstream_calls("wg_dashboard")
 class WGDashboardAdapter:
     """WGDashboard adapter (v4.3.x).
 
@@ -29,6 +39,8 @@ class WGDashboardAdapter:
     remote_identifier is stored as WG peer id/public_key (base64).
     """
     BYTES_PER_GB = 1024 ** 3
+    # Peers per restrictPeers/deletePeers request in the bulk methods.
+    _BULK_CHUNK = 200
     _TRAFFIC_FIELDS = {"total_receive", "total_sent", "total_data"}
     _EXPIRY_FIELDS = {"date", "datetime", "expire", "expire_at", "expire_date"}
     _PEER_ID_FIELDS = (
@@ -66,9 +78,10 @@ class WGDashboardAdapter:
         self.allowed_ips_validation = self._as_bool(credentials.get("allowed_ips_validation"), True)
         self.remote_endpoint = str(credentials.get("remote_endpoint") or "").strip()
         self.preshared_key = str(credentials.get("preshared_key") or "").strip()
-        self._configuration_names_cache: list[str] | None = None
-        self._peer_index_loaded: bool = False
-        self._peer_index: dict[str, tuple[dict[str, Any], str, bool]] = {}
+        # The peer index is shared by every adapter for this dashboard (see
+        # services.wg_peer_index); _peer_index is this instance's latest view.
+        self._index_key = peer_index_key(self.base_url, self.apikey)
+        self._peer_index: PeerIndex = {}
 
         if not self.apikey:
             raise AdapterError("WGDashboard credentials must include 'apikey'")
@@ -171,9 +184,8 @@ class WGDashboardAdapter:
     def _id_matches(cls, left: Any, right: Any) -> bool:
         return bool(cls._id_candidates(left).intersection(cls._id_candidates(right)))
 
-    def _invalidate_peer_index(self) -> None:
-        self._peer_index_loaded = False
-        self._peer_index = {}
+    def _invalidate_peer_index(self, config_name: str | None = None) -> None:
+        invalidate_peer_index(self._index_key, config_name)
 
     def _extract_data_or_raise(self, payload: Any) -> Any:
         if isinstance(payload, dict) and "status" in payload:
@@ -186,8 +198,7 @@ class WGDashboardAdapter:
 
     async def _get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
         url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.get(url, headers=self._headers(), params=params)
+        r = await shared_request("GET", url, headers=self._headers(), params=params, verify_ssl=self.verify_ssl, timeout=self.timeout)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} GET {path}: {r.text[:300]}")
         payload = r.json() if r.text else None
@@ -195,8 +206,7 @@ class WGDashboardAdapter:
 
     async def _post_json(self, path: str, payload: dict[str, Any]) -> Any:
         url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            r = await client.post(url, headers={**self._headers(), "Content-Type": "application/json"}, json=payload)
+        r = await shared_request("POST", url, headers={**self._headers(), "Content-Type": "application/json"}, json=payload, verify_ssl=self.verify_ssl, timeout=self.timeout)
         if r.status_code >= 400:
             raise AdapterError(f"HTTP {r.status_code} POST {path}: {r.text[:300]}")
         body = r.json() if r.text else None
@@ -209,9 +219,10 @@ class WGDashboardAdapter:
         self.configuration_name = names[0]
         return self.configuration_name
 
-    async def _list_configuration_names(self) -> list[str]:
-        if self._configuration_names_cache is not None:
-            return self._configuration_names_cache
+    async def _list_configuration_names(self, *, refresh: bool = False) -> list[str]:
+        return await configuration_names(self._index_key, self._fetch_configuration_names, refresh=refresh)
+
+    async def _fetch_configuration_names(self) -> list[str]:
         data = await self._get_json("/api/getWireguardConfigurations")
         if not isinstance(data, list) or not data:
             raise AdapterError("WGDashboard has no WireGuard configuration available")
@@ -224,11 +235,10 @@ class WGDashboardAdapter:
                 names.append(name)
         if not names:
             raise AdapterError("WGDashboard configuration discovery failed")
-        self._configuration_names_cache = names
         return names
 
-    async def _ordered_configuration_names(self) -> list[str]:
-        names = await self._list_configuration_names()
+    async def _ordered_configuration_names(self, *, refresh: bool = False) -> list[str]:
+        names = await self._list_configuration_names(refresh=refresh)
         preferred = str(self.configuration_name or "").strip()
         if not preferred:
             return names
@@ -260,29 +270,18 @@ class WGDashboardAdapter:
                     out.append(({"id": peer.strip()}, True))
         return out
 
+    async def _load_configuration_peers(self, config_name: str) -> list[tuple[dict[str, Any], bool]]:
+        return self._iter_info_peers(await self._get_configuration_info(config_name))
+
     async def _ensure_peer_index(self, *, refresh_config_names: bool = False) -> None:
-        if self._peer_index_loaded and not refresh_config_names:
-            return
-        if refresh_config_names:
-            self._configuration_names_cache = None
-        index: dict[str, tuple[dict[str, Any], str, bool]] = {}
-        first_error: Exception | None = None
-        for config_name in await self._ordered_configuration_names():
-            try:
-                info = await self._get_configuration_info(config_name)
-            except Exception as e:
-                if first_error is None:
-                    first_error = e
-                continue
-            for peer, is_restricted in self._iter_info_peers(info):
-                ids = self._peer_identifier_candidates(peer)
-                for pid in ids:
-                    if pid not in index:
-                        index[pid] = (peer, config_name, is_restricted)
-        if not index and first_error is not None:
-            raise first_error
-        self._peer_index = index
-        self._peer_index_loaded = True
+        names = await self._ordered_configuration_names(refresh=refresh_config_names)
+        self._peer_index = await get_peer_index(
+            self._index_key,
+            names,
+            self._load_configuration_peers,
+            self._peer_identifier_candidates,
+            refresh=refresh_config_names,
+        )
 
     async def _get_peer_context(
         self,
@@ -403,6 +402,9 @@ class WGDashboardAdapter:
                 # best-effort cleanup
                 continue
 
+    def _is_peer_limit_job(self, job: dict[str, Any], remote_identifier: str) -> bool:
+        return self._is_volume_job(job, remote_identifier) or self._is_expiry_job(job, remote_identifier)
+
     async def _delete_peer_volume_jobs(self, remote_identifier: str) -> None:
         await self._delete_peer_jobs(remote_identifier, self._is_volume_job)
 
@@ -545,7 +547,7 @@ class WGDashboardAdapter:
         remote_identifier = str(peer.get("id") or "").strip()
         if not remote_identifier:
             raise AdapterError("WGDashboard addPeers did not return peer id")
-        self._invalidate_peer_index()
+        self._invalidate_peer_index(config_name)
 
         # Explicitly allow access (idempotent) and sync schedule limit.
         try:
@@ -564,6 +566,8 @@ class WGDashboardAdapter:
             pass
 
         direct = await self.get_direct_subscription_url(remote_identifier)
+        # The cached peer predates its schedule jobs.
+        self._invalidate_peer_index(config_name)
         return ProvisionResult(
             remote_identifier=remote_identifier,
             direct_sub_url=direct,
@@ -577,12 +581,12 @@ class WGDashboardAdapter:
     async def update_user_limits(self, remote_identifier: str, total_gb: int, expire_at: datetime) -> None:
         # WGDashboard does not have native quota/expiry fields per peer.
         # Mirror Guardino limits using peer schedule jobs.
-        peer, _config_name, _restricted = await self._get_peer_context(remote_identifier)
+        peer, config_name, _restricted = await self._get_peer_context(remote_identifier)
         if not isinstance(peer, dict):
             raise AdapterError(f"WGDashboard peer not found: {remote_identifier}")
         await self._sync_peer_volume_job(remote_identifier, total_gb)
         await self._sync_peer_expiry_job(remote_identifier, expire_at)
-        self._invalidate_peer_index()
+        self._invalidate_peer_index(config_name)
 
     async def delete_user(self, remote_identifier: str) -> None:
         config_name = await self._resolve_peer_configuration_name(remote_identifier)
@@ -596,7 +600,7 @@ class WGDashboardAdapter:
         except Exception:
             pass
         await self._post_json(f"/api/deletePeers/{config_name}", {"peers": [peer_id]})
-        self._invalidate_peer_index()
+        self._invalidate_peer_index(config_name)
 
     async def set_status(self, remote_identifier: str, status: str) -> None:
         config_name = await self._resolve_peer_configuration_name(remote_identifier)
@@ -612,11 +616,83 @@ class WGDashboardAdapter:
                 raise
         else:
             await self._post_json(f"/api/restrictPeers/{config_name}", {"peers": [peer_id]})
-        self._invalidate_peer_index()
+        self._invalidate_peer_index(config_name)
 
     async def disable_user(self, remote_identifier: str) -> None:
         await self.set_status(remote_identifier, "disabled")
 
+    async def _peer_targets_by_config(self, remote_identifiers: list[str]) -> dict[str, dict[str, str]]:
+        """{configuration name: {remote_identifier: peer request id}} from one peer index load.
+
+        Same resolution as the per-peer methods, but unknown peers trigger a
+        single index refresh instead of one per peer.
+        """
+        await self._ensure_peer_index()
+        found: dict[str, tuple[dict[str, Any], str]] = {}
+        missing: list[str] = []
+        for rid in remote_identifiers:
+            peer, config_name, _restricted = await self._get_peer_context(rid, allow_refresh=False)
+            if isinstance(peer, dict) and config_name:
+                found[rid] = (peer, config_name)
+            else:
+                missing.append(rid)
+        if missing:
+            await self._ensure_peer_index(refresh_config_names=True)
+            for rid in missing:
+                peer, config_name, _restricted = await self._get_peer_context(rid, allow_refresh=False)
+                if isinstance(peer, dict) and config_name:
+                    found[rid] = (peer, config_name)
+
+        targets: dict[str, dict[str, str]] = {}
+        default_config = await self._resolve_configuration_name() if len(found) < len(remote_identifiers) else ""
+        for rid in remote_identifiers:
+            if rid in found:
+                peer, config_name = found[rid]
+                peer_id = str(peer.get("id") or "").strip() or next(
+                    (str(peer.get(f) or "").strip() for f in self._PEER_ID_FIELDS if str(peer.get(f) or "").strip()),
+                    "",
+                )
+            else:
+                config_name, peer_id = default_config, ""
+            peer_id = peer_id or unquote(rid.strip()).strip() or rid.strip()
+            targets.setdefault(config_name, {})[rid] = peer_id
+        return targets
+
+    async def _bulk_peer_action(self, path: str, remote_identifiers: list[str], per_peer) -> BulkErrors:
+        """POST `path`/{config} with many peers per request; a rejected chunk falls back to `per_peer`."""
+        errors: BulkErrors = {}
+        try:
+            targets = await self._peer_targets_by_config(remote_identifiers)
+        except Exception as e:
+            return {rid: e for rid in remote_identifiers}
+        for config_name, peers in targets.items():
+            rids = list(peers)
+            for start in range(0, len(rids), self._BULK_CHUNK):
+                chunk = rids[start : start + self._BULK_CHUNK]
+                try:
+                    await self._post_json(f"{path}/{config_name}", {"peers": [peers[rid] for rid in chunk]})
+                except AdapterError:
+                    # status=false fails the whole request, e.g. for one peer already gone.
+                    self._invalidate_peer_index(config_name)
+                    errors.update(await run_per_user(self, {rid: partial(per_peer, rid) for rid in chunk}))
+            self._invalidate_peer_index(config_name)
+        return errors
+
+    async def disable_many(self, remote_identifiers: list[str]) -> BulkErrors:
+        return await self._bulk_peer_action("/api/restrictPeers", remote_identifiers, self.disable_user)
+
+    async def delete_many(self, remote_identifiers: list[str]) -> BulkErrors:
+        # Best-effort schedule job cleanup first, as delete_user does, for the
+        # peers the loaded index shows jobs for.
+        await self._ensure_peer_index()
+        cleanup = {}
+        for rid in remote_identifiers:
+            for n, job in enumerate(await self._list_peer_jobs(rid)):
+                if self._is_peer_limit_job(job, rid):
+                    cleanup[f"{rid}#{n}"] = partial(self._post_json, "/api/deletePeerScheduleJob", {"Job": job})
+        await run_per_user(self, cleanup)
+        return await self._bulk_peer_action("/api/deletePeers", remote_identifiers, self.delete_user)
+
     async def enable_user(self, remote_identifier: str) -> None:
         await self.set_status(remote_identifier, "active")
 
@@ -658,7 +734,7 @@ class WGDashboardAdapter:
             await self._post_json(f"/api/resetPeerData/{config_name}", {"id": peer_id, "type": "cumu"})
         except Exception:
             pass
-        self._invalidate_peer_index()
+        self._invalidate_peer_index(config_name)
 
     @classmethod
     def _extract_peer_used_bytes(cls, peer: dict[str, Any]) -> int | None:
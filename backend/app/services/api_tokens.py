@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import hashlib
 import secrets
 
@@ -11,6 +11,7 @@ from app.core.config import settings
 from app.models.api_token import ApiToken
 from app.models.reseller import Reseller
 from app.schemas.api_tokens import ApiTokenOut
+from app.services.principal_cache import CachedApiToken, record_api_token_use
 
 TOKEN_PREFIX = "ghb_"
 
@@ -66,28 +67,25 @@ async def create_api_token(
     return record, raw_token
 
 
+def api_token_expired(expires_at: datetime | None) -> bool:
+    if expires_at is None:
+        return False
+    now = datetime.now(expires_at.tzinfo) if expires_at.tzinfo else datetime.utcnow()
+    return expires_at < now
+
+
 async def find_active_api_token(db: AsyncSession, raw_token: str) -> ApiToken | None:
     token_hash = hash_api_token(raw_token)
     q = await db.execute(select(ApiToken).where(ApiToken.token_hash == token_hash))
     record = q.scalar_one_or_none()
     if not record or record.revoked_at is not None:
         return None
-    if record.expires_at is not None:
-        expires_at = record.expires_at
-        now = datetime.now(expires_at.tzinfo) if expires_at.tzinfo else datetime.utcnow()
-        if expires_at < now:
-            return None
+    if api_token_expired(record.expires_at):
+        return None
     return record
 
 
-async def touch_api_token(db: AsyncSession, token: ApiToken) -> None:
-    now = datetime.now(timezone.utc)
-    last_used_at = token.last_used_at
-    if last_used_at is not None:
-        if last_used_at.tzinfo is None:
-            last_used_at = last_used_at.replace(tzinfo=timezone.utc)
-        interval = max(60, int(getattr(settings, "API_TOKEN_TOUCH_INTERVAL_SECONDS", 300) or 300))
-        if last_used_at >= now - timedelta(seconds=interval):
-            return
-    token.last_used_at = now
-    await db.commit()
+def touch_api_token(token: CachedApiToken) -> None:
+    """Queue a last_used_at update; the principal cache flushes them in batches."""
+    interval = max(60, int(getattr(settings, "API_TOKEN_TOUCH_INTERVAL_SECONDS", 300) or 300))
+    record_api_token_use(token, datetime.now(timezone.utc), interval)
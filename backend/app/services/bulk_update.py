@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from typing import Any, Sequence
+
+from sqlalchemy import cast, column, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# asyncpg accepts at most 32767 bind parameters per statement.
+_MAX_PARAMS = 30000
+
+
+async def update_rows_by_id(
+    db: AsyncSession,
+    model: Any,
+    rows: Sequence[dict[str, Any]],
+    *,
+    columns: Sequence[str],
+    expect: Sequence[str] = (),
+) -> int:
+    """Write `columns` of many rows as UPDATE ... FROM (VALUES ...) by primary key `id`.
+
+    `rows` are dicts keyed by "id" and the mapped attribute names in
+    `columns`; one statement is issued per chunk that fits the bind parameter
+    limit. Column onupdate defaults (updated_at) apply as for an ORM flush.
+    Each column in `expect` is an optimistic check: a row is only written
+    while that column still holds the row's "expected_<name>" value.
+    Returns the number of rows written. Does not commit and does not touch
+    instances already in the session.
+    """
+    if not rows:
+        return 0
+    mapped = model.__mapper__.columns
+    id_col = mapped["id"]
+    target_cols = [mapped[name] for name in columns]
+    expect_cols = [mapped[name] for name in expect]
+    chunk_size = max(1, _MAX_PARAMS // (len(target_cols) + len(expect_cols) + 1))
+
+    written = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        data = values(
+            column("id", id_col.type),
+            *(column(name, col.type) for name, col in zip(columns, target_cols)),
+            *(column(f"expected_{name}", col.type) for name, col in zip(expect, expect_cols)),
+            name="v",
+        ).data(
+            [
+                (row["id"], *(row[name] for name in columns), *(row[f"expected_{name}"] for name in expect))
+                for row in chunk
+            ]
+        )
+        # Explicit casts: a VALUES column holding only NULLs is typed text.
+        stmt = (
+            update(model.__table__)
+            .where(id_col == data.c.id, *(col == cast(data.c[f"expected_{name}"], col.type) for name, col in zip(expect, expect_cols)))
+            .values({col: cast(data.c[name], col.type) for name, col in zip(columns, target_cols)})
+        )
+        result = await db.execute(stmt)
+        written += int(result.rowcount or 0)
+    return written
+
+
+def id_chunks(ids: Sequence[int], size: int = _MAX_PARAMS) -> list[list[int]]:
+    """Split `ids` so each `Column.in_(chunk)` stays under the bind parameter limit."""
+    ids = list(ids)
+    return [ids[start : start + size] for start in range(0, len(ids), size)]
@@ -73,12 +73,7 @@ def summarize_users(rows: Iterable[Any], now: datetime | None = None) -> dict[st
     return summary
 
 
-async def summarize_users_query(
-    db: AsyncSession,
-    *,
-    reseller_id: int | None = None,
-    now: datetime | None = None,
-) -> dict[str, int]:
+def summarize_users_stmt(reseller_id: int | None = None, now: datetime | None = None) -> Any:
     now = now or _aware_now()
     status_active = GuardinoUser.status == UserStatus.active
     status_disabled = GuardinoUser.status == UserStatus.disabled
@@ -104,7 +99,16 @@ async def summarize_users_query(
     )
     if reseller_id is not None:
         stmt = stmt.where(GuardinoUser.owner_reseller_id == reseller_id)
-    row = (await db.execute(stmt)).one()
+    return stmt
+
+
+async def summarize_users_query(
+    db: AsyncSession,
+    *,
+    reseller_id: int | None = None,
+    now: datetime | None = None,
+) -> dict[str, int]:
+    row = (await db.execute(summarize_users_stmt(reseller_id, now))).one()
     return {
         "total": int(row.total or 0),
         "active": int(row.active or 0),
@@ -0,0 +1,234 @@
+"""Daily per-reseller order/ledger rollups (dashboard_daily_activity).
+
+Rows are maintained incrementally from ORM flushes: every new or changed
+Order/LedgerTransaction adds its delta to the (day, reseller) bucket inside
+the same transaction. Writes that bypass the ORM (raw SQL, bulk Core
+statements) are not seen; `rebuild_daily_activity` (CLI: backfill-rollups)
+recomputes buckets from the source tables.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timezone
+from typing import Any
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.dashboard_metric import DashboardDailyActivity
+from app.models.ledger import LedgerTransaction
+from app.models.order import Order, OrderStatus
+
+_COUNTERS = ("orders_total", "orders_completed", "traffic_gb", "ledger_entries", "ledger_net", "spent")
+
+
+def _utc_day(value: datetime | None) -> date:
+    if value is None:
+        return datetime.now(timezone.utc).date()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _previous(state, key: str) -> Any:
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return state.dict.get(key)
+
+
+def _order_counters(status: Any, purchased_gb: Any) -> dict[str, int]:
+    completed = status == OrderStatus.completed or str(getattr(status, "value", status)) == "completed"
+    return {
+        "orders_total": 1,
+        "orders_completed": 1 if completed else 0,
+        "traffic_gb": max(0, int(purchased_gb or 0)) if completed else 0,
+    }
+
+
+def _ledger_counters(amount: Any) -> dict[str, int]:
+    value = int(amount or 0)
+    return {"ledger_entries": 1, "ledger_net": value, "spent": -value if value < 0 else 0}
+
+
+def _add(deltas: dict[tuple[date, int], dict[str, int]], key: tuple[date, int], values: dict[str, int], sign: int) -> None:
+    bucket = deltas.setdefault(key, dict.fromkeys(_COUNTERS, 0))
+    for name, value in values.items():
+        bucket[name] += sign * value
+
+
+def _order_key(state, reseller_id: Any) -> tuple[date, int] | None:
+    if not reseller_id:
+        return None
+    # created_at is server-generated; when it is not loaded the row was created
+    # in this request, i.e. today.
+    return _utc_day(state.dict.get("created_at")), int(reseller_id)
+
+
+def _collect_deltas(session: Session) -> dict[tuple[date, int], dict[str, int]]:
+    deltas: dict[tuple[date, int], dict[str, int]] = {}
+    for obj in session.new:
+        state = sa_inspect(obj)
+        if isinstance(obj, Order):
+            key = _order_key(state, obj.reseller_id)
+            if key:
+                _add(deltas, key, _order_counters(obj.status, obj.purchased_gb), 1)
+        elif isinstance(obj, LedgerTransaction) and obj.reseller_id:
+            _add(deltas, (_utc_day(obj.occurred_at), int(obj.reseller_id)), _ledger_counters(obj.amount), 1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Order):
+            continue
+        state = sa_inspect(obj)
+        if not any(state.attrs[name].history.has_changes() for name in ("status", "purchased_gb", "reseller_id")):
+            continue
+        old_key = _order_key(state, _previous(state, "reseller_id"))
+        new_key = _order_key(state, obj.reseller_id)
+        if old_key:
+            _add(deltas, old_key, _order_counters(_previous(state, "status"), _previous(state, "purchased_gb")), -1)
+        if new_key:
+            _add(deltas, new_key, _order_counters(obj.status, obj.purchased_gb), 1)
+
+    for obj in session.deleted:
+        state = sa_inspect(obj)
+        if isinstance(obj, Order):
+            key = _order_key(state, _previous(state, "reseller_id"))
+            if key:
+                _add(deltas, key, _order_counters(_previous(state, "status"), _previous(state, "purchased_gb")), -1)
+        elif isinstance(obj, LedgerTransaction):
+            reseller_id = _previous(state, "reseller_id")
+            if reseller_id:
+                key = (_utc_day(_previous(state, "occurred_at")), int(reseller_id))
+                _add(deltas, key, _ledger_counters(_previous(state, "amount")), -1)
+
+    return {key: values for key, values in deltas.items() if any(values.values())}
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_activity_deltas(session: Session, flush_context) -> None:
+    deltas = _collect_deltas(session)
+    if not deltas:
+        return
+    table = DashboardDailyActivity.__table__
+    connection = session.connection()
+    # Sorted keys keep concurrent writers from deadlocking on bucket rows.
+    for (day, reseller_id), values in sorted(deltas.items()):
+        stmt = pg_insert(table).values(day=day, reseller_id=reseller_id, **values)
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["day", "reseller_id"],
+                set_={
+                    **{name: table.c[name] + stmt.excluded[name] for name in _COUNTERS},
+                    "updated_at": func.now(),
+                },
+            )
+        )
+
+
+_REBUILD_SOURCE = """
+SELECT day, reseller_id,
+       SUM(orders_total)::integer, SUM(orders_completed)::integer, SUM(traffic_gb)::bigint,
+       SUM(ledger_entries)::integer, SUM(ledger_net)::bigint, SUM(spent)::bigint,
+       NOW(), NOW()
+FROM (
+  SELECT (created_at AT TIME ZONE 'UTC')::date AS day,
+         reseller_id,
+         COUNT(*) AS orders_total,
+         COUNT(*) FILTER (WHERE status = 'completed') AS orders_completed,
+         COALESCE(SUM(GREATEST(purchased_gb, 0)) FILTER (WHERE status = 'completed'), 0) AS traffic_gb,
+         0 AS ledger_entries,
+         0 AS ledger_net,
+         0 AS spent
+  FROM orders
+  {order_filter}
+  GROUP BY 1, 2
+  UNION ALL
+  SELECT (occurred_at AT TIME ZONE 'UTC')::date AS day,
+         reseller_id,
+         0, 0, 0,
+         COUNT(*),
+         COALESCE(SUM(amount), 0),
+         COALESCE(SUM(-amount) FILTER (WHERE amount < 0), 0)
+  FROM ledger_transactions
+  {ledger_filter}
+  GROUP BY 1, 2
+) AS src
+GROUP BY day, reseller_id
+"""
+
+
+async def rebuild_daily_activity(db: AsyncSession, since: date | None = None) -> int:
+    """Recompute rollup buckets from orders/ledger_transactions (all days, or from `since`).
+
+    The table is locked for the duration so incremental writers wait instead
+    of applying deltas to rows that are being replaced. Does not commit.
+    """
+    params: dict[str, Any] = {}
+    order_filter = ledger_filter = delete_filter = ""
+    if since is not None:
+        params["since"] = since
+        order_filter = "WHERE (created_at AT TIME ZONE 'UTC')::date >= :since"
+        ledger_filter = "WHERE (occurred_at AT TIME ZONE 'UTC')::date >= :since"
+        delete_filter = "WHERE day >= :since"
+
+    await db.execute(text("LOCK TABLE dashboard_daily_activity IN EXCLUSIVE MODE"))
+    await db.execute(text(f"DELETE FROM dashboard_daily_activity {delete_filter}"), params)
+    result = await db.execute(
+        text(
+            "INSERT INTO dashboard_daily_activity ("
+            "day, reseller_id, orders_total, orders_completed, traffic_gb, "
+            "ledger_entries, ledger_net, spent, created_at, updated_at)"
+            + _REBUILD_SOURCE.format(order_filter=order_filter, ledger_filter=ledger_filter)
+        ),
+        params,
+    )
+    return int(result.rowcount or 0)
+
+
+async def activity_totals(
+    db: AsyncSession,
+    *,
+    reseller_id: int | None = None,
+    since_day: date,
+) -> dict[str, int]:
+    """All-time order/ledger counts plus windowed sums from `since_day`."""
+    t = DashboardDailyActivity
+    recent = t.day >= since_day
+    stmt = select(
+        func.coalesce(func.sum(t.orders_total), 0).label("orders_total"),
+        func.coalesce(func.sum(t.ledger_entries), 0).label("ledger_entries_total"),
+        func.coalesce(func.sum(t.orders_total).filter(recent), 0).label("orders_recent"),
+        func.coalesce(func.sum(t.ledger_net).filter(recent), 0).label("ledger_net_recent"),
+        func.coalesce(func.sum(t.spent).filter(recent), 0).label("spent_recent"),
+    )
+    if reseller_id is not None:
+        stmt = stmt.where(t.reseller_id == reseller_id)
+    row = (await db.execute(stmt)).one()
+    return {key: int(value or 0) for key, value in row._mapping.items()}
+
+
+async def activity_series(
+    db: AsyncSession,
+    *,
+    reseller_id: int | None = None,
+    since_day: date,
+) -> list[Any]:
+    """Rows of (day, spent, traffic_gb) from `since_day`, one per day."""
+    t = DashboardDailyActivity
+    stmt = (
+        select(
+            t.day,
+            func.coalesce(func.sum(t.spent), 0).label("spent"),
+            func.coalesce(func.sum(t.traffic_gb), 0).label("traffic_gb"),
+        )
+        .where(t.day >= since_day)
+        .group_by(t.day)
+        .order_by(t.day)
+    )
+    if reseller_id is not None:
+        stmt = stmt.where(t.reseller_id == reseller_id)
+    return list((await db.execute(stmt)).all())
+
@@ -0,0 +1,117 @@
+"""Expiry timeline: a Redis sorted set of active users scored by expire_at.
+
+Write paths that change a user's expire_at or status call schedule_expiry
+after committing; the expire_scheduled_users task claims only the members
+that are due, so expiry is enforced within seconds without scanning the users
+table. A claim moves the members to the end of a lease instead of removing
+them, and they are acknowledged (removed) once their expiry has committed: if
+the worker dies in between, they come due again when the lease ends.
+
+The ZSET is a hint, not the source of truth: every claimed user is re-checked
+in the database, failed Redis writes are only logged, and the periodic
+expire_due_users scan both expires anything missed and re-seeds the users
+expiring soon.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Iterable
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.models.user import GuardinoUser, UserStatus
+
+logger = logging.getLogger(__name__)
+
+_KEY = "guardino:expiry:timeline"
+
+# Re-score up to ARGV[2] members scored <= ARGV[1] to the lease end ARGV[3],
+# in one atomic step, and return them.
+_CLAIM_DUE_SCRIPT = """
+local ids = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+  redis.call('zadd', KEYS[1], ARGV[3], id)
+end
+return ids
+"""
+
+# Remove the members ARGV[2..] still scored at the lease end ARGV[1]; a member
+# rescheduled since its claim keeps its new score.
+_ACK_DUE_SCRIPT = """
+local lease = tonumber(ARGV[1])
+local removed = 0
+for i = 2, #ARGV do
+  local score = redis.call('zscore', KEYS[1], ARGV[i])
+  if score and tonumber(score) == lease then
+    removed = removed + redis.call('zrem', KEYS[1], ARGV[i])
+  end
+end
+return removed
+"""
+
+
+async def schedule_expiry(entries: Iterable[tuple[int, datetime, UserStatus | str]]) -> None:
+    """Add active users at their expire_at and drop every other status, best effort.
+
+    `entries` are (user_id, expire_at, status) taken before the session is
+    touched again, since callers run this after commit.
+    """
+    add: dict[str, float] = {}
+    remove: list[str] = []
+    for user_id, expire_at, status in entries:
+        if UserStatus(status) == UserStatus.active and expire_at is not None:
+            add[str(int(user_id))] = expire_at.timestamp()
+        else:
+            remove.append(str(int(user_id)))
+    if not add and not remove:
+        return
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            if add:
+                pipe.zadd(_KEY, add)
+            if remove:
+                pipe.zrem(_KEY, *remove)
+            await pipe.execute()
+    except Exception as exc:
+        logger.warning("expiry schedule update failed users=%s err=%s", len(add) + len(remove), str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+async def claim_due(now: datetime, limit: int, lease_until: datetime) -> list[int]:
+    """Return up to `limit` user ids whose scheduled expiry is <= now, leased until `lease_until`.
+
+    Claimed members stay in the set; call ack_due with the same `lease_until`
+    once they have been handled.
+    """
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        ids = await client.eval(_CLAIM_DUE_SCRIPT, 1, _KEY, now.timestamp(), int(limit), lease_until.timestamp())
+        return [int(x) for x in ids or []]
+    except Exception as exc:
+        logger.warning("expiry schedule claim failed err=%s", str(exc)[:160])
+        return []
+    finally:
+        await client.aclose()
+
+
+async def ack_due(user_ids: Iterable[int], lease_until: datetime) -> None:
+    """Drop handled claims, best effort; an unacknowledged claim is retried after its lease."""
+    members = [str(int(user_id)) for user_id in user_ids]
+    if not members:
+        return
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        await client.eval(_ACK_DUE_SCRIPT, 1, _KEY, lease_until.timestamp(), *members)
+    except Exception as exc:
+        logger.warning("expiry schedule ack failed users=%s err=%s", len(members), str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+async def schedule_user_expiry(*users: GuardinoUser) -> None:
+    await schedule_expiry((u.id, u.expire_at, u.status) for u in users)
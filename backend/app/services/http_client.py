@@ -1,10 +1,130 @@
 from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
 import httpx
 from app.core.config import settings
+from app.core.metrics import observe_upstream
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional `h2` package (installed via httpx[http2]). Without
+# it we silently stay on HTTP/1.1 keep-alive.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Process-wide pooled clients keyed by (origin, verify_ssl). An httpx client is
+# bound to the event loop it first ran on, so every entry remembers its loop;
+# a different loop (each Celery task runs its own asyncio.run) gets a fresh one.
+_clients: dict[tuple[str, bool], tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+
+def _pool_limits() -> httpx.Limits:
+    max_connections = max(1, min(1000, int(getattr(settings, "PANEL_HTTP_MAX_CONNECTIONS", 100) or 100)))
+    max_keepalive = max(0, min(max_connections, int(getattr(settings, "PANEL_HTTP_MAX_KEEPALIVE", 20) or 0)))
+    keepalive_expiry = max(1.0, float(getattr(settings, "PANEL_HTTP_KEEPALIVE_EXPIRY_SECONDS", 30) or 30))
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+def _http2_enabled() -> bool:
+    return HTTP2_AVAILABLE and bool(getattr(settings, "PANEL_HTTP2", True))
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(str(url or "").strip())
+    return f"{(parts.scheme or 'http').lower()}://{parts.netloc.lower()}"
+
 
-def build_async_client() -> httpx.AsyncClient:
+def build_async_client(*, verify: bool | None = None, http2: bool | None = None) -> httpx.AsyncClient:
     return httpx.AsyncClient(
         timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS),
-        verify=settings.PANEL_TLS_VERIFY,
+        verify=settings.PANEL_TLS_VERIFY if verify is None else verify,
         headers={"User-Agent": f"{settings.APP_NAME}/1.0"},
+        limits=_pool_limits(),
+        http2=_http2_enabled() if http2 is None else (http2 and HTTP2_AVAILABLE),
     )
+
+
+def get_shared_client(base_url: str, verify_ssl: bool | None = None) -> httpx.AsyncClient:
+    """Return the pooled keep-alive client for the origin of `base_url`.
+
+    Must be called from inside a running event loop.
+    """
+    verify = settings.PANEL_TLS_VERIFY if verify_ssl is None else bool(verify_ssl)
+    origin = _origin(base_url)
+    key = (origin, verify)
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(key)
+    if entry is not None:
+        owner_loop, client = entry
+        if owner_loop is loop and not client.is_closed:
+            return client
+        # Leftover from a finished loop; its sockets died with that loop.
+        _clients.pop(key, None)
+    client = build_async_client(verify=verify, http2=_http2_enabled() and origin.startswith("https://"))
+    _clients[key] = (loop, client)
+    return client
+
+
+async def shared_request(
+    method: str,
+    url: str,
+    *,
+    verify_ssl: bool | None = None,
+    timeout: float | None = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    client = get_shared_client(url, verify_ssl)
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except Exception as exc:
+        observe_upstream(url, time.perf_counter() - started, type(exc).__name__)
+        raise
+    observe_upstream(url, time.perf_counter() - started, str(response.status_code))
+    return response
+
+
+async def aclose_shared_clients() -> None:
+    """Close every pooled client owned by the current event loop.
+
+    Clients that belong to another (already finished) loop are only dropped.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    for key, (owner_loop, client) in list(_clients.items()):
+        _clients.pop(key, None)
+        if owner_loop is not loop or owner_loop.is_closed():
+            continue
+        try:
+            await client.aclose()
+        except Exception as exc:
+            logger.warning("http client close failed origin=%s err=%s", key[0], str(exc)[:160])
+
+
+def drop_shared_clients() -> None:
+    _clients.clear()
+
+
+async def closing_shared_clients(coro: Any) -> Any:
+    """Await `coro`, then close the pooled clients of this loop.
+
+    Used around `asyncio.run(...)` in Celery tasks and CLI commands, where
+    the loop (and every connection bound to it) ends with the call.
+    """
+    try:
+        return await coro
+    finally:
+        await aclose_shared_clients()
@@ -10,7 +10,7 @@ from app.models.reseller import Reseller
 from app.models.subaccount import SubAccount
 from app.models.user import GuardinoUser
 from app.schemas.ops import OpResult
-from app.schemas.reseller_user_ops import CreateUserResponse
+from app.schemas.reseller_user_ops import CreateUserResponse, NodeProvisionResult
 from app.services.idempotency import find_order_by_request_id, request_id_from
 
 
@@ -51,6 +51,8 @@ def _ensure_completed_order(
 ) -> None:
     if _coerce_order_type(order) not in expected_types:
         raise HTTPException(status_code=409, detail="request_id was already used for another operation.")
+    if _coerce_order_status(order) == OrderStatus.failed:
+        raise HTTPException(status_code=409, detail="request_id belongs to an operation that did not complete; use a new request_id.")
     if _coerce_order_status(order) != OrderStatus.completed or not order.user_id:
         raise HTTPException(status_code=409, detail="request_id is already in progress; retry shortly.")
 
@@ -138,6 +140,7 @@ async def create_user_response_for_order(
         charged_amount=charged_amount,
         balance_after=balance_after,
         nodes_provisioned=nodes_provisioned,
+        node_results=[NodeProvisionResult(node_id=node_id, ok=True) for node_id in nodes_provisioned],
     )
 
 
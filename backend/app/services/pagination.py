@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Literal
+
+from fastapi import HTTPException, status
+from redis.asyncio import Redis
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# exact: count(*) per request; cached: count(*) shared for PAGE_COUNT_CACHE_SECONDS;
+# none: skip counting (total is null). Listings with a summary return the cached
+# one in both cached and none modes (see cached_summary).
+CountMode = Literal["exact", "cached", "none"]
+COUNT_MODE_PATTERN = "^(exact|cached|none)$"
+
+
+def encode_cursor(last_id: int) -> str:
+    raw = json.dumps({"id": int(last_id)}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        last_id = int(data["id"])
+    except (ValueError, KeyError, TypeError, binascii.Error, UnicodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if last_id < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return last_id
+
+
+async def fetch_page(
+    db: AsyncSession,
+    stmt,
+    *,
+    id_column,
+    limit: int,
+    offset: int = 0,
+    cursor: str | None = None,
+    keyset: bool = True,
+) -> tuple[list[Any], str | None]:
+    """Run `stmt` (already ordered by `id_column` descending) for one page.
+
+    With a cursor the page starts after the cursor's id (keyset, constant cost
+    per page) and `offset` is ignored. Either way one extra row is read to
+    tell whether a `next_cursor` exists. Pass `keyset=False` for statements
+    ordered by something else; they page by offset only.
+    """
+    if not keyset:
+        rows = list((await db.execute(stmt.offset(offset).limit(limit))).scalars().all())
+        return rows, None
+    if cursor:
+        stmt = stmt.where(id_column < decode_cursor(cursor))
+    elif offset:
+        stmt = stmt.offset(offset)
+    rows = list((await db.execute(stmt.limit(limit + 1))).scalars().all())
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].id)
+
+
+def default_count_mode(count: str | None, cursor: str | None) -> CountMode:
+    if count:
+        return count  # type: ignore[return-value]
+    return "none" if cursor else "exact"
+
+
+def _count_ttl() -> int:
+    return max(1, min(3600, int(getattr(settings, "PAGE_COUNT_CACHE_SECONDS", 30) or 30)))
+
+
+async def count_rows(db: AsyncSession, stmt, *, mode: CountMode, scope: str) -> int | None:
+    """Total rows matched by `stmt`; `scope` names the listing and its filters for the cache."""
+    if mode == "none":
+        return None
+    count_stmt = select(func.count()).select_from(stmt.order_by(None).subquery())
+    if mode == "exact":
+        return int((await db.execute(count_stmt)).scalar_one())
+
+    key = "guardino:page-count:" + hashlib.sha256(scope.encode("utf-8")).hexdigest()[:40]
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        try:
+            cached = await client.get(key)
+            if cached is not None:
+                return int(cached)
+        except Exception as exc:
+            logger.warning("page count cache read failed err=%s", str(exc)[:160])
+        total = int((await db.execute(count_stmt)).scalar_one())
+        try:
+            await client.set(key, total, ex=_count_ttl())
+        except Exception as exc:
+            logger.warning("page count cache write failed err=%s", str(exc)[:160])
+        return total
+    finally:
+        await client.aclose()
+
+
+async def cached_summary(
+    mode: CountMode,
+    *,
+    scope: str,
+    compute: Callable[[], Awaitable[dict[str, int]]],
+) -> dict[str, int]:
+    """Aggregate summary of a listing, cached like `count_rows` under `scope`.
+
+    `exact` recomputes it on every request; `cached` and `none` share one
+    result for PAGE_COUNT_CACHE_SECONDS, so cursor pages (count=none by
+    default) keep their summary without re-aggregating the table.
+    """
+    if mode == "exact":
+        return await compute()
+
+    key = "guardino:page-summary:" + hashlib.sha256(scope.encode("utf-8")).hexdigest()[:40]
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        try:
+            cached = await client.get(key)
+            if cached is not None:
+                return {name: int(value) for name, value in json.loads(cached).items()}
+        except Exception as exc:
+            logger.warning("page summary cache read failed err=%s", str(exc)[:160])
+        summary = await compute()
+        try:
+            await client.set(key, json.dumps(summary, separators=(",", ":")), ex=_count_ttl())
+        except Exception as exc:
+            logger.warning("page summary cache write failed err=%s", str(exc)[:160])
+        return summary
+    finally:
+        await client.aclose()
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import hashlib
+import json
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -40,6 +43,24 @@ def effective_credentials(node: Node, allocation: NodeAllocation | None = None)
     return inherited
 
 
+def credential_fingerprint(node: Node, allocation: NodeAllocation | None = None) -> str:
+    """Identifies the panel login an adapter for (node, allocation) would use.
+
+    Equal fingerprints mean the same base URL and effective credentials, so
+    they see the same remote users.
+    """
+    payload = json.dumps(
+        {
+            "panel_type": getattr(node.panel_type, "value", node.panel_type),
+            "base_url": str(node.base_url or "").strip().rstrip("/").lower(),
+            "credentials": effective_credentials(node, allocation),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def get_adapter_for_allocation(node: Node, allocation: NodeAllocation | None = None):
     return get_adapter(node, credentials=effective_credentials(node, allocation))
 
@@ -107,3 +128,86 @@ async def get_adapter_for_subaccount(
                 enabled_only=False,
             )
     return get_adapter_for_allocation(node, allocation)
+
+
+class AdapterResolver:
+    """Adapters for many subaccounts from nodes and allocations loaded up front.
+
+    Allocation rules are those of get_adapter_for_subaccount. Adapters are
+    memoized by credential_fingerprint, so subaccounts behind the same panel
+    login share one instance. Build with load_adapter_resolver.
+    """
+
+    def __init__(self, nodes: dict[int, Node], allocations: dict[int, NodeAllocation]):
+        self.nodes = nodes
+        self.allocations = allocations
+        self._adapters: dict[str, object] = {}
+
+    def allocation_for(self, subaccount: SubAccount) -> NodeAllocation | None:
+        return self.allocations.get(subaccount.id)
+
+    def adapter_for(self, subaccount: SubAccount, node: Node | None = None):
+        node = node or self.nodes[subaccount.node_id]
+        allocation = self.allocations.get(subaccount.id)
+        key = credential_fingerprint(node, allocation)
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            adapter = get_adapter_for_allocation(node, allocation)
+            self._adapters[key] = adapter
+        return adapter
+
+
+async def load_adapter_resolver(
+    db: AsyncSession,
+    subaccounts: list[SubAccount],
+    *,
+    users: list[GuardinoUser] | None = None,
+    node_map: dict[int, Node] | None = None,
+) -> AdapterResolver:
+    """Preload what adapter_for needs for `subaccounts` in at most four queries.
+
+    Pass the owning `users` and/or `node_map` when already loaded to skip
+    those lookups.
+    """
+    nodes = dict(node_map or {})
+    missing_node_ids = {int(sa.node_id) for sa in subaccounts} - nodes.keys()
+    if missing_node_ids:
+        q = await db.execute(select(Node).where(Node.id.in_(missing_node_ids)))
+        nodes.update({n.id: n for n in q.scalars().all()})
+
+    allocation_ids = {int(sa.allocation_id) for sa in subaccounts if sa.allocation_id}
+    by_id: dict[int, NodeAllocation] = {}
+    if allocation_ids:
+        q = await db.execute(select(NodeAllocation).where(NodeAllocation.id.in_(allocation_ids)))
+        by_id = {a.id: a for a in q.scalars().all()}
+
+    # Subaccounts without allocation_id use their owner's allocation on the node.
+    unlinked = [sa for sa in subaccounts if not sa.allocation_id]
+    owner_by_user: dict[int, int] = {int(u.id): int(u.owner_reseller_id) for u in users or []}
+    missing_user_ids = {int(sa.user_id) for sa in unlinked} - owner_by_user.keys()
+    if missing_user_ids:
+        q = await db.execute(
+            select(GuardinoUser.id, GuardinoUser.owner_reseller_id).where(GuardinoUser.id.in_(missing_user_ids))
+        )
+        owner_by_user.update({int(row.id): int(row.owner_reseller_id) for row in q.all()})
+    by_owner_node: dict[tuple[int, int], NodeAllocation] = {}
+    reseller_ids = {owner_by_user[int(sa.user_id)] for sa in unlinked if int(sa.user_id) in owner_by_user}
+    if reseller_ids:
+        q = await db.execute(
+            select(NodeAllocation).where(
+                NodeAllocation.reseller_id.in_(reseller_ids),
+                NodeAllocation.node_id.in_({int(sa.node_id) for sa in unlinked}),
+            )
+        )
+        by_owner_node = {(int(a.reseller_id), int(a.node_id)): a for a in q.scalars().all()}
+
+    allocations: dict[int, NodeAllocation] = {}
+    for sa in subaccounts:
+        if sa.allocation_id:
+            allocation = by_id.get(int(sa.allocation_id))
+        else:
+            owner = owner_by_user.get(int(sa.user_id))
+            allocation = by_owner_node.get((owner, int(sa.node_id))) if owner is not None else None
+        if allocation is not None:
+            allocations[sa.id] = allocation
+    return AdapterResolver(nodes, allocations)
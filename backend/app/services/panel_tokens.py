@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+from jose import jwt
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.core.metrics import record_cache, record_token_refresh
+
+logger = logging.getLogger(__name__)
+
+# In-process tier: cache key -> (token, expires_at epoch seconds).
+_tokens: dict[str, tuple[str, float]] = {}
+# Cache key -> (loop, lock) serialising logins for that key within a process.
+_login_locks: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Lock]] = {}
+
+
+def _refresh_margin() -> int:
+    return max(0, min(3600, int(getattr(settings, "PANEL_TOKEN_REFRESH_MARGIN_SECONDS", 120) or 0)))
+
+
+def _default_ttl() -> int:
+    return max(60, int(getattr(settings, "PANEL_TOKEN_DEFAULT_TTL_SECONDS", 1800) or 1800))
+
+
+def panel_token_key(base_url: str, username: str, password: str) -> str:
+    """Cache key for an admin login; the password only contributes a hash."""
+    password_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    raw = f"{base_url.rstrip('/').lower()}|{username}|{password_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _redis_key(key: str) -> str:
+    return f"guardino:panel-token:{key}"
+
+
+def token_expires_at(token: str, now: float | None = None) -> float:
+    """Expiry from the JWT `exp` claim, or a default lifetime for opaque tokens."""
+    now = time.time() if now is None else now
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+        if exp is not None:
+            return float(exp)
+    except Exception:
+        pass
+    return now + _default_ttl()
+
+
+def _is_fresh(expires_at: float, now: float) -> bool:
+    return expires_at - _refresh_margin() > now
+
+
+def _login_lock(key: str) -> asyncio.Lock:
+    # asyncio locks are bound to the loop they first wait on; each Celery task
+    # runs its own loop.
+    loop = asyncio.get_running_loop()
+    entry = _login_locks.get(key)
+    if entry is None or entry[0] is not loop:
+        entry = (loop, asyncio.Lock())
+        _login_locks[key] = entry
+    return entry[1]
+
+
+def _local_token(key: str, stale_token: str | None, now: float) -> str | None:
+    local = _tokens.get(key)
+    if local and local[0] != stale_token and _is_fresh(local[1], now):
+        return local[0]
+    return None
+
+
+async def _redis_get(key: str) -> tuple[str, float] | None:
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        raw = await client.get(_redis_key(key))
+        if not raw:
+            return None
+        data = json.loads(raw)
+        return str(data["token"]), float(data["exp"])
+    except Exception as exc:
+        logger.warning("panel token cache read failed err=%s", str(exc)[:160])
+        return None
+    finally:
+        await client.aclose()
+
+
+async def _redis_set(key: str, token: str, expires_at: float, now: float) -> None:
+    ttl = int(expires_at - _refresh_margin() - now)
+    if ttl <= 0:
+        return
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        await client.set(_redis_key(key), json.dumps({"token": token, "exp": expires_at}), ex=ttl)
+    except Exception as exc:
+        logger.warning("panel token cache write failed err=%s", str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+async def _redis_delete_if(key: str, token: str) -> None:
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        raw = await client.get(_redis_key(key))
+        if raw and str(json.loads(raw).get("token") or "") == token:
+            await client.delete(_redis_key(key))
+    except Exception as exc:
+        logger.warning("panel token cache delete failed err=%s", str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+async def get_panel_token(
+    key: str,
+    fetch: Callable[[], Awaitable[str]],
+    *,
+    stale_token: str | None = None,
+) -> str:
+    """Return a cached admin token for `key`, logging in via `fetch` when needed.
+
+    Tokens are reused across adapter instances (in-process) and across API and
+    Celery processes (Redis), and are renewed shortly before their JWT `exp`.
+    Pass the token a panel just rejected as `stale_token` to force a new login
+    unless another caller has already replaced it. Concurrent misses for one
+    key in a process wait for a single login instead of each logging in.
+    """
+    token = _local_token(key, stale_token, time.time())
+    if token:
+        record_cache("panel_token", True)
+        return token
+
+    async with _login_lock(key):
+        # Another caller may have logged in while this one waited.
+        now = time.time()
+        token = _local_token(key, stale_token, now)
+        if token:
+            record_cache("panel_token", True)
+            return token
+
+        shared = await _redis_get(key)
+        if shared and shared[0] != stale_token and _is_fresh(shared[1], now):
+            record_cache("panel_token", True)
+            _tokens[key] = shared
+            return shared[0]
+
+        record_cache("panel_token", False)
+        if stale_token:
+            _tokens.pop(key, None)
+            await _redis_delete_if(key, stale_token)
+
+        record_token_refresh(rejected=bool(stale_token))
+        token = await fetch()
+        expires_at = token_expires_at(token, now)
+        _tokens[key] = (token, expires_at)
+        await _redis_set(key, token, expires_at, now)
+        return token
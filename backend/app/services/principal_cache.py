@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from redis.asyncio import Redis
+from sqlalchemy import event, inspect as sa_inspect, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.core.metrics import record_cache
+from app.models.api_token import ApiToken
+from app.models.reseller import Reseller
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "guardino:principal-cache:invalidate"
+
+
+@dataclass(frozen=True)
+class CachedApiToken:
+    token_id: int
+    reseller_id: int
+    expires_at: datetime | None
+    last_used_at: datetime | None
+
+
+class _TTLCache:
+    """Small LRU with a per-entry TTL; only touched from the event loop thread."""
+
+    def __init__(self) -> None:
+        self._data: OrderedDict[object, tuple[float, object]] = OrderedDict()
+
+    def get(self, key: object) -> object | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: object, value: object) -> None:
+        ttl = _ttl_seconds()
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > _max_entries():
+            self._data.popitem(last=False)
+
+    def pop(self, key: object) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+def _ttl_seconds() -> int:
+    return max(0, min(600, int(getattr(settings, "PRINCIPAL_CACHE_TTL_SECONDS", 30) or 0)))
+
+
+def _max_entries() -> int:
+    return max(64, int(getattr(settings, "PRINCIPAL_CACHE_MAX_ENTRIES", 4096) or 4096))
+
+
+_resellers = _TTLCache()  # reseller id -> column snapshot
+_usernames = _TTLCache()  # username -> reseller id
+_api_tokens = _TTLCache()  # token hash -> CachedApiToken
+
+# Pending api_tokens.last_used_at updates (token id -> timestamp), flushed in
+# the background so authenticated requests never commit just to touch a token.
+_pending_touches: dict[int, datetime] = {}
+_last_touches: dict[int, datetime] = {}
+_background_tasks: set[asyncio.Task] = set()
+_lifecycle_tasks: list[asyncio.Task] = []
+
+
+# --- lookups -----------------------------------------------------------------
+
+
+def _snapshot(reseller: Reseller) -> dict | None:
+    loaded = sa_inspect(reseller).dict
+    keys = [attr.key for attr in sa_inspect(Reseller).column_attrs]
+    if any(key not in loaded for key in keys):
+        return None
+    return {key: copy.deepcopy(loaded[key]) for key in keys}
+
+
+def remember_reseller(reseller: Reseller) -> None:
+    snapshot = _snapshot(reseller)
+    if snapshot is None:
+        return
+    _resellers.set(int(reseller.id), snapshot)
+    _usernames.set(str(reseller.username), int(reseller.id))
+
+
+async def cached_reseller(
+    db: AsyncSession,
+    *,
+    reseller_id: int | None = None,
+    username: str | None = None,
+) -> Reseller | None:
+    """Attach a cached reseller row to `db` without querying it.
+
+    The instance behaves like a freshly loaded row: changes made by the
+    request are flushed normally, and billing code still re-reads the row
+    under FOR UPDATE before touching the balance.
+    """
+    if reseller_id is None and username is not None:
+        reseller_id = _usernames.get(username)  # type: ignore[assignment]
+    snapshot = _resellers.get(int(reseller_id)) if reseller_id is not None else None
+    if not isinstance(snapshot, dict) or (username is not None and snapshot.get("username") != username):
+        record_cache("principal_reseller", False)
+        return None
+    record_cache("principal_reseller", True)
+    instance = Reseller(**copy.deepcopy(snapshot))
+    make_transient_to_detached(instance)
+    return await db.merge(instance, load=False)
+
+
+def remember_api_token(token_hash: str, record: ApiToken) -> CachedApiToken:
+    cached = CachedApiToken(
+        token_id=int(record.id),
+        reseller_id=int(record.reseller_id),
+        expires_at=record.expires_at,
+        last_used_at=record.last_used_at,
+    )
+    _api_tokens.set(token_hash, cached)
+    return cached
+
+
+def cached_api_token(token_hash: str) -> CachedApiToken | None:
+    value = _api_tokens.get(token_hash)
+    hit = isinstance(value, CachedApiToken)
+    record_cache("principal_api_token", hit)
+    return value if hit else None
+
+
+def record_api_token_use(token: CachedApiToken, now: datetime, interval_seconds: int) -> None:
+    last = _last_touches.get(token.token_id) or token.last_used_at
+    if last is not None and last.tzinfo is None:
+        last = last.replace(tzinfo=now.tzinfo)
+    if last is not None and (now - last).total_seconds() < interval_seconds:
+        return
+    _last_touches[token.token_id] = now
+    _pending_touches[token.token_id] = now
+
+
+async def flush_api_token_touches() -> int:
+    if not _pending_touches:
+        return 0
+    pending = dict(_pending_touches)
+    _pending_touches.clear()
+    by_time: dict[datetime, list[int]] = {}
+    for token_id, used_at in pending.items():
+        by_time.setdefault(used_at, []).append(token_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            for used_at, token_ids in by_time.items():
+                await db.execute(update(ApiToken).where(ApiToken.id.in_(token_ids)).values(last_used_at=used_at))
+            await db.commit()
+    except Exception as exc:
+        for token_id, used_at in pending.items():
+            _pending_touches.setdefault(token_id, used_at)
+        logger.warning("api token touch flush failed tokens=%s err=%s", len(pending), str(exc)[:160])
+        return 0
+    return len(pending)
+
+
+# --- invalidation ------------------------------------------------------------
+
+
+def _apply_invalidation(key: str) -> None:
+    kind, _, value = key.partition(":")
+    if kind == "r" and value.isdigit():
+        snapshot = _resellers.get(int(value))
+        _resellers.pop(int(value))
+        if isinstance(snapshot, dict):
+            _usernames.pop(str(snapshot.get("username") or ""))
+    elif kind == "t" and value:
+        _api_tokens.pop(value)
+    elif kind == "all":
+        _resellers.clear()
+        _usernames.clear()
+        _api_tokens.clear()
+
+
+async def publish_invalidations(keys: list[str]) -> None:
+    for key in keys:
+        _apply_invalidation(key)
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        for key in keys:
+            await client.publish(INVALIDATION_CHANNEL, key)
+    except Exception as exc:
+        logger.warning("principal cache invalidation publish failed keys=%s err=%s", len(keys), str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+def _spawn(coro) -> None:
+    try:
+        task = asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:
+        coro.close()
+        return
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session: Session, flush_context) -> None:
+    keys: set[str] = session.info.setdefault("principal_invalidations", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Reseller) and obj.id is not None:
+            keys.add(f"r:{obj.id}")
+        elif isinstance(obj, ApiToken) and obj.token_hash:
+            keys.add(f"t:{obj.token_hash}")
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_principal_changes(session: Session) -> None:
+    keys = session.info.pop("principal_invalidations", None)
+    if keys:
+        for key in keys:
+            _apply_invalidation(key)
+        _spawn(publish_invalidations(sorted(keys)))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_principal_changes(session: Session) -> None:
+    session.info.pop("principal_invalidations", None)
+
+
+async def _listen_for_invalidations() -> None:
+    while True:
+        client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything cached while we were disconnected may be stale.
+            _apply_invalidation("all:")
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _apply_invalidation(str(message.get("data") or ""))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("principal cache listener error err=%s", str(exc)[:160])
+            _apply_invalidation("all:")
+            await asyncio.sleep(5)
+        finally:
+            try:
+                await pubsub.aclose()
+                await client.aclose()
+            except Exception:
+                pass
+
+
+async def _flush_touches_forever() -> None:
+    interval = max(1, int(getattr(settings, "API_TOKEN_TOUCH_FLUSH_SECONDS", 15) or 15))
+    while True:
+        await asyncio.sleep(interval)
+        await flush_api_token_touches()
+
+
+def start_principal_cache() -> None:
+    loop = asyncio.get_running_loop()
+    _lifecycle_tasks.append(loop.create_task(_listen_for_invalidations()))
+    _lifecycle_tasks.append(loop.create_task(_flush_touches_forever()))
+
+
+async def stop_principal_cache() -> None:
+    tasks = list(_lifecycle_tasks)
+    _lifecycle_tasks.clear()
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await flush_api_token_touches()
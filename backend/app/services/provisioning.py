@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable
+
+from app.models.node import Node
+from app.models.node_allocation import NodeAllocation
+from app.services.adapters.base import ProvisionResult
+from app.services.panel_access import get_adapter_for_allocation
+from app.services.remote_fanout import RemoteJob, error_text, run_bounded
+
+AdapterFactory = Callable[[Node, NodeAllocation | None], Any]
+
+
+@dataclass
+class NodeProvisionOutcome:
+    node: Node
+    allocation: NodeAllocation | None
+    adapter: Any
+    result: ProvisionResult | None = None
+    error: str | None = None
+    cleanup_error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.result is not None
+
+
+async def provision_on_nodes(
+    nodes: list[Node],
+    allocation_map: dict[int, NodeAllocation],
+    *,
+    label: str,
+    total_gb: int,
+    expire_at: datetime,
+    status: str | None = None,
+    adapter_for: AdapterFactory = get_adapter_for_allocation,
+    concurrency: int | None = None,
+) -> list[NodeProvisionOutcome]:
+    """Create the remote user on every node concurrently (REMOTE_FANOUT_* bounds).
+
+    Never raises for a node failure; each outcome carries its result or
+    error, in the order of `nodes`.
+    """
+    outcomes: list[NodeProvisionOutcome] = []
+    jobs: dict[int, RemoteJob] = {}
+    kwargs: dict[str, Any] = {"label": label, "total_gb": int(total_gb), "expire_at": expire_at}
+    if status is not None:
+        kwargs["status"] = status
+    for index, node in enumerate(nodes):
+        allocation = allocation_map.get(node.id)
+        outcome = NodeProvisionOutcome(node=node, allocation=allocation, adapter=None)
+        outcomes.append(outcome)
+        try:
+            outcome.adapter = adapter_for(node, allocation)
+        except Exception as exc:
+            outcome.error = error_text(exc, 160)
+            continue
+        jobs[index] = (node.base_url, partial(outcome.adapter.provision_user, **kwargs))
+
+    # No per-job timeout: a create cancelled after the panel applied it would
+    # have no result, and undo_provisioning would leave that user behind. The
+    # adapter calls carry their own timeouts.
+    results = await run_bounded(jobs, concurrency=concurrency, timeout=0) if jobs else {}
+    for index, result in results.items():
+        if isinstance(result, BaseException):
+            outcomes[index].error = error_text(result, 160)
+        else:
+            outcomes[index].result = result
+    return outcomes
+
+
+async def undo_provisioning(
+    outcomes: list[NodeProvisionOutcome],
+    *,
+    concurrency: int | None = None,
+) -> list[str]:
+    """Delete every successfully provisioned remote user concurrently (compensation).
+
+    Returns one "node#ID: error" entry per node whose cleanup failed.
+    """
+    jobs: dict[int, RemoteJob] = {
+        index: (o.node.base_url, partial(o.adapter.delete_user, o.result.remote_identifier))
+        for index, o in enumerate(outcomes)
+        if o.result is not None
+    }
+    results = await run_bounded(jobs, concurrency=concurrency) if jobs else {}
+    errors: list[str] = []
+    for index, result in results.items():
+        if isinstance(result, BaseException):
+            outcomes[index].cleanup_error = error_text(result, 160)
+            errors.append(f"node#{outcomes[index].node.id}: {outcomes[index].cleanup_error}")
+    return errors
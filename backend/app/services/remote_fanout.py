@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, Mapping, TypeVar
+from urllib.parse import urlsplit
+
+from app.core.config import settings
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+RemoteJob = tuple[str, Callable[[], Awaitable[T]]]
+
+
+def host_of(base_url: str) -> str:
+    value = str(base_url or "").strip()
+    return urlsplit(value).netloc.lower() or value.lower()
+
+
+def fanout_limits() -> tuple[int, int, float]:
+    """(global concurrency, per-host concurrency, per-call timeout seconds)."""
+    concurrency = max(1, min(256, int(getattr(settings, "REMOTE_FANOUT_CONCURRENCY", 16) or 16)))
+    per_host = max(1, min(concurrency, int(getattr(settings, "REMOTE_FANOUT_PER_HOST", 4) or 4)))
+    timeout = max(5.0, float(getattr(settings, "REMOTE_FANOUT_TIMEOUT_SECONDS", 120) or 120))
+    return concurrency, per_host, timeout
+
+
+async def run_bounded(
+    jobs: Mapping[K, RemoteJob],
+    *,
+    concurrency: int | None = None,
+    per_host: int | None = None,
+    timeout: float | None = None,
+) -> dict[K, object]:
+    """Run `jobs` ({key: (base_url, factory)}) concurrently.
+
+    At most `concurrency` calls are in flight overall and `per_host` against
+    any single panel host; each call gets `timeout` seconds once it starts.
+    The result maps every key to its return value or the raised exception
+    (asyncio.TimeoutError on timeout), in the order of `jobs`.
+    """
+    default_concurrency, default_per_host, default_timeout = fanout_limits()
+    global_sem = asyncio.Semaphore(max(1, concurrency or default_concurrency))
+    host_limit = max(1, per_host or default_per_host)
+    call_timeout = default_timeout if timeout is None else timeout
+    host_sems: dict[str, asyncio.Semaphore] = {}
+
+    async def run(base_url: str, factory: Callable[[], Awaitable[T]]) -> T:
+        host_sem = host_sems.setdefault(host_of(base_url), asyncio.Semaphore(host_limit))
+        # Wait for the host slot first so a busy panel does not hold global slots.
+        async with host_sem:
+            async with global_sem:
+                if call_timeout and call_timeout > 0:
+                    return await asyncio.wait_for(factory(), call_timeout)
+                return await factory()
+
+    keys = list(jobs.keys())
+    results = await asyncio.gather(*(run(*jobs[key]) for key in keys), return_exceptions=True)
+    return dict(zip(keys, results))
+
+
+def error_text(exc: BaseException, limit: int = 220) -> str:
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    return (str(exc) or type(exc).__name__)[:limit]
@@ -1,20 +1,76 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime
+from functools import partial
+from typing import Any, Awaitable, Callable
 
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.node import Node
 from app.models.subaccount import SubAccount
+from app.models.user import GuardinoUser
 from app.services.adapters.factory import get_adapter
-from app.services.panel_access import get_adapter_for_subaccount
+from app.services.panel_access import load_adapter_resolver
+from app.services.remote_fanout import run_bounded
 
+# (subaccount, node, adapter) ready for a remote call.
+RemoteTarget = tuple[SubAccount, Node, Any]
 
-def short_error(error: Exception, size: int = 140) -> str:
+
+def short_error(error: BaseException, size: int = 140) -> str:
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
     return str(error).strip().replace("\n", " ")[:size]
 
 
+async def resolve_remote_targets(
+    db: AsyncSession | None,
+    subs: list[SubAccount],
+    node_map: dict[int, Node],
+    user: GuardinoUser | None = None,
+) -> tuple[list[RemoteTarget], list[str]]:
+    """Pick the adapter for every subaccount (allocations preloaded in one pass).
+
+    Subaccounts whose node is gone are reported as errors.
+    """
+    errors = [f"node#{sa.node_id}: node not found" for sa in subs if sa.node_id not in node_map]
+    present = [sa for sa in subs if sa.node_id in node_map]
+    if db is None:
+        return [(sa, node_map[sa.node_id], get_adapter(node_map[sa.node_id])) for sa in present], errors
+    resolver = await load_adapter_resolver(db, present, users=[user] if user else None, node_map=node_map)
+    return [(sa, node_map[sa.node_id], resolver.adapter_for(sa)) for sa in present], errors
+
+
+async def run_remote_calls(
+    targets: list[RemoteTarget],
+    call: Callable[[SubAccount, Node, Any], Awaitable[object]],
+) -> tuple[list[tuple[SubAccount, Node]], list[str]]:
+    """Run `call(subaccount, node, adapter)` for all targets concurrently.
+
+    Bounded by the REMOTE_FANOUT_* concurrency limits (overall and per panel
+    host). Returns the targets that succeeded and one error per failure, both
+    in target order.
+    """
+    if not targets:
+        return [], []
+    jobs = {index: (node.base_url, partial(call, sa, node, adapter)) for index, (sa, node, adapter) in enumerate(targets)}
+    # No per-job timeout: cancelling a call the panel already applied would
+    # leave it out of the rollback set. The adapter calls carry their own
+    # timeouts, so every failure reported here really failed.
+    results = await run_bounded(jobs, timeout=0)
+    succeeded: list[tuple[SubAccount, Node]] = []
+    errors: list[str] = []
+    for index, (subaccount, node, _adapter) in enumerate(targets):
+        result = results[index]
+        if isinstance(result, BaseException):
+            errors.append(f"node#{subaccount.node_id}: {short_error(result)}")
+        else:
+            succeeded.append((subaccount, node))
+    return succeeded, errors
+
+
 def raise_remote_sync_failed(action: str, errors: list[str]) -> None:
     if not errors:
         return
@@ -32,17 +88,17 @@ async def rollback_limit_changes(
     expire_at: datetime,
     db: AsyncSession | None = None,
 ) -> list[str]:
-    rollback_errors: list[str] = []
-    for subaccount, node in successful_sync:
-        try:
-            adapter = await get_adapter_for_subaccount(db, subaccount, node) if db else get_adapter(node)
-            await adapter.update_user_limits(
-                subaccount.remote_identifier,
-                total_gb=int(total_gb),
-                expire_at=expire_at,
-            )
-        except Exception as exc:
-            rollback_errors.append(f"node#{subaccount.node_id}: {short_error(exc)}")
+    node_map = {node.id: node for _subaccount, node in successful_sync}
+    targets, _missing = await resolve_remote_targets(db, [sa for sa, _node in successful_sync], node_map)
+
+    async def restore(subaccount: SubAccount, _node: Node, adapter) -> None:
+        await adapter.update_user_limits(
+            subaccount.remote_identifier,
+            total_gb=int(total_gb),
+            expire_at=expire_at,
+        )
+
+    _restored, rollback_errors = await run_remote_calls(targets, restore)
     return rollback_errors
 
 
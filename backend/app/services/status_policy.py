@@ -1,8 +1,9 @@
 from __future__ import annotations
 from enum import Enum
-from typing import Optional
+from typing import Iterable, Optional
 from app.models.node import PanelType
 from app.services.adapters.base import PanelAdapter
+from app.services.adapters.bulk import BulkErrors, delete_many, disable_many
 
 class InternalStatus(str, Enum):
     active = "active"
@@ -43,6 +44,20 @@ async def enforce_volume_exhausted(panel: PanelType, adapter: PanelAdapter, remo
         return
     await adapter.disable_user(remote_identifier)
 
+async def enforce_time_expiry_many(panel: PanelType, adapter: PanelAdapter, remote_identifiers: Iterable[str]) -> BulkErrors:
+    """enforce_time_expiry for many users behind one adapter; returns the per-identifier errors."""
+    if panel == PanelType.wg_dashboard:
+        return await delete_many(adapter, remote_identifiers)
+    return await disable_many(adapter, remote_identifiers)
+
+async def enforce_volume_exhausted_many(panel: PanelType, adapter: PanelAdapter, remote_identifiers: Iterable[str]) -> BulkErrors:
+    """enforce_volume_exhausted for many users behind one adapter; returns the per-identifier errors.
+
+    WGDashboard restricts peers for "limited" exactly as for disable, so
+    disable_many covers every panel.
+    """
+    return await disable_many(adapter, remote_identifiers)
+
 async def enable_if_needed(panel: PanelType, adapter: PanelAdapter, remote_identifier: str):
     """Enable user on remote panel after extension/traffic increase."""
     if panel == PanelType.wg_dashboard:
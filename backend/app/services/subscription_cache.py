@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "guardino:sub-cache"
+# Bumped by node/allocation changes that can affect any number of users.
+_GENERATION_KEY = f"{_PREFIX}:generation"
+
+
+@dataclass
+class CachedSubscription:
+    payload: str
+    node_links: list[dict[str, str]] = field(default_factory=list)
+    generation: str = "0"
+
+
+def _fresh_ttl() -> int:
+    return max(0, min(3600, int(getattr(settings, "SUB_CACHE_TTL_SECONDS", 60) or 0)))
+
+
+def _stale_ttl() -> int:
+    return max(60, int(getattr(settings, "SUB_CACHE_STALE_SECONDS", 86400) or 86400))
+
+
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(str(token or "").encode("utf-8")).hexdigest()[:40]
+
+
+def _merged_key(token: str) -> str:
+    return f"{_PREFIX}:merged:{_token_digest(token)}"
+
+
+def _bodies_key(token: str) -> str:
+    return f"{_PREFIX}:bodies:{_token_digest(token)}"
+
+
+async def get_cached_subscription(token: str) -> tuple[CachedSubscription | None, str]:
+    """Return (fresh cached entry or None, current cache generation)."""
+    if _fresh_ttl() <= 0:
+        return None, "0"
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        generation, raw = await client.mget(_GENERATION_KEY, _merged_key(token))
+        generation = str(generation or "0")
+        data = json.loads(raw) if raw else None
+        if data is None or str(data.get("generation") or "0") != generation:
+            record_cache("subscription", False)
+            return None, generation
+        record_cache("subscription", True)
+        return (
+            CachedSubscription(
+                payload=str(data.get("payload") or ""),
+                node_links=list(data.get("node_links") or []),
+                generation=generation,
+            ),
+            generation,
+        )
+    except Exception as exc:
+        logger.warning("subscription cache read failed err=%s", str(exc)[:160])
+        return None, "0"
+    finally:
+        await client.aclose()
+
+
+async def get_stale_bodies(token: str, node_ids: Iterable[int]) -> dict[int, str]:
+    """Last good upstream body per node, used when a node fetch fails."""
+    ids = [int(x) for x in node_ids]
+    if not ids:
+        return {}
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        values = await client.hmget(_bodies_key(token), [str(x) for x in ids])
+        return {node_id: body for node_id, body in zip(ids, values) if body}
+    except Exception as exc:
+        logger.warning("subscription stale cache read failed err=%s", str(exc)[:160])
+        return {}
+    finally:
+        await client.aclose()
+
+
+async def store_subscription(
+    token: str,
+    entry: CachedSubscription,
+    fresh_bodies: dict[int, str],
+    *,
+    cache_merged: bool = True,
+) -> None:
+    """Cache the merged payload (unless `cache_merged` is false) and the fresh per-node bodies."""
+    fresh_ttl = _fresh_ttl()
+    if fresh_ttl <= 0 or (not cache_merged and not fresh_bodies):
+        return
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        pipe = client.pipeline(transaction=False)
+        if cache_merged:
+            pipe.set(
+                _merged_key(token),
+                json.dumps(
+                    {
+                        "payload": entry.payload,
+                        "node_links": entry.node_links,
+                        "generation": entry.generation,
+                        "at": int(time.time()),
+                    }
+                ),
+                ex=fresh_ttl,
+            )
+        if fresh_bodies:
+            pipe.hset(_bodies_key(token), mapping={str(k): v for k, v in fresh_bodies.items()})
+            pipe.expire(_bodies_key(token), _stale_ttl())
+        await pipe.execute()
+    except Exception as exc:
+        logger.warning("subscription cache write failed err=%s", str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+async def invalidate_subscription_cache(*tokens: str | None, drop_stale: bool = False) -> None:
+    """Forget the merged payload of the given master tokens.
+
+    Last good node bodies are kept for stale fallback unless `drop_stale`
+    (e.g. when a token is revoked).
+    """
+    keys: list[str] = []
+    for token in tokens:
+        if not token:
+            continue
+        keys.append(_merged_key(token))
+        if drop_stale:
+            keys.append(_bodies_key(token))
+    if not keys:
+        return
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        await client.delete(*keys)
+    except Exception as exc:
+        logger.warning("subscription cache invalidate failed keys=%s err=%s", len(keys), str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+async def invalidate_all_subscription_caches() -> None:
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        await client.incr(_GENERATION_KEY)
+    except Exception as exc:
+        logger.warning("subscription cache generation bump failed err=%s", str(exc)[:160])
+    finally:
+        await client.aclose()
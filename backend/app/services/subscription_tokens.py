@@ -1,52 +1,222 @@
 from __future__ import annotations
 
-from sqlalchemy import select
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+from redis.asyncio import Redis
+from sqlalchemy import event, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.revoked_sub_token import RevokedSubToken
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = "guardino:revoked-sub-tokens"
+
+# Ids come from a sequence at insert time, not at commit, so a row can become
+# visible after rows with higher ids were loaded. Each top-up re-reads this
+# many ids below the highest one seen.
+_ID_LOOKBACK = 1000
+
+
+class _BloomFilter:
+    """Fixed-size Bloom filter: `in` is False only for tokens never added."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1024, int(capacity))
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
 
-from app.models.app_setting import AppSetting
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
 
-REVOKED_MASTER_SUB_TOKENS_KEY = "revoked_master_sub_tokens"
-MAX_REVOKED_MASTER_SUB_TOKENS = 5000
 
+class _RevokedTokenFront:
+    def __init__(self, capacity: int):
+        self.filter = _BloomFilter(capacity)
+        self.count = 0
+        self.last_id = 0
+        # Ids already added from the lookback window, so re-reads are not counted twice.
+        self.recent_ids: set[int] = set()
+        self.loaded_at = 0.0
+        self.built_at = time.monotonic()
 
-def _parse_tokens(value: dict | None) -> list[str]:
-    if not isinstance(value, dict):
-        return []
-    raw = value.get("tokens")
-    if not isinstance(raw, list):
-        return []
-    out: list[str] = []
-    seen: set[str] = set()
-    for token in raw:
-        s = str(token or "").strip()
-        if not s or s in seen:
+
+# Per-process negative-lookup front for the revoked token table. It is topped
+# up every refresh interval (rows above last_id minus a lookback window),
+# rebuilt from the whole table every rebuild interval or with twice the
+# capacity when it fills up, and fed revocations from other processes over
+# Redis pub/sub as they commit.
+_front: _RevokedTokenFront | None = None
+_lifecycle_tasks: list[asyncio.Task] = []
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _refresh_seconds() -> int:
+    return max(1, min(3600, int(getattr(settings, "REVOKED_SUB_TOKEN_REFRESH_SECONDS", 30) or 30)))
+
+
+def _rebuild_seconds() -> int:
+    return max(60, int(getattr(settings, "REVOKED_SUB_TOKEN_REBUILD_SECONDS", 3600) or 3600))
+
+
+def _add_rows(front: _RevokedTokenFront, rows) -> None:
+    for row_id, token in rows:
+        row_id = int(row_id)
+        if row_id in front.recent_ids:
             continue
-        out.append(s)
-        seen.add(s)
-    return out
+        front.filter.add(str(token))
+        front.count += 1
+        front.recent_ids.add(row_id)
+        front.last_id = max(front.last_id, row_id)
+    floor = front.last_id - _ID_LOOKBACK
+    front.recent_ids = {row_id for row_id in front.recent_ids if row_id > floor}
+
+
+async def _load_front(db: AsyncSession) -> _RevokedTokenFront:
+    global _front
+    now = time.monotonic()
+    front = _front
+    if front is not None and now - front.loaded_at < _refresh_seconds():
+        return front
+    if front is None or now - front.built_at >= _rebuild_seconds():
+        front = _RevokedTokenFront(capacity=max(65536, front.count * 2) if front is not None else 65536)
+    q = await db.execute(
+        select(RevokedSubToken.id, RevokedSubToken.token)
+        .where(RevokedSubToken.id > front.last_id - _ID_LOOKBACK)
+        .order_by(RevokedSubToken.id.asc())
+    )
+    rows = q.all()
+    if front.count + len(rows) > front.filter.capacity:
+        # Rebuild from the whole table with headroom to keep false positives rare.
+        front = _RevokedTokenFront(capacity=(front.count + len(rows)) * 2)
+        q = await db.execute(select(RevokedSubToken.id, RevokedSubToken.token).order_by(RevokedSubToken.id.asc()))
+        rows = q.all()
+    _add_rows(front, rows)
+    front.loaded_at = now
+    _front = front
+    return front
 
 
 async def is_master_sub_token_revoked(db: AsyncSession, token: str) -> bool:
     t = str(token or "").strip()
     if not t:
         return True
-    q = await db.execute(select(AppSetting).where(AppSetting.key == REVOKED_MASTER_SUB_TOKENS_KEY))
-    row = q.scalar_one_or_none()
-    return t in set(_parse_tokens(row.value if row else None))
+    front = await _load_front(db)
+    if t not in front.filter:
+        return False
+    q = await db.execute(select(RevokedSubToken.id).where(RevokedSubToken.token == t).limit(1))
+    return q.scalar_one_or_none() is not None
 
 
-async def remember_revoked_master_sub_token(db: AsyncSession, token: str) -> None:
+async def remember_revoked_master_sub_token(db: AsyncSession, token: str, user_id: int | None = None) -> None:
     t = str(token or "").strip()
     if not t:
         return
-    q = await db.execute(select(AppSetting).where(AppSetting.key == REVOKED_MASTER_SUB_TOKENS_KEY))
-    row = q.scalar_one_or_none()
-    tokens = _parse_tokens(row.value if row else None)
-    if t in tokens:
+    await db.execute(
+        pg_insert(RevokedSubToken)
+        .values(token=t, user_id=user_id)
+        .on_conflict_do_nothing(index_elements=[RevokedSubToken.token])
+    )
+    if _front is not None:
+        _front.filter.add(t)
+    # Other processes learn about it once the transaction commits.
+    db.sync_session.info.setdefault("revoked_sub_tokens", set()).add(t)
+
+
+# --- cross-process propagation -------------------------------------------------
+
+
+async def publish_revocations(tokens: list[str]) -> None:
+    client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    try:
+        for token in tokens:
+            await client.publish(REVOCATION_CHANNEL, token)
+    except Exception as exc:
+        logger.warning("revoked sub token publish failed tokens=%s err=%s", len(tokens), str(exc)[:160])
+    finally:
+        await client.aclose()
+
+
+def _spawn(coro) -> None:
+    try:
+        task = asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:
+        coro.close()
         return
-    tokens.append(t)
-    tokens = tokens[-MAX_REVOKED_MASTER_SUB_TOKENS:]
-    if row:
-        row.value = {"tokens": tokens}
-    else:
-        db.add(AppSetting(key=REVOKED_MASTER_SUB_TOKENS_KEY, value={"tokens": tokens}))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_revoked_tokens(session: Session) -> None:
+    tokens = session.info.pop("revoked_sub_tokens", None)
+    if tokens:
+        _spawn(publish_revocations(sorted(tokens)))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_revoked_tokens(session: Session) -> None:
+    session.info.pop("revoked_sub_tokens", None)
+
+
+def _apply_revocation(token: str) -> None:
+    if _front is not None and token:
+        _front.filter.add(token)
+
+
+async def _listen_for_revocations() -> None:
+    while True:
+        client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(REVOCATION_CHANNEL)
+            # Revocations published while we were disconnected were missed;
+            # top up from the table on the next lookup.
+            if _front is not None:
+                _front.loaded_at = 0.0
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _apply_revocation(str(message.get("data") or ""))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("revoked sub token listener error err=%s", str(exc)[:160])
+            await asyncio.sleep(5)
+        finally:
+            try:
+                await pubsub.aclose()
+                await client.aclose()
+            except Exception:
+                pass
+
+
+def start_revocation_listener() -> None:
+    _lifecycle_tasks.append(asyncio.get_running_loop().create_task(_listen_for_revocations()))
+
+
+async def stop_revocation_listener() -> None:
+    tasks = list(_lifecycle_tasks)
+    _lifecycle_tasks.clear()
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,202 @@
+"""Run history of the periodic sync tasks (the sync_runs table).
+
+`observed_run(..., keep_history=True)` stores one row per sync_usage /
+expire_due_users run; rows older than SYNC_RUN_HISTORY_DAYS are pruned in the
+same transaction. `summarize_runs` turns a window of rows into the trend
+lines and slowest node/access group rankings served to admins, and compares
+run durations with the task's beat interval and lock TTL.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import delete
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models.sync_run import SyncRun
+
+logger = logging.getLogger(__name__)
+
+# Recorded task -> setting holding its beat interval.
+RECORDED_TASKS = {
+    "sync_usage": "USAGE_SYNC_SECONDS",
+    "expire_due_users": "EXPIRY_SYNC_SECONDS",
+}
+
+# Every locked task -> setting holding its beat interval.
+TASK_INTERVALS = {
+    **RECORDED_TASKS,
+    "expire_scheduled_users": "EXPIRY_SCHEDULER_SECONDS",
+}
+
+# A run longer than this share of the lock TTL is reported as at risk.
+LOCK_TTL_WARNING_RATIO = 0.8
+
+
+def _interval_setting(task: str) -> int:
+    return int(getattr(settings, TASK_INTERVALS[task], 60) or 60)
+
+
+def task_interval(task: str) -> int:
+    """Beat interval in seconds, clamped like the Celery schedule."""
+    return max(30, min(3600, _interval_setting(task)))
+
+
+def task_lock_ttl(task: str) -> int:
+    """TTL of the Redis lock a run holds; a longer run lets the next one start."""
+    return max(90, _interval_setting(task) * 2)
+
+
+def _history_days() -> int:
+    return max(1, min(90, int(getattr(settings, "SYNC_RUN_HISTORY_DAYS", 14) or 14)))
+
+
+async def save_run(
+    task: str,
+    *,
+    started_at: datetime,
+    duration_ms: int,
+    counters: dict[str, int],
+    phases: dict[str, float],
+    group_fetches: dict[str, float],
+    node_calls: dict[str, dict[str, Any]],
+    error: BaseException | None = None,
+) -> None:
+    """Insert one run and prune old ones; failures are logged, never raised."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=_history_days())
+    try:
+        async with AsyncSessionLocal() as db:
+            db.add(
+                SyncRun(
+                    task=task,
+                    status="failed" if error is not None else "ok",
+                    started_at=started_at,
+                    duration_ms=int(duration_ms),
+                    scanned_users=int(counters.get("scanned_users", 0)),
+                    counters=counters,
+                    phases=phases,
+                    group_fetches=group_fetches,
+                    node_calls=node_calls,
+                    error=(str(error) or type(error).__name__)[:500] if error is not None else None,
+                )
+            )
+            await db.execute(delete(SyncRun).where(SyncRun.task == task, SyncRun.started_at < cutoff))
+            await db.commit()
+    except Exception as exc:
+        logger.warning("sync run history write failed task=%s err=%s", task, str(exc)[:220])
+
+
+def _percentile(values: list[int], pct: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _mean(values: list[float]) -> float:
+    return round(sum(values) / len(values), 3) if values else 0.0
+
+
+def _phase_means(rows: list[SyncRun]) -> dict[str, float]:
+    per_phase: dict[str, list[float]] = {}
+    for row in rows:
+        for phase, seconds in (row.phases or {}).items():
+            per_phase.setdefault(phase, []).append(float(seconds))
+    return {phase: _mean(values) for phase, values in per_phase.items()}
+
+
+def summarize_runs(
+    task: str,
+    rows: list[SyncRun],
+    *,
+    since: datetime,
+    bucket_minutes: int,
+    top: int,
+    nodes_by_host: dict[str, tuple[int, str]],
+) -> dict[str, Any]:
+    """Summary of `rows` (one task, oldest first) for the admin endpoint."""
+    interval = task_interval(task)
+    lock_ttl = task_lock_ttl(task)
+    durations = [int(row.duration_ms) for row in rows]
+    max_ms = max(durations, default=0)
+    p95_ms = _percentile(durations, 95)
+
+    bucket = timedelta(minutes=bucket_minutes)
+    buckets: dict[datetime, list[SyncRun]] = {}
+    for row in rows:
+        started = row.started_at if row.started_at.tzinfo else row.started_at.replace(tzinfo=timezone.utc)
+        index = int((started - since) / bucket)
+        buckets.setdefault(since + index * bucket, []).append(row)
+    trend = [
+        {
+            "bucket_start": start,
+            "runs": len(bucket_rows),
+            "failed_runs": sum(1 for row in bucket_rows if row.status != "ok"),
+            "avg_duration_ms": int(_mean([row.duration_ms for row in bucket_rows]) + 0.5),
+            "max_duration_ms": max(row.duration_ms for row in bucket_rows),
+            "avg_scanned_users": int(_mean([row.scanned_users for row in bucket_rows]) + 0.5),
+            "phases_avg_seconds": _phase_means(bucket_rows),
+        }
+        for start, bucket_rows in sorted(buckets.items())
+    ]
+
+    hosts: dict[str, dict[str, Any]] = {}
+    for row in rows:
+        for host, call in (row.node_calls or {}).items():
+            entry = hosts.setdefault(host, {"calls": 0, "failures": 0, "total_ms": 0, "max_ms": 0, "slowest_operation": ""})
+            entry["calls"] += int(call.get("calls", 0))
+            entry["failures"] += int(call.get("failures", 0))
+            entry["total_ms"] += int(call.get("total_ms", 0))
+            if int(call.get("max_ms", 0)) >= entry["max_ms"]:
+                entry["max_ms"] = int(call.get("max_ms", 0))
+                entry["slowest_operation"] = str(call.get("slowest_operation") or "")
+    slowest_nodes = []
+    for host, entry in sorted(hosts.items(), key=lambda item: item[1]["max_ms"], reverse=True)[:top]:
+        node_id, node_name = nodes_by_host.get(host, (None, None))
+        slowest_nodes.append(
+            {
+                "host": host,
+                "node_id": node_id,
+                "node_name": node_name,
+                "calls": entry["calls"],
+                "failures": entry["failures"],
+                "avg_ms": entry["total_ms"] // entry["calls"] if entry["calls"] else 0,
+                "max_ms": entry["max_ms"],
+                "slowest_operation": entry["slowest_operation"],
+            }
+        )
+
+    groups: dict[str, list[float]] = {}
+    for row in rows:
+        for group, seconds in (row.group_fetches or {}).items():
+            groups.setdefault(group, []).append(float(seconds))
+    slowest_groups = [
+        {"group": group, "runs": len(values), "avg_seconds": _mean(values), "max_seconds": round(max(values), 3)}
+        for group, values in sorted(groups.items(), key=lambda item: max(item[1]), reverse=True)[:top]
+    ]
+
+    last = rows[-1] if rows else None
+    return {
+        "task": task,
+        "interval_seconds": interval,
+        "lock_ttl_seconds": lock_ttl,
+        "runs": len(rows),
+        "failed_runs": sum(1 for row in rows if row.status != "ok"),
+        "last_started_at": last.started_at if last else None,
+        "last_duration_ms": last.duration_ms if last else 0,
+        "avg_duration_ms": int(_mean(durations) + 0.5),
+        "p95_duration_ms": p95_ms,
+        "max_duration_ms": max_ms,
+        "lock_ttl_usage": round(max_ms / (lock_ttl * 1000), 3),
+        "interval_usage": round(p95_ms / (interval * 1000), 3),
+        "overrun_risk": max_ms >= lock_ttl * 1000 * LOCK_TTL_WARNING_RATIO or p95_ms >= interval * 1000,
+        "phases_avg_seconds": _phase_means(rows),
+        "trend": trend,
+        "slowest_nodes": slowest_nodes,
+        "slowest_groups": slowest_groups,
+    }
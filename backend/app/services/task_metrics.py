@@ -1,5 +1,21 @@
 from __future__ import annotations
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, TypeVar
+
+from app.core.metrics import (
+    TASK_DURATION,
+    TASK_EVENTS,
+    TASK_LAST_RUN_FINISHED,
+    TASK_LAST_RUN_USERS,
+    TASK_PHASE_DURATION,
+    TASK_RUNS,
+    collect_upstream_calls,
+)
+from app.services.sync_history import save_run
+
+T = TypeVar("T")
 
 @dataclass
 class TaskRunStats:
@@ -15,3 +31,79 @@ class TaskRunStats:
     remote_deleted_users: int = 0
     users_with_stale_usage: int = 0
     errors: int = 0
+    rows_written: int = 0
+    rows_unchanged: int = 0
+    db_write_ms: int = 0
+    # Seconds per phase, summed over the batches of one run.
+    phase_seconds: dict[str, float] = field(default_factory=dict)
+    # Seconds per remote fetch, keyed by access group ("node:3", "allocation:7").
+    group_fetch_seconds: dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self._lap_started = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        """Charge the time since the previous lap (or since creation) to `phase`."""
+        now = time.perf_counter()
+        self.phase_seconds[phase] = round(self.phase_seconds.get(phase, 0.0) + now - self._lap_started, 4)
+        self._lap_started = now
+
+    def timed(self, group: str, factory: Callable[[], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+        """Wrap a remote job factory so its wall time is added to `group`."""
+
+        async def run() -> T:
+            started = time.perf_counter()
+            try:
+                return await factory()
+            finally:
+                seconds = self.group_fetch_seconds.get(group, 0.0) + time.perf_counter() - started
+                self.group_fetch_seconds[group] = round(seconds, 4)
+
+        return run
+
+
+def _counters(stats: TaskRunStats) -> dict[str, int]:
+    return {f.name: getattr(stats, f.name) for f in fields(stats) if isinstance(getattr(stats, f.name), int)}
+
+
+async def observed_run(task: str, run: Awaitable[TaskRunStats | None], *, keep_history: bool = False) -> TaskRunStats | None:
+    """Await a task body and export its duration, phase timings and counters.
+
+    With `keep_history` the run (including a failed one) is also stored in
+    sync_runs together with the per-host stats of every panel request it made.
+    """
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    stats: TaskRunStats | None = None
+    error: Exception | None = None
+    with collect_upstream_calls() as node_calls:
+        try:
+            stats = await run
+        except Exception as exc:
+            error = exc
+    seconds = time.perf_counter() - started
+    TASK_DURATION.labels(task).observe(seconds)
+    TASK_RUNS.labels(task, "failed" if error is not None else "ok").inc()
+    if error is None:
+        TASK_LAST_RUN_FINISHED.labels(task).set(time.time())
+        TASK_LAST_RUN_USERS.labels(task).set(stats.scanned_users if stats is not None else 0)
+    if stats is not None:
+        for phase, phase_seconds in stats.phase_seconds.items():
+            TASK_PHASE_DURATION.labels(task, phase).observe(phase_seconds)
+        for name, value in _counters(stats).items():
+            if value and not name.endswith("_ms"):
+                TASK_EVENTS.labels(task, name).inc(value)
+    if keep_history:
+        await save_run(
+            task,
+            started_at=started_at,
+            duration_ms=int(seconds * 1000),
+            counters=_counters(stats) if stats is not None else {},
+            phases=dict(stats.phase_seconds) if stats is not None else {},
+            group_fetches=dict(stats.group_fetch_seconds) if stats is not None else {},
+            node_calls=node_calls,
+            error=error,
+        )
+    if error is not None:
+        raise error
+    return stats
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import Select, bindparam, select
+
+from app.models.user import GuardinoUser, UserStatus
+
+
+def _status_literal(status: UserStatus):
+    # Inlined rather than bound so the planner can match the partial index
+    # predicates of migration 0017 even when it picks a generic plan.
+    return bindparam(f"scan_status_{status.value}", status, type_=GuardinoUser.status.type, literal_execute=True)
+
+
+def due_users_batch(now: datetime, last_id: int, batch_size: int) -> Select:
+    """Active users whose expiry has passed, keyset-paged by id.
+
+    Served by ix_users_active_expire_id: (expire_at, id) WHERE status = 'active'.
+    """
+    return (
+        select(GuardinoUser)
+        .where(
+            GuardinoUser.status == _status_literal(UserStatus.active),
+            GuardinoUser.expire_at <= now,
+            GuardinoUser.id > last_id,
+        )
+        .order_by(GuardinoUser.id.asc())
+        .limit(batch_size)
+    )
+
+
+def live_users_batch(last_id: int, batch_size: int) -> Select:
+    """Non-deleted users keyset-paged by id.
+
+    Served by ix_users_live_id: (id) WHERE status <> 'deleted'.
+    """
+    return (
+        select(GuardinoUser)
+        .where(GuardinoUser.status != _status_literal(UserStatus.deleted), GuardinoUser.id > last_id)
+        .order_by(GuardinoUser.id.asc())
+        .limit(batch_size)
+    )
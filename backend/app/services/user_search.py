@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import bindparam, case, exists, func, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.subaccount import SubAccount
+from app.models.user import GuardinoUser
+
+logger = logging.getLogger(__name__)
+
+# pg_trgm cannot use its index for patterns with fewer than 3 characters, so
+# shorter terms are matched as prefixes against the lower(...) btree indexes.
+MIN_TRIGRAM_TERM = 3
+
+_trigram_available: bool | None = None
+
+
+async def trigram_available(db: AsyncSession) -> bool:
+    """Whether pg_trgm is installed (checked once per process)."""
+    global _trigram_available
+    if _trigram_available is None:
+        try:
+            q = await db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+            _trigram_available = q.scalar_one_or_none() is not None
+        except Exception as exc:
+            logger.warning("pg_trgm availability check failed err=%s", str(exc)[:160])
+            return False
+    return _trigram_available
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def apply_user_search(db: AsyncSession, stmt, term: str, *, ranked: bool):
+    """Filter a GuardinoUser select by label / remote username / id.
+
+    Terms shorter than MIN_TRIGRAM_TERM are prefix matches (index range
+    scans); longer ones are substring matches served by the trigram indexes.
+    With `ranked`, exact and prefix label matches come first, then closer
+    trigram similarity, then newest.
+    """
+    term = term.strip()
+    lowered = term.lower()
+    prefix = bindparam("search_prefix", _escape_like(lowered) + "%", literal_execute=True)
+    label_lower = func.lower(GuardinoUser.label)
+    remote_lower = func.lower(SubAccount.remote_identifier)
+
+    if len(term) < MIN_TRIGRAM_TERM:
+        conditions = [
+            label_lower.like(prefix, escape="\\"),
+            exists().where(SubAccount.user_id == GuardinoUser.id, remote_lower.like(prefix, escape="\\")),
+        ]
+    else:
+        pattern = "%" + _escape_like(term) + "%"
+        conditions = [
+            GuardinoUser.label.ilike(pattern, escape="\\"),
+            exists().where(
+                SubAccount.user_id == GuardinoUser.id,
+                SubAccount.remote_identifier.ilike(pattern, escape="\\"),
+            ),
+        ]
+    if term.isdigit():
+        conditions.append(GuardinoUser.id == int(term))
+    stmt = stmt.where(or_(*conditions))
+
+    if not ranked:
+        return stmt
+    order = [
+        case(
+            (label_lower == lowered, 0),
+            (label_lower.like(prefix, escape="\\"), 1),
+            else_=2,
+        )
+    ]
+    if len(term) >= MIN_TRIGRAM_TERM and await trigram_available(db):
+        order.append(func.similarity(GuardinoUser.label, term).desc())
+    order.append(GuardinoUser.id.desc())
+    return stmt.order_by(None).order_by(*order)
@@ -0,0 +1,247 @@
+"""Reseller wallet holds.
+
+Billed operations run in three steps so the reseller row lock is never held
+across upstream panel calls:
+
+1. reserve: a short transaction locks the reseller row, checks the spendable
+   balance (balance - held_balance), records the pending order plus a
+   WalletHold for the estimated amount, and commits.
+2. the panel calls run with no database lock held.
+3. capture: a second short transaction locks the row again, turns the hold
+   into the real ledger entry (balance_after is computed under that lock) and
+   completes the order; on failure the hold is released instead and the
+   order is marked failed with its client_request_id cleared, so the same
+   request id can be retried exactly as when the whole transaction used to
+   roll back.
+
+An open hold also marks its user as busy: reserving for a user that already
+has one is rejected, and the unbilled user operations check the same
+(ensure_user_idle), which keeps concurrent operations on one user from
+interleaving now that the reseller lock no longer serializes them. Capture
+re-reads that user FOR UPDATE, so callers write user fields after it.
+
+A hold that outlives WALLET_HOLD_TTL_SECONDS is released by the reseller's
+next reservation. Its order is failed but keeps its client_request_id (the
+request may still be running, so a retry must not be billed again), and a
+later capture of that hold is refused.
+"""
+
+from __future__ import annotations
+
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.ledger import LedgerTransaction
+from app.models.order import Order, OrderStatus
+from app.models.reseller import Reseller
+from app.models.user import GuardinoUser
+from app.models.wallet_hold import WalletHold, WalletHoldStatus
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _hold_ttl() -> timedelta:
+    return timedelta(seconds=max(60, int(getattr(settings, "WALLET_HOLD_TTL_SECONDS", 1800) or 1800)))
+
+
+def available_balance(reseller: Reseller) -> int:
+    return int(reseller.balance or 0) - int(reseller.held_balance or 0)
+
+
+async def _lock_reseller(db: AsyncSession, reseller_id: int) -> Reseller:
+    q = await db.execute(
+        select(Reseller)
+        .where(Reseller.id == reseller_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return q.scalar_one()
+
+
+async def _lock_hold(db: AsyncSession, hold_id: int) -> WalletHold:
+    q = await db.execute(
+        select(WalletHold)
+        .where(WalletHold.id == hold_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return q.scalar_one()
+
+
+async def _lock_user(db: AsyncSession, user_id: int) -> None:
+    await db.execute(
+        select(GuardinoUser)
+        .where(GuardinoUser.id == user_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+
+
+async def _fail_orders(db: AsyncSession, order_ids: list[int], *, keep_request_id: bool = False) -> None:
+    values: dict = {"status": OrderStatus.failed}
+    if not keep_request_id:
+        values["client_request_id"] = None
+    await db.execute(
+        update(Order)
+        .where(Order.id.in_(order_ids), Order.status == OrderStatus.pending)
+        .values(**values)
+    )
+
+
+async def _release_expired_holds(db: AsyncSession, reseller: Reseller, now: datetime) -> None:
+    q = await db.execute(
+        select(WalletHold)
+        .where(
+            WalletHold.reseller_id == reseller.id,
+            WalletHold.status == WalletHoldStatus.held,
+            WalletHold.expires_at <= now,
+        )
+        .with_for_update()
+    )
+    expired = q.scalars().all()
+    if not expired:
+        return
+    for hold in expired:
+        reseller.held_balance = max(0, int(reseller.held_balance or 0) - int(hold.amount))
+        hold.status = WalletHoldStatus.released
+        hold.settled_at = now
+    # The requests behind these holds may still be running; keeping their
+    # request ids makes a retry replay-fail instead of billing again.
+    await _fail_orders(db, [int(hold.order_id) for hold in expired], keep_request_id=True)
+    logger.warning("released expired wallet holds reseller_id=%s holds=%s", reseller.id, len(expired))
+
+
+async def ensure_user_idle(db: AsyncSession, user_id: int) -> None:
+    """409 while another billed operation on `user_id` still has an open hold."""
+    q = await db.execute(
+        select(WalletHold.id)
+        .where(
+            WalletHold.user_id == user_id,
+            WalletHold.status == WalletHoldStatus.held,
+            WalletHold.expires_at > _now(),
+        )
+        .limit(1)
+    )
+    if q.scalar_one_or_none() is not None:
+        raise HTTPException(status_code=409, detail="Another operation on this user is in progress; retry shortly.")
+
+
+async def reserve_funds(
+    db: AsyncSession,
+    reseller: Reseller,
+    order: Order,
+    *,
+    amount: int,
+    user_id: int | None = None,
+) -> WalletHold:
+    """Hold `amount` for the already flushed `order`.
+
+    The caller must hold the reseller row lock (lock_reseller_for_billing) and
+    commits afterwards. Credit-only operations reserve 0 to mark the user busy.
+    """
+    now = _now()
+    await _release_expired_holds(db, reseller, now)
+    if user_id is not None:
+        await ensure_user_idle(db, user_id)
+    amount = max(0, int(amount))
+    if available_balance(reseller) < amount:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+
+    reseller.held_balance = int(reseller.held_balance or 0) + amount
+    hold = WalletHold(
+        reseller_id=reseller.id,
+        order_id=order.id,
+        user_id=user_id,
+        amount=amount,
+        status=WalletHoldStatus.held,
+        expires_at=now + _hold_ttl(),
+    )
+    db.add(hold)
+    await db.flush()
+    return hold
+
+
+async def capture_hold(
+    db: AsyncSession,
+    hold: WalletHold,
+    *,
+    amount: int,
+    reason: str,
+    request_id: str | None,
+    occurred_at: datetime,
+) -> tuple[Reseller, LedgerTransaction | None]:
+    """Settle `hold` with a ledger entry of `amount` (negative = charge, positive = refund).
+
+    Locks the reseller row again so balance_after is exact, and re-reads the
+    hold's user FOR UPDATE; write user fields after this call. A charge is
+    normally at most the held amount. Does not commit.
+
+    Raises 409 if the hold was already released (the operation outlived
+    WALLET_HOLD_TTL_SECONDS and its order was failed).
+    """
+    reseller = await _lock_reseller(db, hold.reseller_id)
+    hold = await _lock_hold(db, hold.id)
+    if hold.status != WalletHoldStatus.held:
+        logger.error("refusing to capture wallet hold id=%s in state %s", hold.id, hold.status)
+        raise HTTPException(status_code=409, detail="Operation took too long and was cancelled; check the user and retry with a new request_id.")
+    if hold.user_id is not None:
+        await _lock_user(db, int(hold.user_id))
+    reseller.held_balance = max(0, int(reseller.held_balance or 0) - int(hold.amount))
+    hold.status = WalletHoldStatus.captured
+    hold.settled_at = occurred_at
+
+    ledger = None
+    if amount:
+        reseller.balance = int(reseller.balance) + int(amount)
+        ledger = LedgerTransaction(
+            reseller_id=reseller.id,
+            order_id=hold.order_id,
+            client_request_id=request_id,
+            amount=int(amount),
+            reason=reason,
+            balance_after=reseller.balance,
+            occurred_at=occurred_at,
+        )
+        db.add(ledger)
+    return reseller, ledger
+
+
+async def release_hold(db: AsyncSession, *, hold_id: int, reseller_id: int) -> None:
+    """Drop uncommitted changes, then release the hold and fail its order (commits).
+
+    Takes ids because the rollback expires every instance in the session.
+    """
+    try:
+        await db.rollback()
+        reseller = await _lock_reseller(db, reseller_id)
+        hold = await _lock_hold(db, hold_id)
+        if hold.status == WalletHoldStatus.held:
+            reseller.held_balance = max(0, int(reseller.held_balance or 0) - int(hold.amount))
+            hold.status = WalletHoldStatus.released
+            hold.settled_at = _now()
+            await _fail_orders(db, [int(hold.order_id)])
+        await db.commit()
+    except Exception as exc:
+        await db.rollback()
+        logger.error("wallet hold release failed hold_id=%s err=%s", hold_id, str(exc)[:160])
+
+
+@asynccontextmanager
+async def release_on_error(db: AsyncSession, hold: WalletHold):
+    """Release `hold` if the block raises; a hold that was already captured is left alone."""
+    hold_id, reseller_id = int(hold.id), int(hold.reseller_id)
+    try:
+        yield
+    except BaseException:
+        await release_hold(db, hold_id=hold_id, reseller_id=reseller_id)
+        raise
@@ -0,0 +1,167 @@
+"""Shared WGDashboard peer index.
+
+WGDashboard adapters are built per request, yet almost every per-peer call
+first needs the peer's configuration and request id, i.e. the full peer list
+of the dashboard. This module keeps the configuration names and the peers of
+each configuration per dashboard (base_url, apikey) in process memory for
+WG_PEER_INDEX_TTL_SECONDS. Stale configurations are loaded concurrently,
+writes through the adapter invalidate only the configuration they touched,
+and hit/miss counters are exposed by peer_index_stats(). Changes made by
+other processes or directly on the dashboard show up within the TTL, or
+earlier when a lookup misses and the caller asks for a refresh.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable
+
+from app.core.config import settings
+from app.core.metrics import record_cache
+
+Peer = dict[str, Any]
+# identifier candidate -> (peer, configuration name, restricted)
+PeerIndex = dict[str, tuple[Peer, str, bool]]
+
+# A refresh (after a lookup miss) still reuses data loaded this recently, so a
+# burst of misses costs one reload rather than one per peer.
+_REFRESH_MIN_AGE_SECONDS = 2.0
+
+
+@dataclass
+class _Entry:
+    names: list[str] | None = None
+    names_loaded_at: float = 0.0
+    # configuration name -> (loaded_at, [(peer, restricted)])
+    configs: dict[str, tuple[float, list[tuple[Peer, bool]]]] = field(default_factory=dict)
+    # Built indexes per configuration order (the preferred config wins ties).
+    indexes: dict[tuple[str, ...], PeerIndex] = field(default_factory=dict)
+    lock: tuple[asyncio.AbstractEventLoop, asyncio.Lock] | None = None
+
+
+_entries: dict[str, _Entry] = {}
+_stats: dict[str, int] = {"hits": 0, "misses": 0, "config_loads": 0, "invalidations": 0}
+
+
+def _ttl() -> float:
+    return float(max(0, int(getattr(settings, "WG_PEER_INDEX_TTL_SECONDS", 30) or 0)))
+
+
+def peer_index_key(base_url: str, apikey: str) -> str:
+    """Cache key for a dashboard; the API key only contributes a hash."""
+    raw = f"{base_url.rstrip('/').lower()}|{hashlib.sha256(apikey.encode('utf-8')).hexdigest()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_lock(entry: _Entry) -> asyncio.Lock:
+    # asyncio locks are bound to the loop they first wait on; each Celery task
+    # runs its own loop.
+    loop = asyncio.get_running_loop()
+    if entry.lock is None or entry.lock[0] is not loop:
+        entry.lock = (loop, asyncio.Lock())
+    return entry.lock[1]
+
+
+def _max_age(refresh: bool) -> float:
+    ttl = _ttl()
+    return min(ttl, _REFRESH_MIN_AGE_SECONDS) if refresh else ttl
+
+
+async def configuration_names(
+    key: str,
+    fetch: Callable[[], Awaitable[list[str]]],
+    *,
+    refresh: bool = False,
+) -> list[str]:
+    entry = _entries.setdefault(key, _Entry())
+    if entry.names is not None and time.monotonic() - entry.names_loaded_at < _max_age(refresh):
+        return entry.names
+    names = await fetch()
+    entry.names = list(names)
+    entry.names_loaded_at = time.monotonic()
+    return entry.names
+
+
+async def get_peer_index(
+    key: str,
+    config_names: Iterable[str],
+    load_config: Callable[[str], Awaitable[list[tuple[Peer, bool]]]],
+    peer_ids: Callable[[Peer], set[str]],
+    *,
+    refresh: bool = False,
+) -> PeerIndex:
+    """Index of every peer in `config_names`, loading only configurations that are stale.
+
+    The first configuration in `config_names` that lists a peer wins. If every
+    stale configuration fails to load and nothing is cached, the first error
+    is raised; an index missing a failed configuration is returned but not
+    cached, so that configuration is retried on the next call.
+    """
+    entry = _entries.setdefault(key, _Entry())
+    order = tuple(config_names)
+    async with _entry_lock(entry):
+        now = time.monotonic()
+        max_age = _max_age(refresh)
+        stale = [name for name in order if name not in entry.configs or now - entry.configs[name][0] >= max_age]
+        if not stale and order in entry.indexes:
+            _stats["hits"] += 1
+            record_cache("wg_peer_index", True)
+            return entry.indexes[order]
+
+        first_error: BaseException | None = None
+        if stale:
+            _stats["misses"] += 1
+            record_cache("wg_peer_index", False)
+            results = await asyncio.gather(*(load_config(name) for name in stale), return_exceptions=True)
+            loaded_at = time.monotonic()
+            for name, result in zip(stale, results):
+                if isinstance(result, BaseException):
+                    first_error = first_error or result
+                    entry.configs.pop(name, None)
+                    continue
+                entry.configs[name] = (loaded_at, result)
+                _stats["config_loads"] += 1
+            entry.indexes.clear()
+        else:
+            _stats["hits"] += 1
+            record_cache("wg_peer_index", True)
+
+        index: PeerIndex = {}
+        for name in order:
+            cached = entry.configs.get(name)
+            if cached is None:
+                continue
+            for peer, restricted in cached[1]:
+                for pid in peer_ids(peer):
+                    index.setdefault(pid, (peer, name, restricted))
+        if not index and first_error is not None:
+            raise first_error
+        if first_error is None:
+            entry.indexes[order] = index
+        return index
+
+
+def invalidate_peer_index(key: str, config_name: str | None = None) -> None:
+    """Drop one configuration (or, without a name, everything) cached for a dashboard."""
+    entry = _entries.get(key)
+    if entry is None:
+        return
+    _stats["invalidations"] += 1
+    if config_name:
+        entry.configs.pop(config_name, None)
+    else:
+        entry.configs.clear()
+        entry.names = None
+    entry.indexes.clear()
+
+
+def peer_index_stats() -> dict[str, float]:
+    """Process-wide counters since start; a hit is an index lookup served without HTTP."""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
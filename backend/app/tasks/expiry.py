@@ -1,81 +1,188 @@
 from __future__ import annotations
 import asyncio
-from datetime import datetime, timezone
-from sqlalchemy import select
+import logging
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update
 
 from app.core.celery_app import celery_app
 from app.core.config import settings
 from app.core.db import AsyncSessionLocal
+from app.models.node import Node
 from app.models.user import GuardinoUser, UserStatus
 from app.models.subaccount import SubAccount
-from app.models.node import Node
-from app.services.panel_access import get_adapter_for_subaccount
-from app.services.status_policy import enforce_time_expiry
+from app.services.expiry_schedule import ack_due, claim_due, schedule_expiry
+from app.services.panel_access import load_adapter_resolver
+from app.services.status_policy import enforce_time_expiry_many
+from app.services.subscription_cache import invalidate_subscription_cache
+from app.services.http_client import closing_shared_clients
 from app.services.locks import redis_lock
-from app.services.task_metrics import TaskRunStats
+from app.services.remote_fanout import run_bounded
+from app.services.sync_history import task_lock_ttl
+from app.services.task_metrics import TaskRunStats, observed_run
+from app.services.user_scans import due_users_batch
+
+logger = logging.getLogger(__name__)
 
 @celery_app.task(name="app.tasks.expiry.expire_due_users")
 def expire_due_users():
-    lock_ttl = max(90, int(getattr(settings, "EXPIRY_SYNC_SECONDS", 60) or 60) * 2)
+    """Reconciliation scan: expires anything the timeline missed and re-seeds it."""
+    lock_ttl = task_lock_ttl("expire_due_users")
     with redis_lock("guardino:lock:expire_due_users", ttl_seconds=lock_ttl) as ok:
         if not ok:
             return
-        asyncio.run(_expire_due_users_async())
+        asyncio.run(closing_shared_clients(observed_run("expire_due_users", _expire_due_users_async(), keep_history=True)))
+
+
+@celery_app.task(name="app.tasks.expiry.expire_scheduled_users")
+def expire_scheduled_users():
+    """Expire the users whose timeline entry is due (runs every few seconds)."""
+    lock_ttl = task_lock_ttl("expire_scheduled_users")
+    with redis_lock("guardino:lock:expire_scheduled_users", ttl_seconds=lock_ttl) as ok:
+        if not ok:
+            return
+        asyncio.run(closing_shared_clients(observed_run("expire_scheduled_users", _expire_scheduled_users_async())))
 
 
 # internal
 
+def _batch_size() -> int:
+    return max(100, min(10000, int(getattr(settings, "EXPIRY_SYNC_BATCH_SIZE", 500) or 500)))
+
+
+def _schedule_horizon() -> timedelta:
+    # Always cover at least two reconciliation intervals so every user is on
+    # the timeline before it becomes due.
+    horizon = int(getattr(settings, "EXPIRY_SCHEDULE_HORIZON_SECONDS", 3600) or 3600)
+    interval = int(getattr(settings, "EXPIRY_SYNC_SECONDS", 60) or 60)
+    return timedelta(seconds=max(horizon, interval * 2))
+
+
+async def _expire_users(db, user_ids: list[int], now: datetime, stats: TaskRunStats) -> None:
+    """Disable the users among `user_ids` that are still active and due, then enforce remotely.
+
+    The status flip is a conditional UPDATE ... RETURNING, so a user is only
+    claimed (and enforced) once even if the scan and the timeline race.
+    """
+    q = await db.execute(
+        update(GuardinoUser)
+        .where(
+            GuardinoUser.id.in_(user_ids),
+            GuardinoUser.status == UserStatus.active,
+            GuardinoUser.expire_at <= now,
+        )
+        .values(status=UserStatus.disabled)
+        .returning(GuardinoUser.id, GuardinoUser.master_sub_token)
+        .execution_options(synchronize_session=False)
+    )
+    expired = q.all()
+    await db.commit()
+    if not expired:
+        stats.lap("expire")
+        return
+    stats.affected_users += len(expired)
+    await invalidate_subscription_cache(*(row.master_sub_token for row in expired))
+    stats.lap("expire")
+
+    qs = await db.execute(select(SubAccount).where(SubAccount.user_id.in_([row.id for row in expired])))
+    subs = list(qs.scalars().all())
+    resolver = await load_adapter_resolver(db, subs)
+
+    # Remote actions (best-effort) after local state update: one bulk call per
+    # panel login, the logins in parallel.
+    groups: dict[int, tuple[Node, object, list[str]]] = {}
+    for s in subs:
+        n = resolver.nodes.get(s.node_id)
+        if not n:
+            continue
+        try:
+            adapter = resolver.adapter_for(s, n)
+        except Exception:
+            stats.remote_actions += 1
+            stats.remote_failures += 1
+            continue
+        groups.setdefault(id(adapter), (n, adapter, []))[2].append(s.remote_identifier)
+
+    # No per-job timeout: a panel without bulk endpoints is driven user by
+    # user, and those calls carry their own timeouts.
+    results = await run_bounded(
+        {
+            key: (n.base_url, partial(enforce_time_expiry_many, n.panel_type, adapter, rids))
+            for key, (n, adapter, rids) in groups.items()
+        },
+        timeout=0,
+    )
+    for key, result in results.items():
+        rids = groups[key][2]
+        stats.remote_actions += len(rids)
+        stats.remote_failures += len(rids) if isinstance(result, BaseException) else len(result)
+    stats.lap("enforce")
+
+
 async def _expire_due_users_async():
     stats = TaskRunStats()
     now = datetime.now(timezone.utc)
-    batch_size = max(100, min(10000, int(getattr(settings, "EXPIRY_SYNC_BATCH_SIZE", 500) or 500)))
+    batch_size = _batch_size()
     last_id = 0
     async with AsyncSessionLocal() as db:
         while True:
-            # Find active users whose expire_at <= now, in deterministic keyset batches.
+            # Active users expiring before the horizon, in deterministic keyset
+            # batches: the due ones are expired, the rest go on the timeline.
             q = await db.execute(
-                select(GuardinoUser)
-                .where(
-                    GuardinoUser.status == UserStatus.active,
-                    GuardinoUser.expire_at <= now,
-                    GuardinoUser.id > last_id,
+                due_users_batch(now + _schedule_horizon(), last_id, batch_size).with_only_columns(
+                    GuardinoUser.id, GuardinoUser.expire_at
                 )
-                .order_by(GuardinoUser.id.asc())
-                .limit(batch_size)
             )
-            users = q.scalars().all()
-            if not users:
+            rows = q.all()
+            if not rows:
+                break
+
+            stats.scanned_users += len(rows)
+            stats.lap("scan")
+            due_ids = [row.id for row in rows if row.expire_at <= now]
+            if due_ids:
+                await _expire_users(db, due_ids, now, stats)
+            await schedule_expiry((row.id, row.expire_at, UserStatus.active) for row in rows if row.expire_at > now)
+            stats.lap("schedule")
+
+            last_id = rows[-1].id
+            if len(rows) < batch_size:
                 break
 
-            stats.scanned_users += len(users)
-            user_ids = [u.id for u in users]
-            qs = await db.execute(select(SubAccount).where(SubAccount.user_id.in_(user_ids)))
-            subs = qs.scalars().all()
-            node_ids = list({s.node_id for s in subs})
-            qn = await db.execute(select(Node).where(Node.id.in_(node_ids)))
-            nodes = {n.id: n for n in qn.scalars().all()}
-
-            # Expire each user locally first.
-            for u in users:
-                u.status = UserStatus.disabled
-            stats.affected_users += len(users)
-            await db.commit()
-
-            # Remote actions (best-effort) after local state update.
-            for s in subs:
-                n = nodes.get(s.node_id)
-                if not n:
-                    continue
-                try:
-                    adapter = await get_adapter_for_subaccount(db, s, n)
-                    # For all panels, best-effort delete to enforce expiry.
-                    stats.remote_actions += 1
-                    await enforce_time_expiry(n.panel_type, adapter, s.remote_identifier)
-                except Exception:
-                    stats.remote_failures += 1
-
-            last_id = users[-1].id
-            if len(users) < batch_size:
+        logger.info("expire_due_users stats=%s", stats)
+    return stats
+
+
+async def _expire_scheduled_users_async():
+    now = datetime.now(timezone.utc)
+    batch_size = _batch_size()
+    # Claims outlive the run's lock, so a run that died is retried by a later
+    # one rather than raced by the next tick.
+    lease_until = now + timedelta(seconds=task_lock_ttl("expire_scheduled_users"))
+    due_ids = await claim_due(now, batch_size, lease_until)
+    if not due_ids:
+        return
+
+    stats = TaskRunStats()
+    async with AsyncSessionLocal() as db:
+        while due_ids:
+            stats.scanned_users += len(due_ids)
+            await _expire_users(db, due_ids, now, stats)
+            # Entries can be stale (the user was extended or re-enabled after
+            # being scheduled); put those back at their current expire_at.
+            q = await db.execute(
+                select(GuardinoUser.id, GuardinoUser.expire_at).where(
+                    GuardinoUser.id.in_(due_ids),
+                    GuardinoUser.status == UserStatus.active,
+                    GuardinoUser.expire_at > now,
+                )
+            )
+            await schedule_expiry((row.id, row.expire_at, UserStatus.active) for row in q.all())
+            await ack_due(due_ids, lease_until)
+            stats.lap("schedule")
+            if len(due_ids) < batch_size:
                 break
+            due_ids = await claim_due(now, batch_size, lease_until)
 
-        print('expire_due_users stats:', stats)
+    logger.info("expire_scheduled_users stats=%s", stats)
+    return stats
@@ -1,8 +1,13 @@
 from __future__ import annotations
 import asyncio
 import logging
+import time
+from dataclasses import dataclass
+from functools import partial
 from datetime import datetime, timedelta, timezone
-from sqlalchemy import select
+from typing import Any
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import load_only
 
 from app.core.celery_app import celery_app
 from app.core.config import settings
@@ -12,11 +17,23 @@ from app.models.subaccount import SubAccount
 from app.models.node import Node, PanelType
 from app.models.node_allocation import NodeAllocation
 from app.services.adapters.factory import get_adapter
-from app.services.adapters.base import RemoteUserListItem, RemoteUserNotFound
-from app.services.panel_access import get_adapter_for_allocation, get_adapter_for_subaccount
-from app.services.status_policy import enforce_volume_exhausted
+from app.services.adapters.base import RemoteUserNotFound
+from app.services.panel_access import (
+    AdapterResolver,
+    credential_fingerprint,
+    get_adapter_for_allocation,
+    load_adapter_resolver,
+)
+from app.services.status_policy import enforce_volume_exhausted_many
+from app.services.subscription_cache import invalidate_subscription_cache
+from app.services.bulk_update import id_chunks, update_rows_by_id
+from app.services.http_client import closing_shared_clients
 from app.services.locks import redis_lock
-from app.services.task_metrics import TaskRunStats
+from app.services.remote_fanout import RemoteJob, error_text, fanout_limits, run_bounded
+from app.services.sync_history import task_lock_ttl
+from app.services.task_metrics import TaskRunStats, observed_run
+from app.services.user_scans import live_users_batch
+from app.services.wg_peer_index import peer_index_stats
 from app.services.dashboard_metrics import refresh_daily_metrics_for_resellers
 from app.services.remote_missing import (
     clear_remote_missing,
@@ -75,65 +92,216 @@ def _sync_create_status_meta(user: GuardinoUser, remote_status: str | None, used
         user.meta = {**meta, **extra}
 
 
-async def _fetch_remote_user_list(
-    adapter: object,
-    wanted_identifiers: set[str],
-) -> tuple[dict[str, RemoteUserListItem], bool, int | None, int]:
-    if not wanted_identifiers or not hasattr(adapter, "list_users"):
-        return {}, False, None, 0
+@dataclass(frozen=True, slots=True)
+class RemoteUsageEntry:
+    used_bytes: int
+    status: str | None
+    direct_sub_url: str | None
+
+
+@dataclass
+class RemoteSnapshot:
+    """One access group's remote user list, read once per sync cycle.
+
+    `entries` is keyed by both remote identifier and username (sharing one
+    entry). `complete` is False when paging stopped early, in which case a
+    miss is not evidence that the user is gone.
+    """
+
+    entries: dict[str, RemoteUsageEntry]
+    complete: bool
+    total: int | None
+    scanned: int
+
+
+async def _fetch_remote_snapshot(adapter: object) -> RemoteSnapshot:
+    """Page through the panel's user list.
 
+    Each page gets REMOTE_FANOUT_TIMEOUT_SECONDS, not the scan as a whole, so
+    a large panel is not cut off by its size. A failing later page ends the
+    scan with what was read, as an incomplete snapshot; only a failing first
+    page raises.
+    """
+    page_timeout = fanout_limits()[2]
     page_size = max(100, min(5000, int(getattr(settings, "USAGE_SYNC_REMOTE_LIST_PAGE_SIZE", 1000) or 1000)))
     max_pages = max(1, min(1000, int(getattr(settings, "USAGE_SYNC_REMOTE_LIST_MAX_PAGES", 200) or 200)))
-    found: dict[str, RemoteUserListItem] = {}
-    seen_remote_keys: set[str] = set()
+    entries: dict[str, RemoteUsageEntry] = {}
     offset = 0
     total: int | None = None
     scanned = 0
 
     for _page in range(max_pages):
-        result = await adapter.list_users(offset=offset, limit=page_size)  # type: ignore[attr-defined]
+        try:
+            result = await asyncio.wait_for(adapter.list_users(offset=offset, limit=page_size), page_timeout)  # type: ignore[attr-defined]
+        except Exception as exc:
+            if offset == 0:
+                raise
+            logger.warning("sync_usage remote list page failed offset=%s scanned=%s err=%s", offset, scanned, error_text(exc))
+            return RemoteSnapshot(entries, False, total, scanned)
         items = list(getattr(result, "items", []) or [])
         scanned += len(items)
         maybe_total = getattr(result, "total", None)
         total = int(maybe_total) if maybe_total is not None else total
 
-        page_keys = {
-            remote_identifier(candidate)
-            for item in items
-            for candidate in (item.remote_identifier, item.username)
-            if remote_identifier(candidate)
-        }
-        new_page_keys = page_keys - seen_remote_keys
+        new_keys = False
         for item in items:
+            entry = RemoteUsageEntry(
+                used_bytes=int(item.used_bytes or 0),
+                status=item.status,
+                direct_sub_url=item.direct_sub_url,
+            )
             for candidate in (item.remote_identifier, item.username):
                 key = remote_identifier(candidate)
-                if key and key in wanted_identifiers:
-                    found[key] = item
-        seen_remote_keys.update(page_keys)
+                if key:
+                    new_keys = new_keys or key not in entries
+                    entries[key] = entry
 
-        if wanted_identifiers.issubset(found.keys()):
-            return found, True, total, scanned
         if not items:
-            return found, True, total, scanned
-        if not new_page_keys and offset > 0:
-            return found, False, total, scanned
-        offset += page_size
+            return RemoteSnapshot(entries, True, total, scanned)
+        if not new_keys and offset > 0:
+            return RemoteSnapshot(entries, False, total, scanned)
+        # Panels may clamp `limit`, so advance by what was returned and only
+        # take a short page as the end when there is no total to go by.
+        offset += len(items)
         if total is not None and offset >= total:
-            return found, True, total, scanned
-        if len(items) < page_size:
-            return found, True, total, scanned
-
-    return found, False, total, scanned
+            return RemoteSnapshot(entries, True, total, scanned)
+        if total is None and len(items) < page_size:
+            return RemoteSnapshot(entries, True, total, scanned)
+
+    return RemoteSnapshot(entries, False, total, scanned)
+
+
+async def _fetch_direct_usage(adapter: object, remote_id: str) -> tuple[int | None, str | None]:
+    """(used_bytes, status) of one remote user the bulk reads did not cover."""
+    if hasattr(adapter, "get_user_snapshot"):
+        snapshot = await adapter.get_user_snapshot(remote_id)  # type: ignore[attr-defined]
+        return snapshot.used_bytes, snapshot.status
+    return await adapter.get_used_bytes(remote_id), None  # type: ignore[attr-defined]
+
+
+# Only these columns are loaded for the batch and written back by
+# _write_back_batch; the sync never flushes ORM instances.
+_USER_LOAD = (
+    GuardinoUser.id,
+    GuardinoUser.owner_reseller_id,
+    GuardinoUser.total_gb,
+    GuardinoUser.used_bytes,
+    GuardinoUser.status,
+    GuardinoUser.master_sub_token,
+    GuardinoUser.meta,
+)
+_SUB_LOAD = (
+    SubAccount.id,
+    SubAccount.user_id,
+    SubAccount.node_id,
+    SubAccount.allocation_id,
+    SubAccount.remote_identifier,
+    SubAccount.used_bytes,
+    SubAccount.last_raw_used,
+    SubAccount.last_sync_at,
+    SubAccount.panel_sub_url_cached,
+    SubAccount.panel_sub_url_cached_at,
+)
+_SUB_WRITE = ("used_bytes", "last_raw_used", "last_sync_at", "panel_sub_url_cached", "panel_sub_url_cached_at")
+
+
+def _user_state(u: GuardinoUser) -> tuple:
+    return (int(u.used_bytes or 0), u.status, dict(u.meta) if isinstance(u.meta, dict) else u.meta)
+
+
+def _user_changes(u: GuardinoUser, before: tuple) -> dict[str, Any]:
+    """The columns of `u` the sync changed, keyed by attribute name."""
+    used_bytes, status, meta = _user_state(u)
+    changes: dict[str, Any] = {}
+    if used_bytes != before[0]:
+        changes["used_bytes"] = used_bytes
+    if status != before[1]:
+        changes["status"] = status
+    if meta != before[2]:
+        changes["meta"] = u.meta
+    return changes
+
+
+def _sub_state(s: SubAccount) -> tuple:
+    return (int(s.used_bytes or 0), s.last_raw_used, s.panel_sub_url_cached)
+
+
+async def _write_back_batch(
+    db,
+    users: list[GuardinoUser],
+    subs: list[SubAccount],
+    *,
+    user_before: dict[int, tuple],
+    sub_before: dict[int, tuple],
+    deleted_sub_ids: set[int],
+    now: datetime,
+    stats: TaskRunStats,
+) -> None:
+    """Persist one batch with set-based statements instead of per-row ORM flushes.
+
+    Rows whose synced values changed are written with one UPDATE ... FROM
+    (VALUES ...) per table and set of changed columns; subaccounts that were
+    read but did not change only get last_sync_at refreshed, and only every
+    USAGE_SYNC_TOUCH_SECONDS.
+
+    Users get only the columns the sync changed, so a concurrent renew or
+    set-status is not overwritten with the values loaded at batch start. A
+    status change (and the meta written with it) is applied only while the
+    row still has the status loaded at batch start; otherwise it is dropped
+    and the next run re-evaluates the user.
+    Expunges the batch from the session and commits.
+    """
+    touch_after = timedelta(seconds=max(0, int(getattr(settings, "USAGE_SYNC_TOUCH_SECONDS", 900) or 0)))
+    user_groups: dict[tuple[tuple[str, ...], bool], list[dict]] = {}
+    changed_users = 0
+    for u in users:
+        changes = _user_changes(u, user_before[u.id])
+        if not changes:
+            continue
+        changed_users += 1
+        if "status" in changes:
+            if "used_bytes" in changes:
+                user_groups.setdefault((("used_bytes",), False), []).append({"id": u.id, "used_bytes": changes.pop("used_bytes")})
+            changes["expected_status"] = user_before[u.id][1]
+        key = (tuple(name for name in ("used_bytes", "status", "meta") if name in changes), "status" in changes)
+        user_groups.setdefault(key, []).append({"id": u.id, **changes})
+    sub_rows: list[dict] = []
+    touch_ids: list[int] = []
+    for s in subs:
+        if s.id in deleted_sub_ids:
+            continue
+        state_before, synced_before = sub_before[s.id]
+        if _sub_state(s) != state_before:
+            sub_rows.append({"id": s.id, **{name: getattr(s, name) for name in _SUB_WRITE}})
+        elif s.last_sync_at == now and (synced_before is None or now - synced_before >= touch_after):
+            touch_ids.append(s.id)
+    stats.rows_unchanged += len(users) + len(subs) - len(deleted_sub_ids) - changed_users - len(sub_rows) - len(touch_ids)
+
+    db.expunge_all()
+    started = time.perf_counter()
+    for chunk in id_chunks(sorted(deleted_sub_ids)):
+        await db.execute(delete(SubAccount).where(SubAccount.id.in_(chunk)))
+    stats.rows_written += await update_rows_by_id(db, SubAccount, sub_rows, columns=_SUB_WRITE)
+    for chunk in id_chunks(touch_ids):
+        await db.execute(update(SubAccount).where(SubAccount.id.in_(chunk)).values(last_sync_at=now))
+    stats.rows_written += len(touch_ids)
+    for (columns, check_status), rows in user_groups.items():
+        written = await update_rows_by_id(db, GuardinoUser, rows, columns=columns, expect=("status",) if check_status else ())
+        stats.rows_written += written
+        if check_status and written < len(rows):
+            logger.info("usage sync skipped %s status change(s) made stale by a concurrent update", len(rows) - written)
+    await db.commit()
+    stats.db_write_ms += int((time.perf_counter() - started) * 1000)
 
 
 @celery_app.task(name="app.tasks.usage.sync_usage")
 def sync_usage():
-    lock_ttl = max(90, int(getattr(settings, "USAGE_SYNC_SECONDS", 60) or 60) * 2)
+    lock_ttl = task_lock_ttl("sync_usage")
     with redis_lock("guardino:lock:sync_usage", ttl_seconds=lock_ttl) as ok:
         if not ok:
             logger.info("sync_usage skipped: lock not acquired")
             return
-        asyncio.run(_sync_usage_async())
+        asyncio.run(closing_shared_clients(observed_run("sync_usage", _sync_usage_async(), keep_history=True)))
 
 async def _sync_usage_async():
     stats = TaskRunStats()
@@ -143,25 +311,37 @@ async def _sync_usage_async():
     missing_min_hours = max(0, int(getattr(settings, "USAGE_SYNC_REMOTE_MISSING_MIN_HOURS", 6) or 0))
     last_id = 0
     failure_log_budget = 25
-
-    async with AsyncSessionLocal() as db:
+    # Marzban/PasarGuard user lists are read once per cycle per distinct panel
+    # login (base URL + effective credentials, so shared-mode allocations of a
+    # node coalesce) and shared by every batch and access group; a failed read
+    # is not retried until the next cycle (those batches fall back to per-user
+    # lookups).
+    snapshots: dict[str, RemoteSnapshot] = {}
+    snapshot_failed: set[str] = set()
+
+    # autoflush is off: changes are collected on the loaded instances and
+    # persisted by _write_back_batch, never flushed row by row.
+    async with AsyncSessionLocal(autoflush=False) as db:
         while True:
-            q = await db.execute(
-                select(GuardinoUser)
-                .where(GuardinoUser.status != UserStatus.deleted, GuardinoUser.id > last_id)
-                .order_by(GuardinoUser.id.asc())
-                .limit(batch_size)
-            )
-            users = q.scalars().all()
+            q = await db.execute(live_users_batch(last_id, batch_size).options(load_only(*_USER_LOAD)))
+            users = list(q.scalars().all())
             if not users:
                 break
             next_last_id = int(users[-1].id)
 
             stats.scanned_users += len(users)
             touched_reseller_ids: set[int] = set()
+            status_changed_tokens: list[str] = []
             user_ids = [u.id for u in users]
-            sq = await db.execute(select(SubAccount).where(SubAccount.user_id.in_(user_ids)))
-            subs = sq.scalars().all()
+            sq = await db.execute(select(SubAccount).options(load_only(*_SUB_LOAD)).where(SubAccount.user_id.in_(user_ids)))
+            subs = list(sq.scalars().all())
+            user_before = {u.id: _user_state(u) for u in users}
+            sub_before = {s.id: (_sub_state(s), s.last_sync_at) for s in subs}
+            deleted_sub_ids: set[int] = set()
+            # Only built if an enforcement needs an adapter the sync could not create.
+            fallback_resolver: AdapterResolver | None = None
+            # Exhausted subaccounts per adapter, enforced in bulk once the batch is reconciled.
+            exhausted: dict[int, tuple[Node, object, list[str]]] = {}
 
             by_user: dict[int, list[SubAccount]] = {}
             by_access: dict[tuple[str, int], list[SubAccount]] = {}
@@ -207,82 +387,146 @@ async def _sync_usage_async():
                         )
                         failure_log_budget -= 1
 
+            stats.lap("load")
+
+            # Remote fetches for every access group run concurrently (bounded
+            # globally and per panel host); results are applied in order below.
             wg_usage_map_by_access: dict[tuple[str, int], dict[str, int | None]] = {}
             wg_failed_access: set[tuple[str, int]] = set()
+            wanted_by_access: dict[tuple[str, int], set[str]] = {}
+            panel_by_access: dict[tuple[str, int], str] = {}
+            access_by_panel: dict[str, list[tuple[str, int]]] = {}
+            fetch_jobs: dict[tuple[str, int] | str, RemoteJob] = {}
             for key, access_subs in by_access.items():
                 node = nodes.get(access_subs[0].node_id)
                 if not node:
                     continue
-                if node.panel_type != PanelType.wg_dashboard:
-                    continue
                 adapter = adapters.get(key)
-                if not adapter:
-                    wg_failed_access.add(key)
-                    stats.remote_failures += len(access_subs)
-                    continue
-                try:
-                    if hasattr(adapter, "get_used_bytes_many"):
-                        ids = [str(s.remote_identifier or "").strip() for s in access_subs if str(s.remote_identifier or "").strip()]
-                        wg_usage_map_by_access[key] = await adapter.get_used_bytes_many(ids)  # type: ignore[attr-defined]
-                    else:
+                if node.panel_type == PanelType.wg_dashboard:
+                    if not adapter:
+                        wg_failed_access.add(key)
+                        stats.remote_failures += len(access_subs)
+                        continue
+                    if not hasattr(adapter, "get_used_bytes_many"):
                         wg_usage_map_by_access[key] = {}
-                except Exception as e:
-                    wg_failed_access.add(key)
-                    stats.remote_failures += len(access_subs)
-                    if failure_log_budget > 0:
-                        logger.warning(
-                            "sync_usage WG bulk fetch failed access=%s node_id=%s peers=%s err=%s",
-                            key,
-                            node.id,
-                            len(access_subs),
-                            str(e)[:220],
-                        )
-                        failure_log_budget -= 1
+                        continue
+                    ids = [str(s.remote_identifier or "").strip() for s in access_subs if str(s.remote_identifier or "").strip()]
+                    fetch_jobs[key] = (node.base_url, stats.timed(f"{key[0]}:{key[1]}", partial(adapter.get_used_bytes_many, ids)))  # type: ignore[attr-defined]
+                elif node.panel_type in {PanelType.pasarguard, PanelType.marzban}:
+                    if not adapter or not hasattr(adapter, "list_users"):
+                        continue
+                    wanted = {remote_identifier(s.remote_identifier) for s in access_subs if remote_identifier(s.remote_identifier)}
+                    if not wanted:
+                        continue
+                    wanted_by_access[key] = wanted
+                    allocation = allocations.get(key[1]) if key[0] == "allocation" else None
+                    panel = credential_fingerprint(node, allocation)
+                    panel_by_access[key] = panel
+                    access_by_panel.setdefault(panel, []).append(key)
+                    if panel not in snapshots and panel not in snapshot_failed and panel not in fetch_jobs:
+                        fetch_jobs[panel] = (node.base_url, stats.timed(f"{key[0]}:{key[1]}", partial(_fetch_remote_snapshot, adapter)))
+
+            # No per-job timeout: a snapshot pages through the whole panel list
+            # and bounds each page itself; the other adapter calls carry their
+            # own timeouts.
+            fetch_results = await run_bounded(fetch_jobs, timeout=0) if fetch_jobs else {}
 
-            remote_list_by_access: dict[tuple[str, int], tuple[dict[str, RemoteUserListItem], bool, int | None, int]] = {}
             remote_list_untrusted_missing_access: set[tuple[str, int]] = set()
             remote_list_untrusted_direct_budget: dict[tuple[str, int], int] = {}
-            for key, access_subs in by_access.items():
-                node = nodes.get(access_subs[0].node_id)
-                if not node or node.panel_type not in {PanelType.pasarguard, PanelType.marzban}:
-                    continue
-                adapter = adapters.get(key)
-                if not adapter or not hasattr(adapter, "list_users"):
-                    continue
-                wanted = {remote_identifier(s.remote_identifier) for s in access_subs if remote_identifier(s.remote_identifier)}
-                if not wanted:
+            for key, result in fetch_results.items():
+                if isinstance(key, str):
+                    if not isinstance(result, BaseException):
+                        snapshots[key] = result  # type: ignore[assignment]
+                        continue
+                    snapshot_failed.add(key)
+                    for access_key in access_by_panel[key]:
+                        access_subs = by_access[access_key]
+                        stats.remote_failures += len(access_subs)
+                        if failure_log_budget > 0:
+                            logger.warning(
+                                "sync_usage remote bulk list failed access=%s node_id=%s local_users=%s err=%s",
+                                access_key,
+                                access_subs[0].node_id,
+                                len(access_subs),
+                                error_text(result),
+                            )
+                            failure_log_budget -= 1
                     continue
-                try:
-                    remote_items, exhausted, total, scanned = await _fetch_remote_user_list(adapter, wanted)
-                    remote_list_by_access[key] = (remote_items, exhausted, total, scanned)
-                    if exhausted:
-                        missing_count = len(wanted - set(remote_items.keys()))
-                        missing_threshold = max(50, int(len(wanted) * 0.05))
-                        if missing_count > missing_threshold:
-                            remote_list_untrusted_missing_access.add(key)
-                            remote_list_untrusted_direct_budget[key] = 50
-                            stats.remote_bulk_untrusted += 1
+
+                access_subs = by_access[key]
+                node = nodes[access_subs[0].node_id]
+                if node.panel_type == PanelType.wg_dashboard:
+                    if isinstance(result, BaseException):
+                        wg_failed_access.add(key)
+                        stats.remote_failures += len(access_subs)
+                        if failure_log_budget > 0:
                             logger.warning(
-                                "sync_usage remote bulk list marked untrusted access=%s node_id=%s local_remote_ids=%s found=%s missing=%s scanned=%s total=%s",
+                                "sync_usage WG bulk fetch failed access=%s node_id=%s peers=%s err=%s",
                                 key,
                                 node.id,
-                                len(wanted),
-                                len(remote_items),
-                                missing_count,
-                                scanned,
-                                total,
+                                len(access_subs),
+                                error_text(result),
                             )
-                except Exception as e:
-                    stats.remote_failures += len(access_subs)
-                    if failure_log_budget > 0:
-                        logger.warning(
-                            "sync_usage remote bulk list failed access=%s node_id=%s local_users=%s err=%s",
-                            key,
-                            node.id,
-                            len(access_subs),
-                            str(e)[:220],
-                        )
-                        failure_log_budget -= 1
+                            failure_log_budget -= 1
+                        continue
+                    wg_usage_map_by_access[key] = result  # type: ignore[assignment]
+
+            for key, wanted in wanted_by_access.items():
+                snapshot = snapshots.get(panel_by_access[key])
+                if snapshot is None or not snapshot.complete:
+                    continue
+                missing_count = len(wanted - snapshot.entries.keys())
+                missing_threshold = max(50, int(len(wanted) * 0.05))
+                if missing_count > missing_threshold:
+                    remote_list_untrusted_missing_access.add(key)
+                    remote_list_untrusted_direct_budget[key] = 50
+                    stats.remote_bulk_untrusted += 1
+                    logger.warning(
+                        "sync_usage remote bulk list marked untrusted access=%s node_id=%s local_remote_ids=%s found=%s missing=%s scanned=%s total=%s",
+                        key,
+                        by_access[key][0].node_id,
+                        len(wanted),
+                        len(wanted) - missing_count,
+                        missing_count,
+                        snapshot.scanned,
+                        snapshot.total,
+                    )
+            stats.lap("remote_fetch")
+
+            # Per-user direct lookups (WG peers the bulk map missed, users a
+            # panel snapshot does not cover) run concurrently here, in the
+            # apply loop's order so the untrusted-list budget is spent the
+            # same way; the loop only reads the results.
+            direct_jobs: dict[int, RemoteJob] = {}
+            direct_over_budget: set[int] = set()
+            for u in users:
+                for s in by_user.get(u.id, []):
+                    n = nodes.get(s.node_id)
+                    if not n:
+                        continue
+                    access_key = ("allocation", int(s.allocation_id)) if s.allocation_id and int(s.allocation_id) in allocations else ("node", int(s.node_id))
+                    adapter = adapters.get(access_key)
+                    if not adapter:
+                        continue
+                    if n.panel_type == PanelType.wg_dashboard:
+                        if access_key in wg_failed_access:
+                            continue
+                        if wg_usage_map_by_access.get(access_key, {}).get(str(s.remote_identifier or "").strip()) is None:
+                            direct_jobs[s.id] = (n.base_url, partial(adapter.get_used_bytes, s.remote_identifier))  # type: ignore[attr-defined]
+                        continue
+                    remote_snapshot = snapshots.get(panel_by_access.get(access_key, ""))
+                    if remote_snapshot is not None:
+                        if remote_identifier(s.remote_identifier) in remote_snapshot.entries:
+                            continue
+                        if remote_snapshot.complete and access_key in remote_list_untrusted_missing_access:
+                            direct_budget = int(remote_list_untrusted_direct_budget.get(access_key, 0))
+                            if direct_budget <= 0:
+                                direct_over_budget.add(s.id)
+                                continue
+                            remote_list_untrusted_direct_budget[access_key] = direct_budget - 1
+                    direct_jobs[s.id] = (n.base_url, partial(_fetch_direct_usage, adapter, s.remote_identifier))
+            direct_results = await run_bounded(direct_jobs, timeout=0) if direct_jobs else {}
+            stats.lap("remote_fallback")
 
             for u in users:
                 touched_reseller_ids.add(int(u.owner_reseller_id))
@@ -316,9 +560,8 @@ async def _sync_usage_async():
                         used = wg_usage_map_by_access.get(access_key, {}).get(str(s.remote_identifier or "").strip())
                         if used is None:
                             # Fallback for partial bulk misses (stale peer index / recent topology changes).
-                            try:
-                                used = await adapter.get_used_bytes(s.remote_identifier)
-                            except Exception as e:
+                            used = direct_results.get(s.id)
+                            if isinstance(used, BaseException):
                                 stats.remote_failures += 1
                                 if failure_log_budget > 0:
                                     logger.warning(
@@ -326,7 +569,7 @@ async def _sync_usage_async():
                                         u.id,
                                         s.node_id,
                                         s.remote_identifier,
-                                        str(e)[:220],
+                                        str(used)[:220],
                                     )
                                     failure_log_budget -= 1
                                 total_used += effective_used
@@ -343,13 +586,11 @@ async def _sync_usage_async():
                         stats.remote_success += 1
                         total_used += cumulative_used
                         continue
-                    bulk_result = remote_list_by_access.get(access_key)
-                    if bulk_result is not None:
-                        remote_items, remote_list_exhausted, _remote_total, _remote_scanned = bulk_result
-                        remote_id = remote_identifier(s.remote_identifier)
-                        remote_item = remote_items.get(remote_id)
+                    remote_snapshot = snapshots.get(panel_by_access.get(access_key, ""))
+                    if remote_snapshot is not None:
+                        remote_item = remote_snapshot.entries.get(remote_identifier(s.remote_identifier))
                         if remote_item is not None:
-                            cumulative_used = _apply_remote_usage(s, remote_item.used_bytes or 0)
+                            cumulative_used = _apply_remote_usage(s, remote_item.used_bytes)
                             s.last_sync_at = now
                             if remote_item.direct_sub_url:
                                 s.panel_sub_url_cached = remote_item.direct_sub_url
@@ -360,21 +601,15 @@ async def _sync_usage_async():
                             stats.remote_success += 1
                             total_used += cumulative_used
                             continue
-                        if remote_list_exhausted and access_key in remote_list_untrusted_missing_access:
-                            direct_budget = int(remote_list_untrusted_direct_budget.get(access_key, 0))
-                            if direct_budget <= 0:
-                                stats.remote_skipped += 1
-                                total_used += effective_used
-                                continue
-                            remote_list_untrusted_direct_budget[access_key] = direct_budget - 1
+                        if s.id in direct_over_budget:
+                            stats.remote_skipped += 1
+                            total_used += effective_used
+                            continue
                     try:
-                        remote_status = None
-                        if hasattr(adapter, "get_user_snapshot"):
-                            snapshot = await adapter.get_user_snapshot(s.remote_identifier)  # type: ignore[attr-defined]
-                            used = snapshot.used_bytes
-                            remote_status = snapshot.status
-                        else:
-                            used = await adapter.get_used_bytes(s.remote_identifier)
+                        result = direct_results[s.id]
+                        if isinstance(result, BaseException):
+                            raise result
+                        used, remote_status = result
                         if used is None:
                             stats.remote_skipped += 1
                             total_used += effective_used
@@ -415,10 +650,7 @@ async def _sync_usage_async():
 
                         missing_subs += 1
                         missing_sub_ids.add(s.id)
-                        try:
-                            await db.delete(s)
-                        except Exception:
-                            stats.errors += 1
+                        deleted_sub_ids.add(s.id)
                         if failure_log_budget > 0:
                             logger.info(
                                 "sync_usage remote user missing confirmed user_id=%s node_id=%s remote_identifier=%s confirmations=%s",
@@ -446,6 +678,7 @@ async def _sync_usage_async():
                 if u_subs and missing_subs >= len(u_subs):
                     meta = u.meta if isinstance(u.meta, dict) else {}
                     u.status = UserStatus.deleted
+                    status_changed_tokens.append(u.master_sub_token)
                     u.meta = {
                         **meta,
                         "remote_deleted_at": now.isoformat(),
@@ -487,6 +720,7 @@ async def _sync_usage_async():
                         continue
 
                     u.status = UserStatus.disabled
+                    status_changed_tokens.append(u.master_sub_token)
                     stats.affected_users += 1
                     for s in enforce_subs:
                         if s.id in missing_sub_ids:
@@ -496,22 +730,55 @@ async def _sync_usage_async():
                             continue
                         try:
                             access_key = ("allocation", int(s.allocation_id)) if s.allocation_id and int(s.allocation_id) in allocations else ("node", int(s.node_id))
-                            adapter = adapters.get(access_key) or await get_adapter_for_subaccount(db, s, n, u)
-                            await enforce_volume_exhausted(n.panel_type, adapter, s.remote_identifier)
-                            stats.remote_actions += 1
+                            adapter = adapters.get(access_key)
+                            if adapter is None:
+                                if fallback_resolver is None:
+                                    fallback_resolver = await load_adapter_resolver(db, subs, users=users, node_map=nodes)
+                                adapter = fallback_resolver.adapter_for(s, n)
                         except Exception:
                             stats.remote_failures += 1
                             continue
-
-            await db.commit()
+                        exhausted.setdefault(id(adapter), (n, adapter, []))[2].append(s.remote_identifier)
+            stats.lap("apply")
+
+            if exhausted:
+                results = await run_bounded(
+                    {
+                        key: (n.base_url, partial(enforce_volume_exhausted_many, n.panel_type, adapter, rids))
+                        for key, (n, adapter, rids) in exhausted.items()
+                    },
+                    timeout=0,
+                )
+                for key, result in results.items():
+                    rids = exhausted[key][2]
+                    failed = len(rids) if isinstance(result, BaseException) else len(result)
+                    stats.remote_actions += len(rids) - failed
+                    stats.remote_failures += failed
+            stats.lap("enforce")
+
+            await _write_back_batch(
+                db,
+                users,
+                subs,
+                user_before=user_before,
+                sub_before=sub_before,
+                deleted_sub_ids=deleted_sub_ids,
+                now=now,
+                stats=stats,
+            )
+            if status_changed_tokens:
+                await invalidate_subscription_cache(*status_changed_tokens)
+            stats.lap("commit")
             try:
                 await refresh_daily_metrics_for_resellers(db, touched_reseller_ids, metric_day=now.date(), now=now)
                 await db.commit()
             except Exception as e:
                 await db.rollback()
                 logger.warning("sync_usage daily metrics refresh failed reseller_count=%s err=%s", len(touched_reseller_ids), str(e)[:220])
+            stats.lap("metrics_refresh")
             last_id = next_last_id
             if len(users) < batch_size:
                 break
 
-        logger.info("sync_usage stats=%s", stats)
+        logger.info("sync_usage stats=%s wg_peer_index=%s", stats, peer_index_stats())
+    return stats
@@ -0,0 +1,19 @@
+# Loaded automatically by gunicorn from the working directory.
+# Keeps the Prometheus multiprocess directory in step with the worker processes.
+import os
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "").strip()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    from app.core.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -207,7 +207,8 @@ ensure_runtime_env_defaults() {
   env_set_if_missing "AUTH_RATE_LIMIT_ATTEMPTS" "10"
   env_set_if_missing "AUTH_RATE_LIMIT_IP_ATTEMPTS" "100"
   env_set_if_missing "USAGE_SYNC_SECONDS" "180"
-  env_set_if_missing "EXPIRY_SYNC_SECONDS" "120"
+  env_set_if_missing "EXPIRY_SYNC_SECONDS" "600"
+  env_set_if_missing "EXPIRY_SCHEDULER_SECONDS" "5"
   env_set_if_missing "USAGE_SYNC_BATCH_SIZE" "5000"
   env_set_if_missing "USAGE_SYNC_REMOTE_LIST_PAGE_SIZE" "1000"
   env_set_if_missing "USAGE_SYNC_REMOTE_LIST_MAX_PAGES" "200"
@@ -218,7 +219,7 @@ ensure_runtime_env_defaults() {
   env_set_if_missing "NEXT_PUBLIC_API_BASE" "/api"
 
   env_set_if_legacy_default "USAGE_SYNC_SECONDS" "180" "60"
-  env_set_if_legacy_default "EXPIRY_SYNC_SECONDS" "120" "60"
+  env_set_if_legacy_default "EXPIRY_SYNC_SECONDS" "600" "60" "120"
   env_set_if_legacy_default "USAGE_SYNC_BATCH_SIZE" "5000" "2000"
   env_set_if_legacy_default "EXPIRY_SYNC_BATCH_SIZE" "1000" "500"
   env_set_if_legacy_default "HTTP_TIMEOUT_SECONDS" "60" "15" "20" "45"
@@ -699,7 +700,7 @@ validate_env_file() {
   file="$(env_file)"
   local errors=0
   local key value
-  for key in USAGE_SYNC_SECONDS EXPIRY_SYNC_SECONDS USAGE_SYNC_BATCH_SIZE USAGE_SYNC_REMOTE_LIST_PAGE_SIZE USAGE_SYNC_REMOTE_LIST_MAX_PAGES USAGE_SYNC_REMOTE_MISSING_CONFIRMATIONS USAGE_SYNC_REMOTE_MISSING_MIN_HOURS EXPIRY_SYNC_BATCH_SIZE HTTP_TIMEOUT_SECONDS; do
+  for key in USAGE_SYNC_SECONDS EXPIRY_SYNC_SECONDS EXPIRY_SCHEDULER_SECONDS USAGE_SYNC_BATCH_SIZE USAGE_SYNC_REMOTE_LIST_PAGE_SIZE USAGE_SYNC_REMOTE_LIST_MAX_PAGES USAGE_SYNC_REMOTE_MISSING_CONFIRMATIONS USAGE_SYNC_REMOTE_MISSING_MIN_HOURS EXPIRY_SYNC_BATCH_SIZE HTTP_TIMEOUT_SECONDS; do
     value="$(env_get "${key}" "")"
     if [ -n "${value}" ] && ! [[ "${value}" =~ ^[0-9]+$ ]]; then
       fail "${key} must be a positive integer. Current value: ${value}"
@@ -146,7 +146,8 @@ ensure_kv "AUTH_RATE_LIMIT_ATTEMPTS" "10"
 ensure_kv "AUTH_RATE_LIMIT_IP_ATTEMPTS" "100"
 ensure_kv "REDIS_URL" "redis://redis:6379/0"
 ensure_kv "USAGE_SYNC_SECONDS" "180"
-ensure_kv "EXPIRY_SYNC_SECONDS" "120"
+ensure_kv "EXPIRY_SYNC_SECONDS" "600"
+ensure_kv "EXPIRY_SCHEDULER_SECONDS" "5"
 ensure_kv "USAGE_SYNC_BATCH_SIZE" "5000"
 ensure_kv "USAGE_SYNC_REMOTE_LIST_PAGE_SIZE" "1000"
 ensure_kv "USAGE_SYNC_REMOTE_LIST_MAX_PAGES" "200"
@@ -170,7 +170,8 @@ ensure_kv_if_missing "AUTH_RATE_LIMIT_WINDOW_SECONDS" "300"
 ensure_kv_if_missing "AUTH_RATE_LIMIT_ATTEMPTS" "10"
 ensure_kv_if_missing "AUTH_RATE_LIMIT_IP_ATTEMPTS" "100"
 ensure_kv_if_missing "USAGE_SYNC_SECONDS" "180"
-ensure_kv_if_missing "EXPIRY_SYNC_SECONDS" "120"
+ensure_kv_if_missing "EXPIRY_SYNC_SECONDS" "600"
+ensure_kv_if_missing "EXPIRY_SCHEDULER_SECONDS" "5"
 ensure_kv_if_missing "USAGE_SYNC_BATCH_SIZE" "5000"
 ensure_kv_if_missing "USAGE_SYNC_REMOTE_LIST_PAGE_SIZE" "1000"
 ensure_kv_if_missing "USAGE_SYNC_REMOTE_LIST_MAX_PAGES" "200"
@@ -181,7 +182,7 @@ ensure_kv_if_missing "HTTP_TIMEOUT_SECONDS" "60"
 ensure_kv_if_missing "NEXT_PUBLIC_API_BASE" "/api"
 
 upgrade_kv_if_legacy_default "USAGE_SYNC_SECONDS" "180" "60"
-upgrade_kv_if_legacy_default "EXPIRY_SYNC_SECONDS" "120" "60"
+upgrade_kv_if_legacy_default "EXPIRY_SYNC_SECONDS" "600" "60" "120"
 upgrade_kv_if_legacy_default "USAGE_SYNC_BATCH_SIZE" "5000" "2000"
 upgrade_kv_if_legacy_default "EXPIRY_SYNC_BATCH_SIZE" "1000" "500"
 upgrade_kv_if_legacy_default "HTTP_TIMEOUT_SECONDS" "60" "15" "20" "45"
@@ -275,3 +276,4 @@ echo "USAGE_SYNC_REMOTE_MISSING_MIN_HOURS=$(grep -E '^USAGE_SYNC_REMOTE_MISSING_
 echo "EXPIRY_SYNC_BATCH_SIZE=$(grep -E '^EXPIRY_SYNC_BATCH_SIZE=' .env | cut -d= -f2-)"
 echo "HTTP_TIMEOUT_SECONDS=$(grep -E '^HTTP_TIMEOUT_SECONDS=' .env | cut -d= -f2-)"
 echo "EXPIRY_SYNC_SECONDS=$(grep -E '^EXPIRY_SYNC_SECONDS=' .env | cut -d= -f2-)"
+echo "EXPIRY_SCHEDULER_SECONDS=$(grep -E '^EXPIRY_SCHEDULER_SECONDS=' .env | cut -d= -f2-)"